@@ -1,23 +1,105 @@
 # --- Imports ---
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+
+# --- Logging first, so messages emitted while the core modules load are formatted too ---
+from core.observability import (
+    configure_logging, mark_process_exited, render_metrics, register_stats_source, REQUESTS_TOTAL, REQUEST_SECONDS
+)
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # --- Import functions from our core modules ---
-from core.rag_service import retrieve_context, format_context_for_llm
-from core.llm_service import get_ollama_response, analyze_query_intent
+from core.rag_service import (
+    retrieve_context, format_context_for_llm, get_query_vocabulary, semantic_search_async, get_store_version,
+    get_candidate_count, upsert_candidates, delete_candidates, CandidateStoreError, RAG_EXECUTOR
+)
+from core.llm_service import (
+    get_ollama_response, stream_ollama_response, analyze_query_intent, close_http_client, start_llm_pool,
+    get_llm_pool_stats
+)
+from core.llm_pool import LLMOverloaded
+from core.prompt_builder import build_rag_prompt, history_window
+from core.answer_cache import SemanticAnswerCache
+from core.intent_rules import is_follow_up, merge_criteria
+from core.sessions import create_session_store
+from core.startup import STARTUP, STARTUP_RETRY_AFTER
+
+# How often (seconds) to check whether the browser is still connected while waiting on the LLM
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+
+# Final answers reused for semantically equivalent queries over the same candidates
+ANSWER_CACHE = SemanticAnswerCache()
+register_stats_source("answer", ANSWER_CACHE.stats)
+
+# Conversation state (previous criteria, candidates and turns) by ChatRequest.session_id;
+# kept in the embedding service when there are several API workers
+SESSIONS = create_session_store()
+register_stats_source("sessions", SESSIONS.stats)
 
 
 # --- Pydantic Model for Request Body ---
 class ChatRequest(BaseModel):
     message: str
+    # When true, the reply is streamed back as NDJSON chunks instead of one JSON body
+    stream: bool = False
+    # Conversation to continue; replies return the id to send with the next message
+    session_id: str | None = Field(default=None, max_length=128)
+
+
+class CandidateRecord(BaseModel):
+    # Extra fields are kept with the record (and returned in chat context copies)
+    model_config = ConfigDict(extra="allow")
+    candidate_id: str = Field(min_length=1)
+    candidate_name: str
+    skills: list[str] = []
+    experience_years: int | float | None = None
+    summary: str = ""
+
+
+class CandidateUpsertRequest(BaseModel):
+    candidates: list[CandidateRecord]
+
+
+class CandidateDeleteRequest(BaseModel):
+    candidate_ids: list[str]
+
+
+class ClientDisconnected(Exception):
+    """Raised when the browser goes away while we are still waiting on the LLM."""
+
+
+# --- Application Lifespan (shared resources) ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Health-check the Ollama endpoints in the background
+    start_llm_pool()
+    # Load the embedding model / candidates and preload Ollama in the background;
+    # the server accepts connections right away and /readyz reports when it can answer
+    STARTUP.start()
+    yield
+    await STARTUP.stop()
+    # Close the pooled Ollama connections on shutdown
+    await close_http_client()
+    mark_process_exited()
 
 
 # --- Create FastAPI App Instance ---
 app = FastAPI(
     title="Resume Insight Assistant API",
     description="API for the HR Chatbot using Llama 3.2",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # --- CORS Configuration ---
@@ -39,6 +121,86 @@ app.add_middleware(
 # --- End CORS Configuration ---
 
 
+# --- Helpers ---
+
+async def run_until_disconnect(request: Request, coro):
+    """
+    Awaits `coro` as a task, polling the client connection in between.
+    If the browser disconnects first, the task (and its in-flight Ollama request) is cancelled.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected. Cancelling pending LLM call.")
+                task.cancel()
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def ndjson_line(obj: dict) -> str:
+    """Serializes one NDJSON event for the streaming chat response."""
+    return json.dumps(obj) + "\n"
+
+
+async def stream_reply_events(chunks, cached: bool = False, usage: dict | None = None,
+                              session_id: str | None = None):
+    """
+    Wraps an async iterator of text chunks as NDJSON events:
+    {"token": "..."} per chunk, then a final {"done": true, "cached": ...}
+    (plus the chat "session_id" and the prompt/completion token "usage" when the reply came from the LLM).
+    """
+    async for chunk in chunks:
+        yield ndjson_line({"token": chunk})
+    done = {"done": True, "cached": cached}
+    if session_id is not None:
+        done["session_id"] = session_id
+    if usage is not None:
+        done["usage"] = usage
+    yield ndjson_line(done)
+
+
+async def prepend_chunk(first: str, chunks):
+    """Async iterator yielding `first`, then the rest of `chunks`."""
+    if first:
+        yield first
+    async for chunk in chunks:
+        yield chunk
+
+
+async def single_chunk(text: str):
+    """Async iterator yielding one chunk, for replies that never hit the LLM."""
+    yield text
+
+
+async def cache_when_complete(chunks, on_complete):
+    """
+    Passes chunks through unchanged and awaits `on_complete(full_text)` once the stream
+    has finished normally (not if the client disconnected mid-way).
+    """
+    parts = []
+    async for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    await on_complete("".join(parts))
+
+
+def streaming_reply(chunks, cached: bool = False, usage: dict | None = None,
+                    session_id: str | None = None) -> StreamingResponse:
+    """Builds the NDJSON StreamingResponse used when ChatRequest.stream is set."""
+    return StreamingResponse(
+        stream_reply_events(chunks, cached=cached, usage=usage, session_id=session_id),
+        media_type="application/x-ndjson",
+        # Stop proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # --- API Endpoints ---
 
 @app.get("/")
@@ -49,87 +211,235 @@ async def read_root():
     return {"message": "Welcome to the Resume Insight Assistant Backend!"}
 
 
+@app.get("/healthz")
+async def healthz_endpoint():
+    """
+    Liveness probe: 200 while the process is up (also during warmup), 503 only if startup
+    failed for good (e.g. the embedding model can't be loaded), so the orchestrator restarts it.
+    """
+    status = STARTUP.status()
+    if STARTUP.failed:
+        return JSONResponse(status_code=503, content={"status": "failed", **status})
+    return {"status": "ok", **status}
+
+
+@app.get("/readyz")
+async def readyz_endpoint():
+    """
+    Readiness probe: 200 once candidates are loaded and the retrieval path (and, if enabled,
+    the Ollama model preload) has been warmed up; 503 with the load progress until then.
+    """
+    status = STARTUP.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status, headers={"Retry-After": str(STARTUP_RETRY_AFTER)})
+    return status
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, request/LLM counters,
+    Ollama token counts and cache hit/miss statistics.
+    With run_server.py --workers N the numbers cover all workers and the embedding service.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/api/llm/status")
+async def llm_status_endpoint():
+    """
+    Routing state of the Ollama endpoint pool: per-endpoint outstanding requests,
+    health / ejection and the admission queue depth.
+    """
+    return get_llm_pool_stats()
+
+
+@app.get("/api/candidates")
+async def candidates_status_endpoint():
+    """Size and version of the candidate set currently served."""
+    return {"total": get_candidate_count(), "store_version": get_store_version()}
+
+
+@app.post("/api/candidates")
+async def upsert_candidates_endpoint(request: CandidateUpsertRequest):
+    """
+    Bulk insert/replace candidates by candidate_id. Only new or changed candidates are re-encoded;
+    chat requests keep using the previous candidate set until the new one is fully built.
+    Returns the inserted/updated/unchanged/encoded counts and the new store_version.
+    Every call that changes something writes a full new store generation and rebuilds the
+    vector index (O(total candidates)), so send changes in batches rather than one per call.
+    """
+    records = [c.model_dump(exclude_none=True) for c in request.candidates]
+    return await _update_candidates(upsert_candidates, records)
+
+
+@app.post("/api/candidates/delete")
+async def delete_candidates_endpoint(request: CandidateDeleteRequest):
+    """Bulk delete candidates by id. Returns the deleted/missing counts and the new store_version."""
+    return await _update_candidates(delete_candidates, request.candidate_ids)
+
+
+async def _update_candidates(update_fn, payload):
+    # Encoding and writing the store block; keep them off the event loop and the retrieval workers
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, update_fn, payload)
+    except CandidateStoreError as e:
+        headers = None if STARTUP.ready else {"Retry-After": str(STARTUP_RETRY_AFTER)}
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
+
+
 @app.post("/api/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
     """
-    Endpoint to receive user messages, analyze intent/criteria, retrieve context,
+    Endpoint to receive user messages, analyze intent/criteria (concurrently with semantic search), retrieve context,
     (potentially bypass LLM if no context), construct prompt,
     get an LLM response, and return it.
+    LLM calls are cancelled if the client disconnects before they finish.
+    With "stream": true the reply is sent as NDJSON ({"token": ...} lines, then {"done": true}).
+    Replies carry "cached": true when they were served from the semantic answer cache.
+    Replies carry a "session_id"; sending it back with the next message continues the conversation:
+    follow-ups ("which of them know AWS?") refine the previous answer's candidates and criteria,
+    and the recent turns are sent to the LLM (within PROMPT_HISTORY_TOKEN_BUDGET).
+    An unknown or expired session_id starts a new session, whose new id is returned.
+    Answers 503 (with Retry-After) until startup warmup has finished, instead of replying
+    that no candidates match while they are still loading.
     """
+    if not STARTUP.ready:
+        REQUESTS_TOTAL.labels(outcome="not_ready").inc()
+        stage = STARTUP.status()["embeddings"]["stage"]
+        raise HTTPException(status_code=503, detail=f"The service is not ready yet (startup stage: {stage}).",
+                            headers={"Retry-After": str(STARTUP_RETRY_AFTER)})
+    start = time.perf_counter()
+    try:
+        return await _handle_chat(request, http_request)
+    except ClientDisconnected:
+        REQUESTS_TOTAL.labels(outcome="disconnected").inc()
+        # Nobody is listening any more; 499 mirrors nginx's "client closed request"
+        return Response(status_code=499)
+    except LLMOverloaded as e:
+        # Fail fast instead of queueing without bound; clients back off for Retry-After seconds
+        REQUESTS_TOTAL.labels(outcome="rejected").inc()
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception:
+        REQUESTS_TOTAL.labels(outcome="error").inc()
+        logger.exception("Unhandled error while answering chat request")
+        raise
+    finally:
+        # For streamed replies this covers everything up to the first byte of the response
+        REQUEST_SECONDS.labels(mode="stream" if request.stream else "json").observe(time.perf_counter() - start)
+
+
+async def _handle_chat(request: ChatRequest, http_request: Request):
     user_message = request.message
-    print(f"\nReceived user message via API: '{user_message}'")
+    logger.debug("Received user message via API: %r", user_message)
+
+    loop = asyncio.get_running_loop()
+    # Session ops can be a socket round trip to the embedding service (multi-worker mode): keep them off the loop
+    session = await loop.run_in_executor(None, SESSIONS.get_or_create, request.session_id)
+    session_id = session.session_id
+    # A follow-up refines the candidates of the session's previous answer instead of searching from scratch
+    previous = session.previous_candidates() if is_follow_up(user_message) else None
 
-    # --- Analyze the query first ---
-    analyzed_query = analyze_query_intent(user_message)
-    print(f"--- Analyzed Query Results: {analyzed_query} ---")
+    # --- Stage 1 (concurrent): analyze the query while it is encoded (micro-batched) and candidates are scored ---
+    # Read before retrieval: if candidates change mid-request, the answer is cached under the old version and dropped
+    store_version = get_store_version()
+    known_skills, known_names = get_query_vocabulary()
+    analysis_stage = analyze_query_intent(
+        user_message, known_skills=known_skills, known_names=known_names, store_version=store_version
+    )
+    semantic_stage = semantic_search_async(user_message)
+    analyzed_query, (query_embedding, semantic_hits) = await run_until_disconnect(
+        http_request, asyncio.gather(analysis_stage, semantic_stage)
+    )
+    logger.debug("Analyzed query results: %s", analyzed_query)
+    if previous is not None:
+        # Don't mutate the analysis: it may be shared through the intent cache
+        criteria = merge_criteria(session.criteria, (analyzed_query or {}).get("criteria"))
+        analyzed_query = {**(analyzed_query or {}), "criteria": criteria}
+        logger.debug("Follow-up in session %s: %d previous candidates, criteria %s",
+                      session_id, len(previous[0]), criteria)
 
-    # 1. Retrieve Context using rag_service
-    relevant_candidates = retrieve_context(query=user_message, analyzed_query=analyzed_query)
+    # --- Stage 2: apply the analysis criteria to the semantic result (filter / re-rank) ---
+    relevant_candidates = await loop.run_in_executor(
+        RAG_EXECUTOR, retrieve_context, user_message, analyzed_query, query_embedding, semantic_hits, previous
+    )
 
     # --- Step 12 Check: Check if context was found ---
     if not relevant_candidates:
-        print("--- No relevant context found by retrieve_context. Bypassing LLM. ---")
+        logger.debug("No relevant context found by retrieve_context. Bypassing LLM.")
+        REQUESTS_TOTAL.labels(outcome="no_context").inc()
         not_found_message = "I couldn't find any candidate information relevant to your query in the current dataset. Could you please try rephrasing?"
-        return {"reply": not_found_message}
+        # The session keeps its previous candidates, so the user can rephrase the follow-up
+        session.add_turn(user_message, not_found_message)
+        await loop.run_in_executor(None, SESSIONS.save, session)
+        if request.stream:
+            return streaming_reply(single_chunk(not_found_message), session_id=session_id)
+        return {"reply": not_found_message, "cached": False, "session_id": session_id}
     else:
-        print(f"--- Found {len(relevant_candidates)} relevant candidate(s). Proceeding with LLM. ---")
-
-        # 2. Format Context for LLM using rag_service
-        formatted_context = format_context_for_llm(relevant_candidates)
-        print(f"--- Formatted Context for LLM ---")
-        print(formatted_context)
-        print(f"--- End Formatted Context ---")
-
-        # --- Prompt Tuning Iteration 2 (Added Few-Shot Example) ---
-        # 3. Construct the Prompt with refined instructions and an example
-        prompt = f"""You are an HR assistant chatbot. Your task is to answer the user's question based *strictly* and *only* on the provided context about candidates.
-
-        **Context:**
-        ---
-        {formatted_context}
-        ---
+        logger.debug("Found %d relevant candidate(s). Proceeding with LLM.", len(relevant_candidates))
+        criteria = (analyzed_query or {}).get("criteria") or {}
+        # Earlier turns only matter to a follow-up; standalone questions keep a cacheable prompt
+        history = history_window(session.history()) if previous is not None else []
 
-        **User Question:** {user_message}
+        async def remember(reply: str):
+            if reply and not reply.startswith("Error:"):
+                # "them" in the next question refers to the candidates this answer was based on
+                session.remember_candidates(criteria, relevant_candidates, store_version)
+                session.add_turn(user_message, reply)
+                await loop.run_in_executor(None, SESSIONS.save, session)
+                # The answer depends on the history it was given; only standalone answers are reusable
+                if not history:
+                    ANSWER_CACHE.store(query_embedding, candidate_ids, store_version, reply)
 
-        **Instructions:**
-        1. Examine the provided 'Context' carefully.
-        2. Answer the 'User Question' using *only* information found within the 'Context'. **List *all* relevant candidates or details found.**
-        3. Do not add any information that is not explicitly stated in the 'Context'. Do not make assumptions or use external knowledge.
-        4. If the 'Context' does not contain the information needed to answer the question, you MUST respond with "I cannot answer the question based on the provided candidate information." or a very similar phrase. Do not attempt to answer anyway.
-        # Instruction 5 (Conciseness) removed previously
+        # --- Semantic answer cache: same meaning, same candidates, same store version ---
+        candidate_ids = [c['candidate_id'] for c in relevant_candidates]
+        cached_reply = ANSWER_CACHE.lookup(query_embedding, candidate_ids, store_version) if not history else None
+        if cached_reply is not None:
+            REQUESTS_TOTAL.labels(outcome="cached").inc()
+            await remember(cached_reply)
+            if request.stream:
+                return streaming_reply(single_chunk(cached_reply), cached=True, session_id=session_id)
+            return {"reply": cached_reply, "cached": True, "session_id": session_id}
 
-        **Example Interaction:**
-        --- Example Start ---
-        Context:
-        - Name: Frank
-          Skills: Java, Spring
-        - Name: Grace
-          Skills: Java, Kubernetes
+        # 2. Format a compact, token-budgeted context (query skills listed first)
+        formatted_context = format_context_for_llm(relevant_candidates, priority_skills=criteria.get("skills") or ())
+        logger.debug("Formatted context for LLM:\n%s", formatted_context)
 
-        User Question: Which candidates know Java?
-
-        Answer: Based on the provided context, the candidates who know Java are Frank and Grace.
-        --- Example End ---
-
-        **Answer:**""" # LLM generation starts here
-        # --- End Prompt Tuning Iteration 2 ---
-
-        print(f"--- Constructed Tuned Prompt (Iteration 2 - Few Shot) ---")
-        # print(prompt) # Uncomment carefully for debugging prompt structure if needed
-        print(f"--- End Constructed Tuned Prompt ---")
+        # 3. Build the prompt: fixed system prompt (KV-cache-reusable prefix), history window, context and question
+        prompt = build_rag_prompt(user_message, formatted_context, history)
+        usage = {"prompt_tokens_estimate": prompt.tokens["total"]}
+        logger.debug("Constructed prompt, ~%d tokens (%s)", prompt.tokens["total"], prompt.tokens)
 
         # 4. Call the LLM Service
-        bot_response = get_ollama_response(prompt=prompt, model="llama3.2:3b")
+        if request.stream:
+            # The first chunk is awaited here so that admission errors (LLMOverloaded) still become
+            # a 429/503 instead of a broken 200 stream. The rest is forwarded as Ollama produces it;
+            # Starlette cancels the generator (and the upstream request) if the client disconnects.
+            logger.debug("Streaming LLM response to client")
+            chunks = stream_ollama_response(prompt=prompt.user, model="llama3.2:3b", system=prompt.system,
+                                            history=prompt.history, usage=usage)
+            first_chunk = await run_until_disconnect(http_request, anext(chunks, ""))
+            REQUESTS_TOTAL.labels(outcome="answered").inc()
+            return streaming_reply(cache_when_complete(prepend_chunk(first_chunk, chunks), remember), usage=usage,
+                                   session_id=session_id)
+
+        bot_response = await run_until_disconnect(
+            http_request, get_ollama_response(prompt=prompt.user, model="llama3.2:3b", system=prompt.system,
+                                              history=prompt.history, usage=usage)
+        )
+        REQUESTS_TOTAL.labels(outcome="answered").inc()
 
-        print(f"Sending back LLM response: '{bot_response}'")
+        logger.debug("Sending back LLM response: %r", bot_response)
+        await remember(bot_response)
 
         # 5. Return the LLM's Response
-        return {"reply": bot_response}
+        return {"reply": bot_response, "cached": False, "usage": usage, "session_id": session_id}
 
 
 # --- Optional: Run with Uvicorn directly ---
 if __name__ == "__main__":
     import uvicorn
-    print("--- Starting FastAPI server using Uvicorn (directly from script) ---")
-    print("--- For development, prefer running: uvicorn app:app --reload --port 8000 --host 0.0.0.0 ---")
+    logger.info("Starting FastAPI server using Uvicorn (directly from script)")
+    logger.info("For development, prefer running: uvicorn app:app --reload --port 8000 --host 0.0.0.0")
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
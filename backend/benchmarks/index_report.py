@@ -0,0 +1,104 @@
+"""
+Recall-vs-latency report for the vector index backends in core/vector_index.py.
+
+Builds each backend over the same synthetic normalized embeddings, runs the same queries,
+and compares results against the exact (brute force) top-k.
+
+Usage (from the backend/ directory):
+    python -m benchmarks.index_report --candidates 100000 --queries 200 --k 3
+    python -m benchmarks.index_report --candidates 1000000 --backends exact,ivf --nprobe 4,8,16
+"""
+# --- Imports ---
+import argparse
+import time
+
+import numpy as np
+
+from core.vector_index import ExactIndex, HNSWIndex, IVFIndex
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, closer to real resume embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def synthetic_queries(matrix: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Queries near existing rows (a noisy copy of a random candidate)."""
+    rng = np.random.default_rng(seed)
+    queries = matrix[rng.integers(0, len(matrix), count)] + 0.3 * rng.standard_normal((count, matrix.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def measure(index, queries: np.ndarray, k: int, truth: list[set]) -> dict:
+    """Runs every query and returns latency percentiles (ms) and mean recall@k."""
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        rows, _ = index.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(expected.intersection(rows.tolist())) / max(1, len(expected)))
+    latencies = np.array(latencies)
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "recall": float(np.mean(recalls)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384, help="all-MiniLM-L6-v2 produces 384-d vectors")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--backends", default="exact,ivf,hnsw")
+    parser.add_argument("--nprobe", default="4,8,16,32", help="IVF lists probed per query (comma separated)")
+    parser.add_argument("--ef", default="32,64,128", help="HNSW ef_search values (comma separated)")
+    args = parser.parse_args()
+
+    print(f"Generating {args.candidates} x {args.dim} synthetic embeddings...")
+    matrix = synthetic_embeddings(args.candidates, args.dim, args.clusters)
+    queries = synthetic_queries(matrix, args.queries)
+
+    exact = ExactIndex(matrix)
+    truth = [set(exact.search(q, args.k)[0].tolist()) for q in queries]
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+
+    results = []
+    if "exact" in backends:
+        results.append(("exact", "-", 0.0, measure(exact, queries, args.k, truth)))
+
+    if "ivf" in backends:
+        start = time.perf_counter()
+        ivf = IVFIndex(matrix)
+        build_s = time.perf_counter() - start
+        for nprobe in [int(p) for p in args.nprobe.split(",")]:
+            ivf.nprobe = nprobe
+            results.append(("ivf", f"nlist={ivf.nlist} nprobe={nprobe}", build_s, measure(ivf, queries, args.k, truth)))
+
+    if "hnsw" in backends:
+        try:
+            start = time.perf_counter()
+            hnsw = HNSWIndex(matrix)
+            build_s = time.perf_counter() - start
+            for ef in [int(e) for e in args.ef.split(",")]:
+                hnsw.ef_search = ef
+                results.append(("hnsw", f"ef={ef}", build_s, measure(hnsw, queries, args.k, truth)))
+        except ImportError:
+            print("hnswlib is not installed; skipping the hnsw backend (pip install hnswlib).")
+
+    print(f"\nRecall@{args.k} vs latency over {args.candidates} candidates, {args.queries} queries\n")
+    print(f"{'backend':<8} {'params':<26} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'recall':>7}")
+    for backend, params, build_s, r in results:
+        print(f"{backend:<8} {params:<26} {build_s:>8.2f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['recall']:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
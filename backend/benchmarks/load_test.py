@@ -0,0 +1,381 @@
+"""
+End-to-end load test for /api/chat.
+
+By default it starts everything locally:
+1. a synthetic candidate pool (see benchmarks/synthetic_pool.py)
+2. the Ollama stub (see benchmarks/stub_ollama.py) with the given timing profile
+3. the FastAPI app under uvicorn, pointed at both
+then drives /api/chat at the given concurrency and reports latency percentiles
+(and time to first token when streaming), requests per second, request outcomes and
+the per-stage breakdown scraped from /metrics before and after the run.
+
+Pass --url to load an already running backend instead (nothing is started).
+
+Usage (from the backend/ directory):
+    python -m benchmarks.load_test --candidates 10000 --concurrency 16 --requests 500
+    python -m benchmarks.load_test --candidates 100000 --concurrency 32 --duration 60 --stream --ttft 0.5
+    python -m benchmarks.load_test --app-env VECTOR_INDEX_BACKEND=ivf --save-baseline /tmp/ivf.json
+    python -m benchmarks.load_test --url http://localhost:8000 --concurrency 8 --requests 200
+    python -m benchmarks.load_test --endpoints 3 --parallel 2 --concurrency 64 \
+        --app-env OLLAMA_ENDPOINT_CONCURRENCY=2 --app-env LLM_QUEUE_SIZE=16
+
+--endpoints N starts N stub instances and passes them to the app as OLLAMA_ENDPOINTS, to exercise
+the endpoint pool's routing and admission control (rejections show up as 429/503 status codes).
+
+With --workers > 1 the backend is started through run_server.py (shared embedding service,
+/metrics aggregated over all workers).
+Exits with status 1 when --baseline is given and latency or throughput regressed beyond --threshold.
+"""
+# --- Imports ---
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.results import compare_to_baseline, environment_info, load_results, save_results, summarize_latencies
+from benchmarks.synthetic_pool import FIRST_NAMES, LAST_NAMES, SKILLS, build_pool, pool_env
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERY_TEMPLATES = [
+    "Who knows {skill}?",
+    "Find candidates with {skill} and {skill2}",
+    "Which candidates have {years}+ years of experience with {skill}?",
+    "Show me {skill} developers with at least {years} years of experience",
+    "Tell me about {name}",
+    "Compare {name} and {name2}",
+    "Who would be a good fit for a backend role?",
+    "Any strong candidates for a data platform team?",
+]
+
+
+# --- Query mix ---
+def build_queries(count: int, seed: int = 0) -> list[str]:
+    """`count` distinct-ish user messages covering skill, experience, name and open-ended queries."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        skill, skill2 = rng.sample(SKILLS, 2)
+        queries.append(rng.choice(QUERY_TEMPLATES).format(
+            skill=skill, skill2=skill2, years=rng.randint(2, 12),
+            name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            name2=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        ))
+    return queries
+
+
+# --- Process management ---
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_process(args: list[str], env: dict, log_path: str) -> subprocess.Popen:
+    """Starts a child process in backend/ with output going to `log_path`."""
+    log = open(log_path, "w", encoding="utf-8")
+    return subprocess.Popen(args, cwd=BACKEND_DIR, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_process(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def wait_until_ready(url: str, timeout: float, process: subprocess.Popen | None = None, log_path: str = ""):
+    """Polls GET `url` until it answers 200 (startup loads the model and maps the pool)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit(f"Process serving {url} exited early; see {log_path}")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    sys.exit(f"Timed out after {timeout:.0f}s waiting for {url}; see {log_path}")
+
+
+# --- /metrics scraping ---
+def scrape_metrics(base_url: str) -> dict:
+    """Flattens the Prometheus exposition into {(sample name, sorted label items): value}."""
+    text = httpx.get(f"{base_url}/metrics", timeout=10).text
+    samples = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def metric_delta(before: dict, after: dict, name: str) -> dict:
+    """Per-label-set increase of a counter-like sample between two scrapes."""
+    return {labels: value - before.get((sample, labels), 0.0)
+            for (sample, labels), value in after.items() if sample == name}
+
+
+def histogram_quantile(q: float, buckets: list[tuple[float, float]]) -> float | None:
+    """Prometheus-style quantile estimate from cumulative (upper bound, count) buckets."""
+    buckets = sorted(buckets)
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+    rank = q * total
+    prev_bound, prev_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return prev_bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / max(count - prev_count, 1e-9)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def stage_breakdown(before: dict, after: dict) -> dict:
+    """Count, mean and estimated p95 (ms) per pipeline stage during the run."""
+    counts = metric_delta(before, after, "hr_chat_stage_seconds_count")
+    sums = metric_delta(before, after, "hr_chat_stage_seconds_sum")
+    buckets = metric_delta(before, after, "hr_chat_stage_seconds_bucket")
+    stages = {}
+    for labels, count in counts.items():
+        if count <= 0:
+            continue
+        stage = dict(labels)["stage"]
+        stage_buckets = [(float(dict(l)["le"]), c) for l, c in buckets.items() if dict(l).get("stage") == stage]
+        p95 = histogram_quantile(0.95, stage_buckets)
+        stages[stage] = {
+            "count": int(count),
+            "mean_ms": sums[labels] / count * 1000,
+            "p95_ms": p95 * 1000 if p95 is not None else None,
+        }
+    return dict(sorted(stages.items(), key=lambda item: -item[1]["mean_ms"]))
+
+
+def labelled_counts(before: dict, after: dict, name: str, *label_names: str) -> dict:
+    """Counter increases keyed by the given label values joined with '/' (e.g. "answer/ok")."""
+    counts = {}
+    for labels, value in metric_delta(before, after, name).items():
+        if value:
+            key = "/".join(dict(labels).get(label, "") for label in label_names)
+            counts[key] = counts.get(key, 0) + int(value)
+    return counts
+
+
+# --- Load driver ---
+async def send_chat(client: httpx.AsyncClient, message: str, stream: bool) -> dict:
+    """One /api/chat call; returns status, total latency, time to first token and cached flag."""
+    start = time.perf_counter()
+    result = {"status": None, "ttfb_ms": None, "cached": False}
+    try:
+        if stream:
+            async with client.stream("POST", "/api/chat", json={"message": message, "stream": True}) as response:
+                result["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    if result["ttfb_ms"] is None:
+                        result["ttfb_ms"] = (time.perf_counter() - start) * 1000
+                    event = json.loads(line)
+                    if event.get("done"):
+                        result["cached"] = bool(event.get("cached"))
+        else:
+            response = await client.post("/api/chat", json={"message": message})
+            result["status"] = response.status_code
+            if response.status_code == 200:
+                result["cached"] = bool(response.json().get("cached"))
+    except (httpx.HTTPError, json.JSONDecodeError) as e:
+        result["status"] = type(e).__name__
+    result["latency_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+async def drive(base_url: str, queries: list[str], concurrency: int, total_requests: int | None,
+                duration: float | None, stream: bool, timeout: float) -> tuple[list[dict], float]:
+    """Runs `concurrency` closed-loop clients until the request count or duration is reached."""
+    results = []
+    next_index = 0
+    deadline = time.monotonic() + duration if duration else None
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal next_index
+            while True:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                if total_requests is not None and next_index >= total_requests:
+                    return
+                message = queries[next_index % len(queries)]
+                next_index += 1
+                results.append(await send_chat(client, message, stream))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+# --- Reporting ---
+def print_report(report: dict):
+    run = report["run"]
+    print(f"\n{run['requests']} requests in {run['elapsed_s']:.1f}s at concurrency {run['concurrency']}: "
+          f"{run['rps']:.2f} req/s, {run['errors']} errors, {run['cached']} served from the answer cache")
+    print(f"Status codes: {run['status_codes']}")
+
+    print(f"\n{'':<14} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'max ms':>9}")
+    for name in ("latency", "ttfb"):
+        r = report.get(name) or {}
+        if r.get("count"):
+            print(f"{name:<14} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['mean_ms']:>9.1f} {r['max_ms']:>9.1f}")
+
+    if report["stages"]:
+        print(f"\n{'stage':<22} {'count':>7} {'mean ms':>9} {'~p95 ms':>9}")
+        for stage, r in report["stages"].items():
+            p95 = f"{r['p95_ms']:>9.1f}" if r["p95_ms"] is not None else f"{'-':>9}"
+            print(f"{stage:<22} {r['count']:>7} {r['mean_ms']:>9.1f} {p95}")
+    for title in ("outcomes", "query_analysis", "llm_calls", "llm_rejections", "llm_retries"):
+        if report.get(title):
+            print(f"\n{title}: {report[title]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="load an already running backend instead of starting one")
+    parser.add_argument("--candidates", type=int, default=10000, help="synthetic pool size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, help="total requests (default 200 unless --duration is set)")
+    parser.add_argument("--duration", type=float, help="seconds to run instead of a request count")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests sent first")
+    parser.add_argument("--stream", action="store_true", help="use NDJSON streaming replies")
+    parser.add_argument("--distinct-queries", type=int, default=200,
+                        help="size of the query mix (smaller values exercise the caches more)")
+    parser.add_argument("--timeout", type=float, default=180.0, help="per-request timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app process (repeatable)")
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    # Ollama stub timing profile
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--prompt-rate", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--parallel", type=int, default=0, help="stub concurrent generations (0 = unlimited)")
+    parser.add_argument("--endpoints", type=int, default=1, help="stub instances behind the app's endpoint pool")
+    # Results
+    parser.add_argument("--json-out", help="write the full report as JSON")
+    parser.add_argument("--baseline", help="report JSON to compare against")
+    parser.add_argument("--save-baseline", help="write this report as a new baseline JSON")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args()
+    if args.requests is None and args.duration is None:
+        args.requests = 200
+
+    processes = []
+    log_dir = tempfile.mkdtemp(prefix="hr-chat-load-")
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            directory = build_pool(args.candidates, seed=args.seed)
+            stub_ports = [free_port() for _ in range(args.endpoints)]
+            app_port = free_port()
+            stub_urls = [f"http://127.0.0.1:{port}" for port in stub_ports]
+            # One stub process per endpoint, so endpoints fail independently
+            for i, port in enumerate(stub_ports):
+                stub_log = os.path.join(log_dir, f"stub_ollama_{i}.log")
+                processes.append(start_process(
+                    [sys.executable, "-m", "benchmarks.stub_ollama", "--port", str(port),
+                     "--ttft", str(args.ttft), "--prompt-rate", str(args.prompt_rate),
+                     "--token-rate", str(args.token_rate), "--tokens", str(args.tokens), "--parallel", str(args.parallel)],
+                    {}, stub_log,
+                ))
+                wait_until_ready(f"{stub_urls[i]}/api/version", 30, processes[-1], stub_log)
+
+            app_env = {**pool_env(directory), "OLLAMA_ENDPOINT": stub_urls[0], "OLLAMA_ENDPOINTS": ",".join(stub_urls),
+                       "LOG_LEVEL": "WARNING"}
+            app_env.update(item.split("=", 1) for item in args.app_env)
+            app_log = os.path.join(log_dir, "app.log")
+            processes.append(start_process(
+                [sys.executable, "run_server.py", "--host", "127.0.0.1", "--port", str(app_port),
+                 "--workers", str(args.workers), "--log-level", "warning",
+                 "--socket", os.path.join(directory, "embeddings.sock"),
+                 "--metrics-dir", os.path.join(directory, "metrics")],
+                app_env, app_log,
+            ))
+            base_url = f"http://127.0.0.1:{app_port}"
+            print(f"Starting the backend over {args.candidates} candidates (logs in {log_dir})...")
+            wait_until_ready(f"{base_url}/readyz", args.startup_timeout, processes[-1], app_log)
+
+        queries = build_queries(args.distinct_queries, seed=args.seed)
+        if args.warmup:
+            asyncio.run(drive(base_url, queries, min(args.concurrency, args.warmup), args.warmup, None,
+                              args.stream, args.timeout))
+
+        before = scrape_metrics(base_url)
+        results, elapsed = asyncio.run(drive(base_url, queries, args.concurrency, args.requests, args.duration,
+                                             args.stream, args.timeout))
+        after = scrape_metrics(base_url)
+    finally:
+        for process in reversed(processes):
+            stop_process(process)
+
+    ok = [r for r in results if r["status"] == 200]
+    status_codes = {}
+    for r in results:
+        status_codes[str(r["status"])] = status_codes.get(str(r["status"]), 0) + 1
+    report = {
+        "benchmark": "load_test",
+        "config": {k: v for k, v in vars(args).items() if k not in ("json_out", "baseline", "save_baseline")},
+        "environment": environment_info(),
+        "run": {
+            "requests": len(results),
+            "elapsed_s": elapsed,
+            "concurrency": args.concurrency,
+            "rps": len(results) / elapsed if elapsed else 0.0,
+            "errors": len(results) - len(ok),
+            "cached": sum(1 for r in ok if r["cached"]),
+            "status_codes": status_codes,
+        },
+        "latency": summarize_latencies([r["latency_ms"] for r in ok]),
+        "ttfb": summarize_latencies([r["ttfb_ms"] for r in ok if r["ttfb_ms"] is not None]),
+        "stages": stage_breakdown(before, after),
+        "outcomes": labelled_counts(before, after, "hr_chat_requests_total", "outcome"),
+        "query_analysis": labelled_counts(before, after, "hr_query_analysis_total", "source"),
+        "llm_calls": labelled_counts(before, after, "hr_llm_requests_total", "purpose", "status"),
+        "llm_rejections": labelled_counts(before, after, "hr_llm_rejections_total", "reason"),
+        "llm_retries": labelled_counts(before, after, "hr_llm_retries_total", "endpoint"),
+    }
+    print_report(report)
+
+    for path in filter(None, (args.json_out, args.save_baseline)):
+        save_results(path, report)
+
+    if args.baseline:
+        baseline = load_results(args.baseline)
+        current = {"latency": report["latency"], "ttfb": report["ttfb"], "throughput": {"rps": report["run"]["rps"]}}
+        previous = {"latency": baseline.get("latency", {}), "ttfb": baseline.get("ttfb", {}),
+                    "throughput": {"rps": baseline.get("run", {}).get("rps")}}
+        metrics = [("latency", "p50_ms"), ("latency", "p95_ms"), ("latency", "p99_ms"),
+                   ("ttfb", "p50_ms"), ("ttfb", "p95_ms"), ("throughput", "rps")]
+        regressions = compare_to_baseline(current, previous, metrics, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
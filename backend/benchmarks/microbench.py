@@ -0,0 +1,116 @@
+"""
+Microbenchmarks for the in-process retrieval path: retrieve_context (with and without
+structured criteria, with and without precomputed semantic hits), search_semantic_pool
+and format_context_for_llm, over a synthetic candidate pool.
+
+Query embeddings are synthetic (noisy copies of pool rows), so the numbers measure
+filtering, scoring and formatting only, not the sentence transformer.
+
+Usage (from the backend/ directory):
+    python -m benchmarks.microbench --candidates 100000
+    python -m benchmarks.microbench --candidates 10000 --baseline benchmarks/baselines/microbench-10k.json
+    python -m benchmarks.microbench --candidates 10000 --save-baseline benchmarks/baselines/microbench-10k.json
+
+Exits with status 1 when --baseline is given and a case regressed by more than --threshold
+(and by more than --min-delta-ms). Baselines are only meaningful on the machine that recorded them;
+benchmarks/baselines/ holds the reference results, re-record them when the reference machine changes.
+"""
+# --- Imports ---
+import argparse
+import os
+import sys
+import time
+
+from benchmarks.index_report import synthetic_queries
+from benchmarks.results import compare_to_baseline, environment_info, load_results, save_results, summarize_latencies
+from benchmarks.synthetic_pool import build_pool, pool_dir, pool_env
+
+
+def time_calls(fn, count: int, warmup: int) -> dict:
+    """Calls fn(i) for i in range(warmup + count) and summarizes the timed calls."""
+    for i in range(warmup):
+        fn(i)
+    latencies = []
+    for i in range(warmup, warmup + count):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize_latencies(latencies)
+
+
+def run_cases(rag, iterations: int, warmup: int, seed: int = 1) -> dict:
+    """Runs every microbenchmark case against the loaded rag_service module."""
+    total = iterations + warmup
+    queries = synthetic_queries(rag.SNAPSHOT.embeddings, total, seed=seed)
+    texts = [f"synthetic query {i}" for i in range(total)]
+    broad = {"criteria": {"skills": ["Python"], "experience_years_min": None, "candidate_names": []}}
+    narrow = {"criteria": {"skills": ["Kafka", "Docker"], "experience_years_min": 8, "candidate_names": []}}
+    semantic_hits = [rag.search_semantic_pool(q) for q in queries]
+    contexts = [rag.retrieve_context(texts[i], None, queries[i]) for i in range(total)]
+
+    cases = {
+        "retrieve_context[no criteria]": lambda i: rag.retrieve_context(texts[i], None, queries[i]),
+        "retrieve_context[broad skill]": lambda i: rag.retrieve_context(texts[i], broad, queries[i]),
+        "retrieve_context[narrow filter]": lambda i: rag.retrieve_context(texts[i], narrow, queries[i]),
+        "retrieve_context[semantic hits]": lambda i: rag.retrieve_context(texts[i], broad, queries[i], semantic_hits[i]),
+        "search_semantic_pool": lambda i: rag.search_semantic_pool(queries[i]),
+        "format_context_for_llm": lambda i: rag.format_context_for_llm(list(contexts[i])),
+    }
+    return {name: time_calls(fn, iterations, warmup) for name, fn in cases.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0, help="pool seed")
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--save-baseline", help="write these results as a new baseline JSON")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative slowdown counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05,
+                        help="ignore slowdowns smaller than this many milliseconds")
+    args = parser.parse_args()
+
+    # rag_service reads the candidate / embedding store locations on import, so point it at the pool first
+    directory = pool_dir(args.candidates, args.seed)
+    os.environ.update(pool_env(directory))
+    build_pool(args.candidates, seed=args.seed, out_dir=directory)
+    from core import rag_service as rag
+
+    if not rag.initialize_embeddings() or rag.SNAPSHOT.index is None:
+        sys.exit("rag_service did not initialize (see the log above)")
+
+    print(f"Running microbenchmarks over {len(rag.SNAPSHOT.candidates)} candidates "
+          f"('{rag.SNAPSHOT.index.name}' index), {args.iterations} iterations each\n")
+    cases = run_cases(rag, args.iterations, args.warmup)
+
+    print(f"{'case':<34} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for name, r in cases.items():
+        print(f"{name:<34} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['mean_ms']:>9.3f}")
+
+    results = {
+        "benchmark": "microbench",
+        "candidates": len(rag.SNAPSHOT.candidates),
+        "index": rag.SNAPSHOT.index.name,
+        "iterations": args.iterations,
+        "environment": environment_info(),
+        "cases": cases,
+    }
+    if args.save_baseline:
+        save_results(args.save_baseline, results)
+
+    if args.baseline:
+        baseline = load_results(args.baseline)
+        if baseline.get("candidates") != results["candidates"]:
+            print(f"\nWarning: baseline was recorded with {baseline.get('candidates')} candidates")
+        # Tail percentiles of sub-millisecond calls are dominated by scheduler noise; gate on the median
+        metrics = [(name, "p50_ms") for name in cases]
+        regressions = compare_to_baseline(cases, baseline.get("cases", {}), metrics, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Shared helpers for benchmark results: latency summaries, JSON baselines and comparisons.
+"""
+# --- Imports ---
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+
+def summarize_latencies(latencies_ms) -> dict:
+    """count, mean and p50/p95/p99/max of a list of latencies in milliseconds."""
+    values = np.asarray(latencies_ms, dtype=np.float64)
+    if not len(values):
+        return {"count": 0}
+    return {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def environment_info() -> dict:
+    """Where a result was measured; baselines are only comparable on similar machines."""
+    return {
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+
+
+def save_results(path: str, results: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Saved results to {path}")
+
+
+def load_results(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_to_baseline(current: dict, baseline: dict, metrics: list[tuple[str, str]],
+                        threshold: float = 0.15, min_delta_ms: float = 0.0) -> list[str]:
+    """
+    Prints current vs baseline for each (case, metric) pair present in both
+    ({case: {metric: value}} dicts) and returns the regressions.
+    Metrics ending in "_ms" regress when they grow by more than `threshold`;
+    any other metric (e.g. "rps") regresses when it shrinks by more than `threshold`.
+    Latency changes smaller than `min_delta_ms` are never counted (timer noise on microsecond cases).
+    """
+    regressions = []
+    print(f"\n{'case':<34} {'metric':<8} {'baseline':>10} {'current':>10} {'change':>8}")
+    for case, metric in metrics:
+        old = baseline.get(case, {}).get(metric)
+        new = current.get(case, {}).get(metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        lower_is_better = metric.endswith("_ms")
+        if lower_is_better:
+            regressed = change > threshold and new - old > min_delta_ms
+        else:
+            regressed = change < -threshold
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{case:<34} {metric:<8} {old:>10.3f} {new:>10.3f} {change * 100:>+7.1f}%{flag}")
+        if regressed:
+            regressions.append(f"{case} {metric}: {old:.3f} -> {new:.3f} ({change * 100:+.1f}%)")
+    return regressions
@@ -0,0 +1,198 @@
+"""
+Local stand-in for the Ollama HTTP API, for load tests without a GPU.
+
+Implements the parts of the API the backend uses:
+- POST /api/chat      JSON or NDJSON streaming replies; `"format": "json"` requests (query analysis)
+                      get a valid analysis object, everything else gets filler answer text
+- POST /api/generate  empty-prompt model preload
+- GET  /api/tags, /api/version
+
+Timing is simulated from the command line options:
+time to first token = --ttft (+ prompt tokens / --prompt-rate), then --tokens tokens at --token-rate per second.
+Like Ollama's KV cache, the prefix shared with the previous prompt is not evaluated again
+(and not counted in prompt_eval_count), so a stable system prompt shows up as lower TTFT.
+Replies carry prompt_eval_count / eval_count and *_duration fields like the real server.
+--parallel limits concurrent generations per instance (like OLLAMA_NUM_PARALLEL); extra requests queue.
+Setting `app.state.fail_status` (e.g. 503) on an instance makes it answer every request with that
+status, health checks included, to simulate an overloaded or broken server in failover tests.
+
+Usage (from the backend/ directory):
+    python -m benchmarks.stub_ollama --port 11434 --ttft 0.3 --token-rate 40 --tokens 80
+    python -m benchmarks.stub_ollama --port 11500 --instances 3 --parallel 2
+"""
+# --- Imports ---
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from core.intent_rules import fast_analyze_query
+
+_USER_QUERY_RE = re.compile(r'User Query: "(.*)"')
+_FILLER = ("Based on the provided context, the candidates who match are listed below with their "
+           "relevant skills and years of experience as stated in the candidate information.").split()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), the same order of magnitude as Llama tokenizers."""
+    return max(1, len(text) // 4)
+
+
+def analysis_reply(prompt: str) -> str:
+    """JSON analysis object for a query-analysis prompt, extracted with the rule-based analyzer."""
+    found = _USER_QUERY_RE.search(prompt)
+    analysis, _ = fast_analyze_query(found.group(1) if found else "")
+    return json.dumps({"intent": analysis["intent"], "criteria": analysis["criteria"]})
+
+
+def answer_tokens(count: int) -> list[str]:
+    """`count` filler tokens (words with their trailing space) for an answer reply."""
+    return [_FILLER[i % len(_FILLER)] + " " for i in range(count)]
+
+
+def create_stub_app(ttft: float = 0.2, token_rate: float = 50.0, tokens: int = 60, prompt_rate: float = 0.0,
+                    jitter: float = 0.0, parallel: int = 0, model_load: float = 0.0) -> FastAPI:
+    """Builds one stub Ollama instance with the given timing profile."""
+    app = FastAPI(title="Ollama stub")
+    app.state.fail_status = 0
+    slots = asyncio.Semaphore(parallel) if parallel > 0 else None
+    loaded = {"done": model_load <= 0}
+    last_prompt = {"text": ""}
+
+    async def generation_slot():
+        if slots is not None:
+            await slots.acquire()
+        if not loaded["done"]:
+            await asyncio.sleep(model_load)
+            loaded["done"] = True
+
+    def release_slot():
+        if slots is not None:
+            slots.release()
+
+    def first_token_delay(prompt_tokens: int) -> float:
+        delay = ttft + (prompt_tokens / prompt_rate if prompt_rate > 0 else 0.0)
+        return max(0.0, delay * (1 + random.uniform(-jitter, jitter)))
+
+    def final_fields(prompt_tokens: int, eval_tokens: int, first_token_s: float, eval_s: float) -> dict:
+        # Ollama reports durations in nanoseconds
+        return {
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(first_token_s * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int(eval_s * 1e9),
+            "load_duration": 0,
+            "total_duration": int((first_token_s + eval_s) * 1e9),
+        }
+
+    @app.middleware("http")
+    async def simulated_failure(request: Request, call_next):
+        if app.state.fail_status:
+            return JSONResponse({"error": "simulated failure"}, status_code=app.state.fail_status)
+        return await call_next(request)
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        cached_tokens = len(os.path.commonprefix([last_prompt["text"], prompt])) // 4
+        last_prompt["text"] = prompt
+        prompt_tokens = max(1, estimate_tokens(prompt) - cached_tokens)
+
+        if body.get("format") == "json":
+            pieces = [analysis_reply(prompt)]
+        else:
+            pieces = answer_tokens(tokens)
+        per_token = 1.0 / token_rate if token_rate > 0 else 0.0
+
+        if not body.get("stream"):
+            await generation_slot()
+            try:
+                first_token_s = first_token_delay(prompt_tokens)
+                eval_s = per_token * len(pieces)
+                await asyncio.sleep(first_token_s + eval_s)
+            finally:
+                release_slot()
+            reply = {"model": model, "message": {"role": "assistant", "content": "".join(pieces)}}
+            reply.update(final_fields(prompt_tokens, len(pieces), first_token_s, eval_s))
+            return reply
+
+        async def events():
+            await generation_slot()
+            try:
+                first_token_s = first_token_delay(prompt_tokens)
+                await asyncio.sleep(first_token_s)
+                start = time.perf_counter()
+                for i, piece in enumerate(pieces):
+                    if i:
+                        await asyncio.sleep(per_token)
+                    yield json.dumps({"model": model, "message": {"role": "assistant", "content": piece}, "done": False}) + "\n"
+                final = {"model": model, "message": {"role": "assistant", "content": ""}}
+                final.update(final_fields(prompt_tokens, len(pieces), first_token_s, time.perf_counter() - start))
+                yield json.dumps(final) + "\n"
+            finally:
+                release_slot()
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        await generation_slot()
+        release_slot()
+        return {"model": body.get("model", "stub"), "response": "", "done": True}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "llama3.2:3b", "model": "llama3.2:3b"}]}
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "stub"}
+
+    return app
+
+
+async def serve(apps_by_port: dict, log_level: str = "warning"):
+    """Runs one uvicorn server per port in this event loop."""
+    servers = [uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level=log_level))
+               for port, app in apps_by_port.items()]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11434, help="first port; instances use consecutive ports")
+    parser.add_argument("--instances", type=int, default=1, help="independent stub servers to start")
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--prompt-rate", type=float, default=0.0,
+                        help="prompt tokens evaluated per second, added to the TTFT (0 = ignore prompt size)")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="generated tokens per second")
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per answer reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative +/- random variation of the TTFT")
+    parser.add_argument("--parallel", type=int, default=0, help="concurrent generations per instance (0 = unlimited)")
+    parser.add_argument("--model-load", type=float, default=0.0, help="seconds the first request waits (cold model)")
+    args = parser.parse_args()
+
+    apps = {
+        args.port + i: create_stub_app(ttft=args.ttft, token_rate=args.token_rate, tokens=args.tokens,
+                                       prompt_rate=args.prompt_rate, jitter=args.jitter,
+                                       parallel=args.parallel, model_load=args.model_load)
+        for i in range(args.instances)
+    }
+    print(f"Ollama stub listening on ports {', '.join(str(p) for p in apps)}", flush=True)
+    asyncio.run(serve(apps))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Synthetic candidate pools (1k .. 1M) for load tests and microbenchmarks.
+
+Writes <out>/candidates.json (served through CANDIDATES_FILE) and a ready embedding store
+in <out>/embedding_store (EMBEDDING_STORE_DIR), so the app starts without re-encoding the pool.
+
+By default the embeddings are synthetic: each candidate's vector is built from per-skill
+directions plus noise, so candidates sharing skills are close to each other. This keeps
+generation fast at 1M rows, but query embeddings from the real model are not aligned
+with them; queries without structured criteria mostly fall under SIMILARITY_THRESHOLD.
+Pass --encode to embed the pool with the real sentence transformer instead (slow beyond ~50k).
+
+Usage (from the backend/ directory):
+    python -m benchmarks.synthetic_pool --candidates 100000
+    python -m benchmarks.synthetic_pool --candidates 5000 --encode
+"""
+# --- Imports ---
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+# Pools are cached under backend/data (git- and docker-ignored)
+POOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "benchmarks")
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+
+FIRST_NAMES = [
+    "Alice", "Bob", "Charlie", "Diana", "Ethan", "Fatima", "George", "Hana", "Ivan", "Julia", "Kenji", "Laura",
+    "Mateo", "Nadia", "Omar", "Priya", "Quentin", "Rosa", "Samuel", "Tara", "Umar", "Valentina", "Wei", "Ximena",
+    "Yusuf", "Zoe", "Amir", "Bianca", "Carlos", "Deepa", "Elena", "Farid", "Grace", "Hugo", "Ines", "Jamal",
+]
+LAST_NAMES = [
+    "Smith", "Nguyen", "Garcia", "Kowalski", "Okafor", "Tanaka", "Müller", "Rossi", "Haddad", "Silva", "Patel",
+    "Johansson", "Dubois", "Kim", "Novak", "Cohen", "Ivanova", "Mensah", "O'Brien", "Fernandez", "Yilmaz", "Lee",
+]
+SKILLS = [
+    "Python", "SQL", "AWS", "Java", "Spring", "Docker", "Flask", "React", "Terraform", "Kubernetes", "Go",
+    "JavaScript", "TypeScript", "Node.js", "Django", "FastAPI", "PostgreSQL", "MongoDB", "Redis", "Kafka",
+    "Spark", "Airflow", "Pandas", "PyTorch", "TensorFlow", "Machine Learning", "NLP", "Azure", "GCP", "Linux",
+    "C++", "C#", ".NET", "Rust", "Scala", "Angular", "Vue", "GraphQL", "CI/CD", "Jenkins", "Ansible", "Agile",
+]
+ROLES = ["Backend developer", "Data engineer", "Cloud engineer", "Full-stack developer", "ML engineer",
+         "DevOps engineer", "Frontend developer", "Platform engineer", "Data scientist", "SRE"]
+
+
+def pool_dir(candidates: int, seed: int = 0, encoded: bool = False) -> str:
+    """Cache directory for a pool of the given size/seed."""
+    return os.path.join(POOLS_DIR, f"pool-{candidates}-s{seed}{'-encoded' if encoded else ''}")
+
+
+def generate_candidates(count: int, seed: int = 0) -> list[dict]:
+    """Deterministic candidate dicts in the same shape as SAMPLE_CANDIDATES_DATA."""
+    rng = np.random.default_rng(seed)
+    # Zipf-like skill popularity, so posting lists range from huge (Python) to small
+    weights = 1.0 / np.arange(1, len(SKILLS) + 1) ** 0.8
+    weights /= weights.sum()
+    skill_counts = rng.integers(3, 8, count)
+    first = rng.integers(0, len(FIRST_NAMES), count)
+    last = rng.integers(0, len(LAST_NAMES), count)
+    experience = np.clip(rng.gamma(2.0, 3.0, count), 0, 30).round().astype(int)
+    roles = rng.integers(0, len(ROLES), count)
+    # Weighted sampling without replacement for every row at once (Gumbel top-k)
+    gumbel = np.log(weights) - np.log(-np.log(rng.random((count, len(SKILLS)))))
+    skill_order = np.argsort(-gumbel, axis=1)
+
+    candidates = []
+    for i in range(count):
+        skills = [SKILLS[s] for s in skill_order[i, :skill_counts[i]]]
+        candidates.append({
+            "candidate_id": f"syn-{i}",
+            "candidate_name": f"{FIRST_NAMES[first[i]]} {LAST_NAMES[last[i]]}",
+            "skills": skills,
+            "experience_years": int(experience[i]),
+            "summary": f"{ROLES[roles[i]]} working mostly with {', '.join(skills[:2])}.",
+        })
+    return candidates
+
+
+def synthetic_vectors(candidates: list[dict], dim: int = EMBEDDING_DIM, seed: int = 0,
+                      chunk_size: int = 50000) -> np.ndarray:
+    """Normalized vectors: mean of the candidate's skill directions plus per-candidate noise."""
+    rng = np.random.default_rng(seed + 1)
+    skill_vectors = rng.standard_normal((len(SKILLS), dim)).astype(np.float32)
+    skill_ids = {s: i for i, s in enumerate(SKILLS)}
+    matrix = np.empty((len(candidates), dim), dtype=np.float32)
+    for start in range(0, len(candidates), chunk_size):
+        chunk = candidates[start:start + chunk_size]
+        block = 0.8 * rng.standard_normal((len(chunk), dim)).astype(np.float32)
+        for row, candidate in enumerate(chunk):
+            ids = [skill_ids[s] for s in candidate["skills"] if s in skill_ids]
+            if ids:
+                block[row] += skill_vectors[ids].mean(axis=0)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        matrix[start:start + len(chunk)] = block
+    return matrix
+
+
+def build_pool(candidates: int, seed: int = 0, encode: bool = False, out_dir: str | None = None) -> str:
+    """
+    Generates (or reuses) a pool and returns its directory.
+    The directory holds candidates.json and an embedding store that matches it exactly.
+    """
+    # Imported here so callers can point CANDIDATES_FILE / EMBEDDING_STORE_DIR at the pool
+    # (see pool_env) before the core modules read them
+    from core.candidates import build_candidate_text
+    from core.embedding_store import CURRENT_FILE, EmbeddingStore
+
+    out_dir = out_dir or pool_dir(candidates, seed, encode)
+    candidates_path = os.path.join(out_dir, "candidates.json")
+    store_dir = os.path.join(out_dir, "embedding_store")
+    if os.path.exists(candidates_path) and os.path.exists(os.path.join(store_dir, CURRENT_FILE)):
+        return out_dir
+
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    records = generate_candidates(candidates, seed)
+    print(f"Generated {len(records)} candidates in {time.perf_counter() - start:.1f}s")
+
+    if encode:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer("all-MiniLM-L6-v2")
+        encode_fn = lambda texts: model.encode(texts, batch_size=64, show_progress_bar=True,
+                                               convert_to_numpy=True, normalize_embeddings=True)
+    else:
+        encode_fn = lambda texts: synthetic_vectors(records, seed=seed)
+
+    start = time.perf_counter()
+    store = EmbeddingStore(directory=store_dir)
+    store.load()
+    store.sync([c["candidate_id"] for c in records], [build_candidate_text(c) for c in records], encode_fn)
+    print(f"Wrote embedding store to {store_dir} in {time.perf_counter() - start:.1f}s")
+
+    # Written last, so an interrupted run is regenerated instead of reused
+    with open(candidates_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(records, f)
+    os.replace(candidates_path + ".tmp", candidates_path)
+    return out_dir
+
+
+def pool_env(directory: str) -> dict:
+    """Environment variables that point the backend at a generated pool."""
+    return {
+        "CANDIDATES_FILE": os.path.join(directory, "candidates.json"),
+        "EMBEDDING_STORE_DIR": os.path.join(directory, "embedding_store"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--encode", action="store_true", help="embed with the real model instead of synthetic vectors")
+    parser.add_argument("--out", help=f"output directory (default: a cached pool under {POOLS_DIR})")
+    args = parser.parse_args()
+
+    directory = build_pool(args.candidates, seed=args.seed, encode=args.encode, out_dir=args.out)
+    print(f"Pool ready in {directory}. Serve it with:")
+    for key, value in pool_env(directory).items():
+        print(f"  export {key}={value}")
+
+
+if __name__ == "__main__":
+    main()
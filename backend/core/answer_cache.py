@@ -0,0 +1,93 @@
+# --- Imports ---
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "900"))
+# Minimum cosine similarity between query embeddings for a cached answer to be reused
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.9"))
+
+
+class SemanticAnswerCache:
+    """
+    Cache of final LLM answers, matched by meaning rather than exact text.
+
+    A cached answer is reused only when all of these hold:
+    - the new query's embedding has cosine similarity >= `similarity` with the cached query
+    - retrieval returned the same candidate ids (so the prompt context is identical)
+    - the candidate store version is unchanged (any store change clears the cache)
+    Entries expire after `ttl_seconds`; the least recently used entry is evicted when full.
+    """
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL,
+                 similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._entries = OrderedDict()  # entry id -> (expires_at, candidate ids, query vector, reply)
+        self._ids = itertools.count()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_version(self, store_version):
+        """Drops every entry when the candidate store has changed since they were cached."""
+        if store_version != self._version:
+            if self._entries:
+                logger.info(f"Candidate store changed ({self._version} -> {store_version}). Clearing answer cache.")
+            self._entries.clear()
+            self._version = store_version
+
+    def lookup(self, query_embedding: np.ndarray, candidate_ids, store_version) -> str | None:
+        """Returns the cached reply for a semantically equivalent query over the same candidates, or None."""
+        candidate_ids = tuple(candidate_ids)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(store_version)
+            best_key, best_score = None, self.similarity
+            for key, (expires_at, ids, vector, _) in list(self._entries.items()):
+                if expires_at < now:
+                    del self._entries[key]
+                    continue
+                if ids != candidate_ids:
+                    continue
+                score = float(np.dot(vector, query_embedding))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            logger.debug(f"Answer cache hit (similarity {best_score:.3f})")
+            return self._entries[best_key][3]
+
+    def store(self, query_embedding: np.ndarray, candidate_ids, store_version, reply: str):
+        """Caches a reply. Error replies should not be passed in."""
+        with self._lock:
+            self._check_version(store_version)
+            vector = np.asarray(query_embedding, dtype=np.float32).copy()
+            self._entries[next(self._ids)] = (time.monotonic() + self.ttl_seconds, tuple(candidate_ids), vector, reply)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,162 @@
+# --- Imports ---
+from collections.abc import Mapping
+
+import numpy as np
+
+# Fields with their own column; anything else a record carries is kept per row in `extras`
+CORE_FIELDS = ("candidate_id", "candidate_name", "skills", "experience_years", "summary")
+
+
+def _experience_value(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan  # unknown
+
+
+class StringColumn:
+    """
+    Strings stored back to back in one UTF-8 buffer with row offsets:
+    two numpy arrays instead of one Python str object per row.
+    """
+
+    def __init__(self, values):
+        encoded = [str(v).encode("utf-8") for v in values]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded)))
+        self.data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.offsets.nbytes
+
+
+class CandidateTable:
+    """
+    Read-only, columnar candidate set; row i is aligned with row i of the embedding matrix.
+    - ids / names / summaries: StringColumn
+    - skills: interned vocabulary (skill_vocabulary[id] is the text) plus CSR rows:
+      the skill ids of row i are skill_ids[skill_offsets[i]:skill_offsets[i + 1]]
+    - experience: float64 per row, NaN when unknown
+    - extras: {row: {field: value}} for the rare records with fields beyond CORE_FIELDS
+
+    Retrieval hands out CandidateView(row, score) objects; a candidate's fields are only
+    decoded when the view is read (i.e. for the top matches that get formatted).
+    Rebuilt from records on every candidate update, never modified.
+    """
+
+    def __init__(self, records: list[dict]):
+        size = len(records)
+        self.ids = StringColumn(r['candidate_id'] for r in records)
+        self.names = StringColumn(r.get('candidate_name', '') for r in records)
+        self.summaries = StringColumn(r.get('summary') or '' for r in records)
+        self.experience = np.fromiter((_experience_value(r.get('experience_years')) for r in records),
+                                      dtype=np.float64, count=size)
+
+        vocabulary, skill_ids = {}, []
+        self.skill_offsets = np.zeros(size + 1, dtype=np.int64)
+        for row, record in enumerate(records):
+            skills = record.get('skills') or []
+            for skill in skills:
+                skill_ids.append(vocabulary.setdefault(str(skill), len(vocabulary)))
+            self.skill_offsets[row + 1] = len(skill_ids)
+        self.skill_vocabulary = list(vocabulary)
+        self.skill_ids = np.array(skill_ids, dtype=np.int32)
+
+        self.extras = {}
+        for row, record in enumerate(records):
+            extra = {k: v for k, v in record.items() if k not in CORE_FIELDS}
+            if extra:
+                self.extras[row] = extra
+        self._rows_by_id = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the columns (excluding the small skill vocabulary and any extras)."""
+        return (self.ids.nbytes + self.names.nbytes + self.summaries.nbytes + self.experience.nbytes
+                + self.skill_offsets.nbytes + self.skill_ids.nbytes)
+
+    @property
+    def rows_by_id(self) -> dict:
+        """candidate_id -> row, built on first use (only candidate updates need it)."""
+        if self._rows_by_id is None:
+            self._rows_by_id = {candidate_id: row for row, candidate_id in enumerate(self.ids)}
+        return self._rows_by_id
+
+    # --- Field access ---
+    def skills(self, row: int) -> list[str]:
+        ids = self.skill_ids[self.skill_offsets[row]:self.skill_offsets[row + 1]]
+        return [self.skill_vocabulary[i] for i in ids.tolist()]
+
+    def field(self, row: int, name: str):
+        """One field of one row; KeyError if the record doesn't have it."""
+        if name == 'candidate_id':
+            return self.ids[row]
+        if name == 'candidate_name':
+            return self.names[row]
+        if name == 'skills':
+            return self.skills(row)
+        if name == 'summary':
+            return self.summaries[row]
+        if name == 'experience_years':
+            years = float(self.experience[row])
+            if np.isnan(years):
+                raise KeyError(name)
+            return int(years) if years.is_integer() else years
+        return self.extras.get(row, {})[name]
+
+    def fields(self, row: int) -> list[str]:
+        names = [f for f in CORE_FIELDS if f != 'experience_years' or not np.isnan(self.experience[row])]
+        return names + list(self.extras.get(row, ()))
+
+    def record(self, row: int) -> dict:
+        """Materializes row `row` as a candidate dict."""
+        return {name: self.field(row, name) for name in self.fields(row)}
+
+    def records(self) -> list[dict]:
+        """Every row as a candidate dict (for updates and persistence, not the request path)."""
+        return [self.record(row) for row in range(len(self))]
+
+    def view(self, row: int, score: float | None = None) -> "CandidateView":
+        return CandidateView(self, row, score)
+
+
+class CandidateView(Mapping):
+    """
+    Dict-like, read-only view of one CandidateTable row plus its 'similarity_score'.
+    Costs a row number and a score until a field is read; fields are decoded on access.
+    """
+    __slots__ = ("table", "row", "score")
+
+    def __init__(self, table: CandidateTable, row: int, score: float | None = None):
+        self.table = table
+        self.row = row
+        self.score = score
+
+    def __getitem__(self, key):
+        if key == 'similarity_score' and self.score is not None:
+            return self.score
+        return self.table.field(self.row, key)
+
+    def __iter__(self):
+        yield from self.table.fields(self.row)
+        if self.score is not None:
+            yield 'similarity_score'
+
+    def __len__(self):
+        return len(self.table.fields(self.row)) + (self.score is not None)
+
+    def __repr__(self):
+        return f"CandidateView(row={self.row}, score={self.score})"
@@ -0,0 +1,64 @@
+# --- Imports ---
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON file with a list of candidate dicts; falls back to the sample data below
+CANDIDATES_FILE = os.getenv("CANDIDATES_FILE")
+
+SAMPLE_CANDIDATES_DATA = [
+    {"candidate_id": "c1", "candidate_name": "Alice", "skills": ["Python", "SQL", "AWS"], "experience_years": 5, "summary": "Dev focused on backend systems."},
+    {"candidate_id": "c2", "candidate_name": "Bob", "skills": ["Java", "Spring", "Docker"], "experience_years": 7, "summary": "Java dev with cloud experience."},
+    {"candidate_id": "c3", "candidate_name": "Charlie", "skills": ["Python", "Flask", "React"], "experience_years": 3, "summary": "Full-stack dev, strong in Python."},
+    {"candidate_id": "c4", "candidate_name": "Diana", "skills": ["Python", "AWS", "Terraform"], "experience_years": 6, "summary": "Cloud engineer with Python scripting."},
+]
+
+
+def load_candidate_data() -> list[dict]:
+    """
+    Returns the candidate records to serve: the contents of CANDIDATES_FILE if set and present,
+    otherwise SAMPLE_CANDIDATES_DATA.
+    """
+    if CANDIDATES_FILE and os.path.exists(CANDIDATES_FILE):
+        with open(CANDIDATES_FILE, "r", encoding="utf-8") as f:
+            candidates = json.load(f)
+        logger.info(f"Loaded {len(candidates)} candidates from {CANDIDATES_FILE}")
+        return candidates
+    if CANDIDATES_FILE:
+        logger.info(f"{CANDIDATES_FILE} does not exist yet. Starting from the sample candidates.")
+    return SAMPLE_CANDIDATES_DATA
+
+
+def save_candidate_data(candidates: list[dict]) -> bool:
+    """
+    Persists the candidate records to CANDIDATES_FILE (write to a temp file, then atomic rename),
+    so changes made through /api/candidates survive a restart.
+    Returns False when CANDIDATES_FILE is not set (changes then only live in memory).
+    """
+    if not CANDIDATES_FILE:
+        return False
+    directory = os.path.dirname(os.path.abspath(CANDIDATES_FILE))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{CANDIDATES_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(candidates, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CANDIDATES_FILE)
+    logger.info(f"Saved {len(candidates)} candidates to {CANDIDATES_FILE}")
+    return True
+
+
+def build_candidate_text(candidate: dict) -> str:
+    """
+    Builds the text that gets embedded for a candidate.
+    The embedding store hashes this exact string, so changing it re-encodes everyone once.
+    """
+    text = f"Name: {candidate.get('candidate_name', '')}. "
+    skills_text = ', '.join(candidate.get('skills', []))
+    if skills_text: text += f"Skills: {skills_text}. "
+    text += f"Experience: {candidate.get('experience_years', 'N/A')} years. "
+    text += f"Summary: {candidate.get('summary', '')}"
+    return text.strip()
@@ -0,0 +1,208 @@
+"""
+Shared embedding service for multi-worker deployments.
+
+By default every API process loads its own sentence transformer and builds its own copy of
+the candidate embeddings. With EMBEDDING_SERVICE_SOCKET set, API workers instead:
+- memory-map the current embedding store generation read-only (the page cache is shared,
+  so N workers hold one copy of the matrix) together with the records stored next to it,
+- send query encodes and candidate updates to ONE embedding service process over a local
+  Unix socket (this module), and never import torch themselves,
+- poll the store's CURRENT pointer and switch to a new generation when the service writes one,
+- keep chat sessions in the service (core/sessions.SharedSessionStore), so follow-up questions
+  work whichever worker they reach.
+
+The service process owns the model and is the only writer of the embedding store. It batches
+query encodes from all workers together (core/rag_service.QueryEmbeddingBatcher).
+
+Usage (from the backend/ directory):
+    python run_server.py --workers 4                      # starts the service, then uvicorn
+    python -m core.embedding_service --socket /tmp/hr-embeddings.sock   # service on its own
+"""
+# --- Imports ---
+import argparse
+import logging
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener, AuthenticationError
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Unix socket of the embedding service; when set, this process is an API worker that uses it
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET", "")
+# Shared secret for the connection handshake (the socket file is also created owner-only)
+EMBEDDING_SERVICE_AUTHKEY = os.getenv("EMBEDDING_SERVICE_AUTHKEY", "hr-chatbot-embeddings").encode("utf-8")
+# How long an API worker waits for the service to come up at startup
+EMBEDDING_SERVICE_WAIT_SECONDS = float(os.getenv("EMBEDDING_SERVICE_WAIT_SECONDS", "120"))
+# How long an API worker waits for a reply before giving up on the call (candidate updates wait indefinitely)
+EMBEDDING_SERVICE_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_SERVICE_TIMEOUT_SECONDS", "30"))
+
+
+class EmbeddingServiceError(RuntimeError):
+    """Raised in API workers when the embedding service can't be reached or reports an error."""
+
+
+# ======================================================
+# == CLIENT (API workers) ==
+# ======================================================
+class EmbeddingServiceClient:
+    """
+    Stands in for the SentenceTransformer in API workers: encode() and the candidate update
+    calls are forwarded to the embedding service. Each thread gets its own connection, so a
+    long candidate update never blocks the query-encoding thread.
+    """
+
+    def __init__(self, address: str = EMBEDDING_SERVICE_SOCKET, authkey: bytes = EMBEDDING_SERVICE_AUTHKEY):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def call(self, op: str, *args, timeout: float | None = EMBEDDING_SERVICE_TIMEOUT_SECONDS):
+        """
+        Runs `op` in the service and returns its result. Reconnects once if the connection broke.
+        Raises EmbeddingServiceError if no reply arrives within `timeout` seconds (None: wait).
+        """
+        for attempt in (1, 2):
+            try:
+                conn = self._connection()
+                conn.send((op, args))
+                if timeout is not None and not conn.poll(timeout):
+                    # The late reply would be read by the next call on this connection: drop it
+                    self._drop_connection()
+                    raise EmbeddingServiceError(f"Embedding service at {self.address} did not answer '{op}' "
+                                                f"within {timeout:g}s")
+                status, value = conn.recv()
+                break
+            except (OSError, EOFError, AuthenticationError) as e:
+                self._drop_connection()
+                if attempt == 2:
+                    raise EmbeddingServiceError(f"Embedding service at {self.address} is unavailable: {e}") from e
+        if status != "ok":
+            raise EmbeddingServiceError(value)
+        return value
+
+    def encode(self, texts, **kwargs):
+        """SentenceTransformer.encode() subset: always returns normalized float32 vectors."""
+        return self.call("encode", list(texts))
+
+    def wait_ready(self, timeout: float = EMBEDDING_SERVICE_WAIT_SECONDS) -> dict:
+        """Blocks until the service answers (it starts listening once its store is synced)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.call("ping")
+            except EmbeddingServiceError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+
+# ======================================================
+# == SERVICE PROCESS ==
+# ======================================================
+def _handle_connection(conn, handlers: dict):
+    """Serves one API worker connection until it closes (one request at a time per connection)."""
+    with conn:
+        while True:
+            try:
+                op, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                handler = handlers.get(op)
+                if handler is None:
+                    raise ValueError(f"unknown operation '{op}'")
+                reply = ("ok", handler(*args))
+            except Exception as e:
+                logger.error(f"Embedding service '{op}' failed: {e}")
+                reply = ("error", f"{type(e).__name__}: {e}")
+            try:
+                conn.send(reply)
+            except OSError:
+                return
+
+
+def serve(socket_path: str):
+    """Loads the model, syncs the store and serves API workers on `socket_path` until killed."""
+    # This process is the owner: rag_service must load the model locally, not connect to itself
+    os.environ.pop("EMBEDDING_SERVICE_SOCKET", None)
+    import numpy as np
+    from core import rag_service
+    from core.observability import mark_process_exited
+    from core.sessions import SessionStore
+
+    # Chat sessions of all workers (core/sessions.SharedSessionStore)
+    sessions = SessionStore()
+
+    # Workers only connect once the store is synced and the model has run one query
+    if not rag_service.initialize_embeddings() or not rag_service.warm_up_retrieval():
+        raise SystemExit(f"Not starting the embedding service: {rag_service.get_load_progress()['error']}")
+
+    def encode(texts):
+        # Queries from all workers share forward passes on the batcher thread
+        futures = [rag_service.EMBEDDING_BATCHER.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures]).astype(np.float32, copy=False)
+
+    def ping():
+        return {"store_version": rag_service.get_store_version(), "candidates": rag_service.get_candidate_count()}
+
+    handlers = {
+        "ping": ping,
+        "encode": encode,
+        "upsert": rag_service.upsert_candidates,
+        "delete": rag_service.delete_candidates,
+        "batch_stats": rag_service.get_embedding_batch_stats,
+        "session_get": sessions.get_or_create_state,
+        "session_save": sessions.save_state,
+        "session_stats": sessions.stats,
+    }
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    old_umask = os.umask(0o077)
+    try:
+        listener = Listener(socket_path, family="AF_UNIX", authkey=EMBEDDING_SERVICE_AUTHKEY)
+    finally:
+        os.umask(old_umask)
+    logger.info(f"Embedding service listening on {socket_path} ({rag_service.get_candidate_count()} candidates)")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError) as e:
+                logger.warning(f"Rejected embedding service connection: {e}")
+                continue
+            threading.Thread(target=_handle_connection, args=(conn, handlers), name="embedding-conn", daemon=True).start()
+    finally:
+        listener.close()
+        mark_process_exited()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared embedding service for multi-worker API deployments.")
+    parser.add_argument("--socket", default=EMBEDDING_SERVICE_SOCKET or "/tmp/hr-embeddings.sock",
+                        help="Unix socket path to listen on")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
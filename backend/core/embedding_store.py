@@ -0,0 +1,230 @@
+# --- Imports ---
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Where the persisted candidate embeddings live (mounted as a volume in production)
+EMBEDDING_STORE_DIR = os.getenv(
+    "EMBEDDING_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "embedding_store"),
+)
+# float32 (default) or float16 to halve the on-disk / page-cache footprint
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32")
+
+# --- File layout ---
+# <store dir>/CURRENT               -> name of the active generation directory
+# <store dir>/gen-<n>/meta.json     -> model name, dtype, dim, row count, store version, records digest
+# <store dir>/gen-<n>/embeddings.npy -> (rows, dim) normalized matrix, memory-mapped on load
+# <store dir>/gen-<n>/ids.npy       -> candidate id per row
+# <store dir>/gen-<n>/hashes.npy    -> content hash per row (16-byte blake2b digest)
+# <store dir>/gen-<n>/candidates.json -> candidate records, row-aligned (optional; lets other processes
+#                                        load records and vectors of the same generation together)
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+MATRIX_FILE = "embeddings.npy"
+IDS_FILE = "ids.npy"
+HASHES_FILE = "hashes.npy"
+RECORDS_FILE = "candidates.json"
+
+
+def content_hash(text: str, model_name: str) -> bytes:
+    """
+    Hash of the exact text that gets embedded, salted with the model name
+    so switching models invalidates every row.
+    """
+    return hashlib.blake2b(f"{model_name}\x00{text}".encode("utf-8"), digest_size=16).digest()
+
+
+def records_digest(records: list[dict]) -> str:
+    """Digest of the candidate records, so a records-only change still produces a new generation."""
+    return hashlib.blake2b(json.dumps(records, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Persistent, memory-mapped store of candidate embeddings.
+
+    Rows are kept in one contiguous matrix on disk and opened with np.load(mmap_mode='r'),
+    so startup only maps the file instead of re-encoding every candidate.
+    Each write produces a new generation directory and then atomically repoints CURRENT,
+    so readers never observe a half-written store. Every generation carries a store version
+    (previous + 1), so separate processes mapping the same generation agree on it.
+    """
+
+    def __init__(self, directory: str = EMBEDDING_STORE_DIR, model_name: str = "all-MiniLM-L6-v2",
+                 dtype: str = EMBEDDING_STORE_DTYPE):
+        self.directory = directory
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.ids = np.empty(0, dtype="U1")
+        self.hashes = np.empty(0, dtype="S16")
+        self.matrix = None
+        self.generation = None
+        self.version = 0
+        self.records_digest = None
+        self.last_encoded = 0  # texts encoded by the most recent sync()
+
+    @property
+    def generation_dir(self) -> str | None:
+        """Directory of the active generation (immutable once written), or None if empty."""
+        return os.path.join(self.directory, self.generation) if self.generation else None
+
+    # --- Loading ---
+    def current_generation(self) -> str | None:
+        """Generation CURRENT points at right now (may be newer than the loaded one if another process wrote)."""
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def load(self) -> bool:
+        """
+        Memory-maps the current generation. Returns False (leaving the store empty)
+        if nothing has been written yet or the files don't match this model/dtype.
+        """
+        current_path = os.path.join(self.directory, CURRENT_FILE)
+        if not os.path.exists(current_path):
+            logger.info(f"Embedding store at {self.directory} is empty")
+            return False
+
+        start_time = time.time()
+        try:
+            with open(current_path, "r", encoding="utf-8") as f:
+                generation = f.read().strip()
+            gen_dir = os.path.join(self.directory, generation)
+            with open(os.path.join(gen_dir, META_FILE), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            if meta.get("model") != self.model_name or meta.get("dtype") != self.dtype.name:
+                logger.warning(f"Embedding store was built with {meta.get('model')}/{meta.get('dtype')}, "
+                               f"expected {self.model_name}/{self.dtype.name}. Ignoring it.")
+                return False
+
+            matrix = np.load(os.path.join(gen_dir, MATRIX_FILE), mmap_mode="r")
+            ids = np.load(os.path.join(gen_dir, IDS_FILE), mmap_mode="r")
+            hashes = np.load(os.path.join(gen_dir, HASHES_FILE), mmap_mode="r")
+            if not (len(matrix) == len(ids) == len(hashes) == meta.get("rows")):
+                logger.warning("Embedding store files have inconsistent row counts. Ignoring it.")
+                return False
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load embedding store: {e}. Ignoring it.")
+            return False
+
+        self.matrix, self.ids, self.hashes, self.generation = matrix, ids, hashes, generation
+        self.version = int(meta.get("version", 0))
+        self.records_digest = meta.get("records_digest")
+        logger.info(f"Memory-mapped {len(ids)} embeddings from {gen_dir} in {(time.time() - start_time) * 1000:.1f} ms")
+        return True
+
+    def load_records(self) -> list[dict] | None:
+        """Candidate records stored with the loaded generation, or None if it has none."""
+        if not self.generation_dir:
+            return None
+        try:
+            with open(os.path.join(self.generation_dir, RECORDS_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # --- Syncing ---
+    def sync(self, candidate_ids: list[str], texts: list[str], encode_fn, records: list[dict] = None):
+        """
+        Makes the store hold exactly `candidate_ids` (in that order) and returns the matrix.
+        Rows whose content hash is unchanged are copied from the existing store;
+        only new or changed texts are passed to `encode_fn(list[str]) -> np.ndarray`,
+        which must return L2-normalized vectors.
+        `records` (row-aligned candidate dicts) are stored with the generation when given.
+        """
+        hashes = np.array([content_hash(t, self.model_name) for t in texts], dtype="S16")
+        ids = np.array(candidate_ids, dtype=str)
+        digest = records_digest(records) if records is not None else None
+
+        self.last_encoded = 0
+        if (self.matrix is not None and np.array_equal(ids, self.ids) and np.array_equal(hashes, self.hashes)
+                and digest == self.records_digest):
+            logger.info(f"Embedding store is up to date ({len(ids)} candidates). Nothing to encode.")
+            return self.matrix
+
+        # Map existing (id, hash) pairs to rows so unchanged candidates are reused
+        existing_rows = {}
+        if self.matrix is not None:
+            for row, (cid, h) in enumerate(zip(self.ids.tolist(), self.hashes.tolist())):
+                existing_rows[(cid, h)] = row
+
+        reuse = [existing_rows.get((cid, h)) for cid, h in zip(ids.tolist(), hashes.tolist())]
+        to_encode = [i for i, row in enumerate(reuse) if row is None]
+        logger.info(f"Embedding store sync: {len(ids) - len(to_encode)} unchanged, {len(to_encode)} to encode")
+
+        new_vectors = None
+        if to_encode:
+            start_time = time.time()
+            new_vectors = np.asarray(encode_fn([texts[i] for i in to_encode]), dtype=np.float32)
+            self.last_encoded = len(to_encode)
+            logger.info(f"Encoded {len(to_encode)} candidate texts in {time.time() - start_time:.2f} seconds")
+
+        if new_vectors is not None:
+            dim = new_vectors.shape[1]
+        else:
+            dim = self.matrix.shape[1] if self.matrix is not None else 0
+        matrix = np.empty((len(ids), dim), dtype=self.dtype)
+        reused_idx = [i for i, row in enumerate(reuse) if row is not None]
+        if reused_idx:
+            matrix[reused_idx] = self.matrix[[reuse[i] for i in reused_idx]]
+        if to_encode:
+            matrix[to_encode] = new_vectors.astype(self.dtype)
+
+        self._write(ids, hashes, matrix, records)
+        return self.matrix
+
+    def replace(self, candidate_ids: list[str], texts: list[str], matrix: np.ndarray, records: list[dict] = None):
+        """
+        Writes precomputed vectors (e.g. from offline resume ingestion) as a new generation.
+        Rows are hashed from `texts` like in sync(), so later syncs keep them until a text changes.
+        """
+        hashes = np.array([content_hash(t, self.model_name) for t in texts], dtype="S16")
+        ids = np.array(candidate_ids, dtype=str)
+        self._write(ids, hashes, np.asarray(matrix).astype(self.dtype, copy=False), records)
+        return self.matrix
+
+    def _write(self, ids: np.ndarray, hashes: np.ndarray, matrix: np.ndarray, records: list[dict] = None):
+        """Writes a new generation directory, then atomically repoints CURRENT at it."""
+        os.makedirs(self.directory, exist_ok=True)
+        generation = f"gen-{time.time_ns()}"
+        gen_dir = os.path.join(self.directory, generation)
+        os.makedirs(gen_dir)
+
+        np.save(os.path.join(gen_dir, MATRIX_FILE), matrix)
+        np.save(os.path.join(gen_dir, IDS_FILE), ids)
+        np.save(os.path.join(gen_dir, HASHES_FILE), hashes)
+        if records is not None:
+            with open(os.path.join(gen_dir, RECORDS_FILE), "w", encoding="utf-8") as f:
+                json.dump(records, f)
+        meta = {"model": self.model_name, "dtype": self.dtype.name, "dim": int(matrix.shape[1]), "rows": int(len(ids)),
+                "version": self.version + 1, "records_digest": records_digest(records) if records is not None else None}
+        with open(os.path.join(gen_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        tmp_current = os.path.join(self.directory, f"{CURRENT_FILE}.tmp")
+        with open(tmp_current, "w", encoding="utf-8") as f:
+            f.write(generation)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_current, os.path.join(self.directory, CURRENT_FILE))
+        logger.info(f"Wrote embedding store generation {generation} ({len(ids)} rows)")
+
+        previous = self.generation
+        # Re-open through mmap so the in-memory copy can be released
+        self.generation = None
+        self.load()
+        if previous and previous != self.generation:
+            # Processes that still map the old files keep them alive until they unmap
+            shutil.rmtree(os.path.join(self.directory, previous), ignore_errors=True)
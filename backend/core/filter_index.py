@@ -0,0 +1,108 @@
+# --- Imports ---
+import numpy as np
+
+from core.candidate_table import CandidateTable
+
+
+def normalize_term(term) -> str:
+    """Lower-cases and trims a skill/name so 'Python ' and 'python' hit the same entry."""
+    return str(term).strip().lower()
+
+
+class CandidateFilterIndex:
+    """
+    Structured indexes over the candidate table, built once per snapshot:
+    - skills: inverted index skill -> sorted row ids (posting list)
+    - names: inverted index full name and each name token -> sorted row ids
+    - experience: row ids sorted by experience_years, for "N+ years" range lookups
+
+    `match()` intersects the posting lists for the criteria produced by
+    analyze_query_intent, so vector scoring only runs on rows that satisfy them.
+    """
+
+    def __init__(self, table: CandidateTable):
+        self.size = len(table)
+
+        # Skills: works on the interned ids, so each distinct spelling is normalized once
+        keys = {}
+        vocabulary_keys = np.array([keys.setdefault(normalize_term(s), len(keys)) for s in table.skill_vocabulary],
+                                   dtype=np.int64)
+        entry_rows = np.repeat(np.arange(self.size, dtype=np.int64), np.diff(table.skill_offsets))
+        entry_keys = vocabulary_keys[table.skill_ids] if len(table.skill_ids) else np.empty(0, dtype=np.int64)
+        # One (key, row) pair per candidate skill, deduplicated ("Python" and "python " on one row) and sorted by key, then row
+        pairs = np.unique(entry_keys * max(self.size, 1) + entry_rows)
+        pair_keys, pair_rows = np.divmod(pairs, max(self.size, 1))
+        bounds = np.searchsorted(pair_keys, np.arange(len(keys) + 1))
+        self.skills = {
+            key: pair_rows[bounds[i]:bounds[i + 1]]
+            for key, i in keys.items() if key and bounds[i] < bounds[i + 1]
+        }
+
+        name_rows = {}
+        for row, name in enumerate(table.names):
+            name = normalize_term(name)
+            if name:
+                for key in {name, *name.split()}:
+                    name_rows.setdefault(key, []).append(row)
+        # Rows are appended in increasing order, so every posting list is already sorted
+        self.names = {k: np.array(v, dtype=np.int64) for k, v in name_rows.items()}
+
+        # Unknown experience (NaN) never satisfies a minimum
+        experience = np.where(np.isnan(table.experience), -1.0, table.experience).astype(np.float32)
+        self.experience_order = np.argsort(experience, kind="stable")
+        self.experience_sorted = experience[self.experience_order]
+
+    # --- Vocabulary (used by the query fast path; key views, so no copy per request) ---
+    def known_skills(self):
+        return self.skills.keys()
+
+    def known_names(self):
+        return self.names.keys()
+
+    # --- Lookups ---
+    def rows_with_min_experience(self, years_min: float) -> np.ndarray:
+        """Sorted row ids with experience_years >= years_min (binary search on the sorted index)."""
+        start = np.searchsorted(self.experience_sorted, years_min, side="left")
+        return np.sort(self.experience_order[start:])
+
+    def match(self, criteria: dict) -> tuple[np.ndarray | None, dict]:
+        """
+        Returns (rows, applied) for the analyzed criteria.
+        - skills: candidate must have every skill that exists in the index
+        - candidate_names: candidate must match any of the names that exist in the index
+        - experience_years_min: candidate must have at least that many years
+        Skills/names the index has never seen are ignored (left to semantic scoring),
+        since the LLM may extract soft skills or misspellings no candidate lists.
+        `rows` is None when no criterion could be applied, i.e. every candidate is eligible.
+        """
+        criteria = criteria or {}
+        postings, applied = [], {}
+
+        skills = [normalize_term(s) for s in (criteria.get('skills') or []) if str(s).strip()]
+        known = [s for s in skills if s in self.skills]
+        if known:
+            postings.extend(self.skills[s] for s in known)
+            applied['skills'] = known
+
+        names = [normalize_term(n) for n in (criteria.get('candidate_names') or []) if str(n).strip()]
+        known_names = [n for n in names if n in self.names]
+        if known_names:
+            postings.append(np.unique(np.concatenate([self.names[n] for n in known_names])))
+            applied['candidate_names'] = known_names
+
+        years_min = criteria.get('experience_years_min')
+        if isinstance(years_min, (int, float)) and not isinstance(years_min, bool):
+            postings.append(self.rows_with_min_experience(years_min))
+            applied['experience_years_min'] = years_min
+
+        if not postings:
+            return None, applied
+
+        # Intersect smallest-first so each step shrinks the working set fastest
+        postings.sort(key=len)
+        rows = postings[0]
+        for posting in postings[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, posting, assume_unique=True)
+        return rows, applied
@@ -0,0 +1,166 @@
+# --- Imports ---
+import re
+
+# --- Built-in skill vocabulary ---
+# Recognized even when no loaded candidate lists them (the candidate index adds its own skills on top).
+# Ambiguous one/two-letter skills such as "C", "R" or "Go" are deliberately left to the LLM.
+COMMON_SKILLS = {
+    "python", "java", "javascript", "typescript", "golang", "rust", "c++", "c#", "ruby", "php",
+    "kotlin", "swift", "scala", "sql", "nosql", "postgresql", "mysql", "mongodb", "redis",
+    "aws", "azure", "gcp", "docker", "kubernetes", "terraform", "ansible", "linux", "git",
+    "react", "angular", "vue", "node.js", "django", "flask", "fastapi", "spring", ".net",
+    "pandas", "numpy", "pytorch", "tensorflow", "machine learning", "deep learning", "nlp",
+    "data science", "spark", "hadoop", "kafka", "airflow", "html", "css", "graphql", "rest",
+    "devops", "ci/cd", "jenkins", "agile", "scrum", "leadership", "communication",
+}
+
+# Words that must never be taken as skills or names even if a candidate lists them
+STOP_WORDS = {"a", "an", "and", "or", "the", "of", "in", "on", "with", "who", "which", "what", "is", "are",
+              "has", "have", "know", "knows", "me", "to", "for", "any", "all", "do", "does", "i", "we"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#./]*")
+_YEARS_PATTERNS = [
+    # "5+ years", "5 + yrs"
+    (re.compile(r"(\d{1,2})\s*\+\s*(?:years?|yrs?)"), 0),
+    # "at least 5 years", "minimum of 5 years", "5 or more years"
+    (re.compile(r"(?:at least|minimum(?: of)?|min\.?)\s*(\d{1,2})\s*(?:years?|yrs?)"), 0),
+    (re.compile(r"(\d{1,2})\s*(?:or more|and above|plus)\s*(?:years?|yrs?)"), 0),
+    # "more than 5 years", "over 5 years" -> strictly greater
+    (re.compile(r"(?:more than|over|above)\s*(\d{1,2})\s*(?:years?|yrs?)"), 1),
+    # "with 5 years", "5 years of experience"
+    (re.compile(r"(\d{1,2})\s*(?:years?|yrs?)\s*(?:of\s+)?(?:experience|exp\b)"), 0),
+]
+# Wording the rules can't express as "skills AND experience >= N": upper bounds, ranges, negation and
+# alternatives. Extracting criteria from these would invert the question ("less than 3 years" -> min 3),
+# so such queries are left to the LLM.
+_UNSUPPORTED_RE = re.compile(
+    r"\b(?:less|fewer) than\b|\bunder\b|\bup to\b|\bat most\b|\bmaximum\b|\bmax\b|\bbelow\b"
+    r"|\bno more than\b|<|\bbetween\b|\b\d{1,2}\s*(?:-|to)\s*\d{1,2}\s*(?:years?|yrs?)\b"
+    r"|\bnot\b|n't\b|\bwithout\b|\bno\b|\bnever\b|\bexcept\b|\bexcluding\b|\bother than\b"
+    r"|\bor\b(?!\s+more\b)|\beither\b"
+)
+_COMPARE_RE = re.compile(r"\b(?:compare|comparison|versus|vs\.?|difference|better|stronger)\b")
+_SUMMARY_RE = re.compile(r"\b(?:tell me about|who is|summar\w*|profile|details|background|about)\b")
+_CAPITALIZED_RE = re.compile(r"\b[A-Z][a-z]+\b")
+# Questions that refer back to the previous answer ("and which of them know Docker?", "only those with 5+ years").
+# Only anaphoric constructions count: a bare "they"/"their" ("who knows AWS and how long have they worked?")
+# refers to the question's own subject, not to an earlier answer. Neither does a pivot such as
+# "what about Java?": it asks about other candidates, so it searches the full pool.
+_FOLLOW_UP_RE = re.compile(
+    r"\b(?:of|among|from|amongst) (?:them|those|these|the above|that list|this list)\b"
+    r"|\b(?:the same|the previous) (?:ones|candidates|people)\b"
+    r"|^(?:and|also|only)\b"
+)
+
+# Maximum words in a multi-word skill ("machine learning", "deep learning")
+_MAX_NGRAM = 3
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form used as a cache key: lower-case, single spaces, no trailing punctuation."""
+    return re.sub(r"\s+", " ", str(query or "")).strip().lower().rstrip("?!. ")
+
+
+def _ngrams(tokens: list[str]):
+    for size in range(_MAX_NGRAM, 0, -1):
+        for i in range(len(tokens) - size + 1):
+            yield i, size, " ".join(tokens[i:i + size])
+
+
+def fast_analyze_query(user_query: str, known_skills=(), known_names=()) -> tuple[dict, float]:
+    """
+    Deterministic intent/criteria extraction for the common query shapes:
+    known skills, "N+ years" style experience, and names of loaded candidates.
+
+    Returns (analysis, confidence). `analysis` has the same shape as analyze_query_intent's
+    result; `confidence` in [0, 1] says whether the caller can skip the LLM.
+    Confidence is low when nothing was recognized, when the query contains capitalized
+    words that are neither known skills nor known names (likely an unknown name or skill),
+    and when it uses upper bounds, ranges, negation or "or" (see _UNSUPPORTED_RE).
+    """
+    normalized = normalize_query(user_query)
+    tokens = [t.rstrip(".") or t for t in _TOKEN_RE.findall(normalized)]
+
+    # --- Experience ---
+    experience_years_min = None
+    for pattern, offset in _YEARS_PATTERNS:
+        found = pattern.search(normalized)
+        if found:
+            experience_years_min = int(found.group(1)) + offset
+            break
+
+    # --- Skills and names (longest n-gram first, each token used once) ---
+    skills, names, used = [], [], set()
+    for i, size, gram in _ngrams(tokens):
+        span = set(range(i, i + size))
+        if span & used or gram in STOP_WORDS:
+            continue
+        if gram in known_names:
+            names.append(gram.title())
+            used |= span
+        elif gram in known_skills or gram in COMMON_SKILLS:
+            skills.append(gram)
+            used |= span
+
+    # --- Unrecognized proper nouns lower confidence ---
+    recognized = {tokens[i] for i in used}
+    original = str(user_query or "").strip()
+    unresolved = [m.group(0) for m in _CAPITALIZED_RE.finditer(original)
+                  if m.start() > 0 and m.group(0).lower() not in recognized and m.group(0).lower() not in STOP_WORDS]
+
+    # --- Intent ---
+    if len(names) >= 2 and _COMPARE_RE.search(normalized):
+        intent = "compare_candidates"
+    elif len(names) == 1 and not skills and experience_years_min is None and (_SUMMARY_RE.search(normalized) or len(tokens) <= 3):
+        intent = "summarize_candidate"
+    elif skills or names or experience_years_min is not None:
+        intent = "find_candidates"
+    else:
+        intent = "unknown"
+
+    analysis = {
+        "intent": intent,
+        "criteria": {
+            "skills": skills,
+            "experience_years_min": experience_years_min,
+            "candidate_names": names,
+        },
+        "original_query": user_query,
+    }
+
+    if intent == "unknown":
+        confidence = 0.0
+    elif _UNSUPPORTED_RE.search(normalized):
+        confidence = 0.2
+    elif unresolved:
+        confidence = 0.5
+    else:
+        confidence = 0.9
+    return analysis, confidence
+
+
+def is_follow_up(user_query: str) -> bool:
+    """
+    True if the query refers back to the candidates of the previous answer
+    ("which of them...", "among those...", or a leading "and/also/only"),
+    so a chat session can refine that result.
+    """
+    return bool(_FOLLOW_UP_RE.search(normalize_query(user_query)))
+
+
+def merge_criteria(previous: dict, current: dict) -> dict:
+    """
+    Criteria for a follow-up: the previous turn's criteria refined by the new ones.
+    Skills accumulate, the higher experience minimum wins, and names from the new query
+    replace the previous ones (if it names anyone).
+    """
+    previous, current = previous or {}, current or {}
+    skills = list(previous.get('skills') or [])
+    skills += [s for s in current.get('skills') or [] if s not in skills]
+    minimums = [m for m in (previous.get('experience_years_min'), current.get('experience_years_min'))
+                if isinstance(m, (int, float)) and not isinstance(m, bool)]
+    return {
+        "skills": skills,
+        "experience_years_min": max(minimums) if minimums else None,
+        "candidate_names": list(current.get('candidate_names') or previous.get('candidate_names') or []),
+    }
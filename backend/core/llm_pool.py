@@ -0,0 +1,362 @@
+# --- Imports ---
+import asyncio
+import collections
+import logging
+import math
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+from core.observability import (
+    LLM_ENDPOINT_AVAILABLE, LLM_ENDPOINT_OUTSTANDING, LLM_QUEUE_DEPTH, LLM_REJECTIONS_TOTAL, LLM_RETRIES_TOTAL,
+    observe_stage
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Comma-separated Ollama base URLs; falls back to the single OLLAMA_ENDPOINT
+OLLAMA_ENDPOINTS = os.getenv("OLLAMA_ENDPOINTS", "")
+# Requests sent to one endpoint at a time (match the server's OLLAMA_NUM_PARALLEL)
+OLLAMA_ENDPOINT_CONCURRENCY = int(os.getenv("OLLAMA_ENDPOINT_CONCURRENCY", "4"))
+# Requests allowed to wait for a free endpoint slot; beyond that they are rejected with 429
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "64"))
+# Seconds a queued request may wait for a slot before it is rejected with 503
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "15"))
+# Retries on another endpoint after connection errors / 502 / 503 / 504 (full-jitter backoff)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.2"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "2"))
+# Passive ejection: an endpoint that fails this many requests in a row is skipped for LLM_EJECT_SECONDS
+LLM_EJECT_AFTER_FAILURES = int(os.getenv("LLM_EJECT_AFTER_FAILURES", "3"))
+LLM_EJECT_SECONDS = float(os.getenv("LLM_EJECT_SECONDS", "30"))
+# Active health checks (GET /api/version); 0 disables them
+LLM_HEALTH_CHECK_INTERVAL = float(os.getenv("LLM_HEALTH_CHECK_INTERVAL", "5"))
+LLM_HEALTH_CHECK_TIMEOUT = float(os.getenv("LLM_HEALTH_CHECK_TIMEOUT", "2"))
+# Retry-After (seconds) sent with 429 / queue-timeout 503 responses
+LLM_RETRY_AFTER = int(os.getenv("LLM_RETRY_AFTER", "2"))
+
+# Upstream statuses that mean "this server can't take it right now", so another endpoint may
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+class LLMOverloaded(Exception):
+    """
+    Raised when a request can't be admitted to any Ollama endpoint.
+    `status_code` is 429 (queue full) or 503 (queue wait timed out / no healthy endpoint);
+    `retry_after` is the suggested Retry-After in seconds.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Endpoint:
+    """One Ollama server and its routing state."""
+
+    def __init__(self, url: str, max_concurrency: int):
+        self.url = url.rstrip("/")
+        self.max_concurrency = max(1, max_concurrency)
+        self.outstanding = 0
+        self.healthy = True          # last active health check result
+        self.ejected_until = 0.0     # monotonic time until which passive ejection applies
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def has_capacity(self) -> bool:
+        return self.outstanding < self.max_concurrency
+
+
+class LLMPool:
+    """
+    Routes Ollama requests over several endpoints.
+
+    - Each request goes to the available endpoint with the fewest outstanding requests
+      (random among ties), up to `max_concurrency` in flight per endpoint.
+    - When every endpoint is busy, requests wait in a bounded FIFO queue; a full queue
+      is rejected immediately (429) and a wait longer than `queue_timeout` fails with 503.
+    - Connection errors and 429/502/503/504 answers are retried on another endpoint with
+      full-jitter exponential backoff. Read timeouts are not retried (the model was working).
+    - Endpoints failing `eject_after` requests in a row are ejected for `eject_seconds`;
+      a background task also marks endpoints unhealthy while GET /api/version fails.
+    Meant to be used from one event loop (one pool per worker process).
+    """
+
+    def __init__(self, urls: list[str], max_concurrency: int = OLLAMA_ENDPOINT_CONCURRENCY,
+                 queue_size: int = LLM_QUEUE_SIZE, queue_timeout: float = LLM_QUEUE_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, eject_after: int = LLM_EJECT_AFTER_FAILURES,
+                 eject_seconds: float = LLM_EJECT_SECONDS, health_check_interval: float = LLM_HEALTH_CHECK_INTERVAL):
+        if not urls:
+            raise ValueError("LLMPool needs at least one endpoint URL")
+        self.endpoints = [Endpoint(url, max_concurrency) for url in urls]
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.health_check_interval = health_check_interval
+        self._waiters = collections.deque()
+        self._health_task = None
+        for endpoint in self.endpoints:
+            self._publish(endpoint)
+
+    @property
+    def capacity(self) -> int:
+        """Total concurrent requests across all endpoints."""
+        return sum(e.max_concurrency for e in self.endpoints)
+
+    # --- Routing / admission ---
+    def _pick(self, avoid=()) -> Endpoint | None:
+        """Least-outstanding available endpoint with a free slot, preferring ones not in `avoid`."""
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.available(now) and e.has_capacity()]
+        fresh = [e for e in candidates if e not in avoid]
+        candidates = fresh or candidates
+        if not candidates:
+            return None
+        least = min(e.outstanding for e in candidates)
+        return random.choice([e for e in candidates if e.outstanding == least])
+
+    def _unavailable_retry_after(self) -> int:
+        """Seconds until an ejected/unhealthy endpoint may be back."""
+        now = time.monotonic()
+        waits = [e.ejected_until - now for e in self.endpoints if e.healthy and e.ejected_until > now]
+        if self.health_check_interval > 0:
+            waits.append(self.health_check_interval)
+        return max(1, math.ceil(min(waits))) if waits else LLM_RETRY_AFTER
+
+    def _reject(self, reason: str, status_code: int, retry_after: int, message: str):
+        LLM_REJECTIONS_TOTAL.labels(reason=reason).inc()
+        logger.debug("Rejecting LLM request (%s): %s", reason, message)
+        raise LLMOverloaded(message, status_code, retry_after, reason)
+
+    async def _acquire(self, avoid=()) -> Endpoint:
+        # New arrivals don't overtake requests that are already queued
+        endpoint = self._pick(avoid) if not self._waiters else None
+        if endpoint is None:
+            now = time.monotonic()
+            if not any(e.available(now) for e in self.endpoints):
+                self._reject("unavailable", 503, self._unavailable_retry_after(), "No healthy LLM endpoint is available.")
+            if len(self._waiters) >= self.queue_size:
+                self._reject("queue_full", 429, LLM_RETRY_AFTER, "The language model is at capacity. Please retry shortly.")
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.queue_timeout
+            start = time.perf_counter()
+            while endpoint is None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self._reject("queue_timeout", 503, LLM_RETRY_AFTER,
+                                 f"Timed out after {self.queue_timeout:.0f}s waiting for a language model slot.")
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+                LLM_QUEUE_DEPTH.set(len(self._waiters))
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    pass
+                except asyncio.CancelledError:
+                    # Hand a wake-up we received but can no longer use to the next in line
+                    if waiter.done() and not waiter.cancelled():
+                        self._wake(1)
+                    raise
+                finally:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    LLM_QUEUE_DEPTH.set(len(self._waiters))
+                endpoint = self._pick(avoid)
+                if endpoint is None and not any(e.available(time.monotonic()) for e in self.endpoints):
+                    self._reject("unavailable", 503, self._unavailable_retry_after(), "No healthy LLM endpoint is available.")
+            observe_stage("llm_queue_wait", time.perf_counter() - start)
+
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        self._publish(endpoint)
+        return endpoint
+
+    def _release(self, endpoint: Endpoint):
+        endpoint.outstanding -= 1
+        self._publish(endpoint)
+        self._wake(1)
+
+    def _wake(self, count: int):
+        """Wakes up to `count` queued requests (FIFO) to retry picking an endpoint."""
+        for waiter in list(self._waiters):
+            if count <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                count -= 1
+
+    @asynccontextmanager
+    async def slot(self, avoid=()):
+        """Holds one request slot on the chosen endpoint for the duration of the block."""
+        endpoint = await self._acquire(avoid)
+        try:
+            yield endpoint
+        finally:
+            self._release(endpoint)
+
+    # --- Outcome tracking (passive health) ---
+    def record_success(self, endpoint: Endpoint):
+        endpoint.consecutive_failures = 0
+
+    def record_failure(self, endpoint: Endpoint, error: str):
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.eject_after and time.monotonic() >= endpoint.ejected_until:
+            endpoint.ejected_until = time.monotonic() + self.eject_seconds
+            logger.warning("Ejecting LLM endpoint %s for %.0fs after %d consecutive failures (last: %s)",
+                           endpoint.url, self.eject_seconds, endpoint.consecutive_failures, error)
+            self._publish(endpoint)
+
+    async def _backoff(self, attempt: int, endpoint: Endpoint, error: str):
+        delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+        LLM_RETRIES_TOTAL.labels(endpoint=endpoint.url).inc()
+        logger.info("Retrying LLM request after %s from %s (attempt %d, backoff %.2fs)",
+                    error, endpoint.url, attempt + 1, delay)
+        await asyncio.sleep(delay)
+
+    # --- Requests ---
+    async def post(self, client: httpx.AsyncClient, path: str, payload: dict) -> httpx.Response:
+        """
+        POSTs `payload` to `path` on a pooled endpoint and returns the response
+        (callers check the status). Retryable failures move to another endpoint.
+        """
+        tried = set()
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            async with self.slot(avoid=tried) as endpoint:
+                tried.add(endpoint)
+                try:
+                    response = await client.post(endpoint.url + path, json=payload)
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                    self.record_failure(endpoint, type(e).__name__)
+                    if last_attempt:
+                        raise
+                    error = type(e).__name__
+                except httpx.TimeoutException:
+                    self.record_failure(endpoint, "timeout")
+                    raise
+                else:
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        self.record_success(endpoint)
+                        return response
+                    self.record_failure(endpoint, f"HTTP {response.status_code}")
+                    if last_attempt:
+                        return response
+                    error = f"HTTP {response.status_code}"
+            await self._backoff(attempt, endpoint, error)
+
+    @asynccontextmanager
+    async def stream(self, client: httpx.AsyncClient, path: str, payload: dict):
+        """
+        Streaming variant of post(): yields the open response once an endpoint accepted the request.
+        Retries only happen before anything was yielded, so no output is ever duplicated.
+        """
+        tried = set()
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            async with self.slot(avoid=tried) as endpoint:
+                tried.add(endpoint)
+                try:
+                    request = client.build_request("POST", endpoint.url + path, json=payload)
+                    response = await client.send(request, stream=True)
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                    self.record_failure(endpoint, type(e).__name__)
+                    if last_attempt:
+                        raise
+                    error = type(e).__name__
+                except httpx.TimeoutException:
+                    self.record_failure(endpoint, "timeout")
+                    raise
+                else:
+                    try:
+                        if response.status_code not in RETRYABLE_STATUS_CODES or last_attempt:
+                            if response.status_code in RETRYABLE_STATUS_CODES:
+                                self.record_failure(endpoint, f"HTTP {response.status_code}")
+                            else:
+                                self.record_success(endpoint)
+                            yield response
+                            return
+                        self.record_failure(endpoint, f"HTTP {response.status_code}")
+                        error = f"HTTP {response.status_code}"
+                    finally:
+                        await response.aclose()
+            await self._backoff(attempt, endpoint, error)
+
+    # --- Active health checks ---
+    async def check_health(self, client: httpx.AsyncClient):
+        """Probes every endpoint once and updates its healthy flag."""
+        async def probe(endpoint: Endpoint):
+            try:
+                response = await client.get(f"{endpoint.url}/api/version", timeout=LLM_HEALTH_CHECK_TIMEOUT)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            if healthy != endpoint.healthy:
+                logger.warning("LLM endpoint %s is now %s", endpoint.url, "healthy" if healthy else "unhealthy")
+                endpoint.healthy = healthy
+                if healthy:
+                    endpoint.consecutive_failures = 0
+                    endpoint.ejected_until = 0.0
+                    self._wake(endpoint.max_concurrency)
+            self._publish(endpoint)
+
+        await asyncio.gather(*(probe(e) for e in self.endpoints))
+
+    async def _health_loop(self, client_factory):
+        while True:
+            try:
+                await self.check_health(client_factory())
+            except Exception as e:
+                logger.error(f"LLM health check failed: {e}")
+            await asyncio.sleep(self.health_check_interval)
+
+    def start_health_checks(self, client_factory):
+        """Starts the background health-check task (from the app lifespan). `client_factory()` returns the shared client."""
+        if self.health_check_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop(client_factory))
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    # --- Introspection ---
+    def _publish(self, endpoint: Endpoint):
+        LLM_ENDPOINT_OUTSTANDING.labels(endpoint=endpoint.url).set(endpoint.outstanding)
+        LLM_ENDPOINT_AVAILABLE.labels(endpoint=endpoint.url).set(1 if endpoint.available(time.monotonic()) else 0)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "queued": len(self._waiters),
+            "queue_size": self.queue_size,
+            "endpoints": [
+                {"url": e.url, "available": e.available(now), "healthy": e.healthy, "outstanding": e.outstanding,
+                 "max_concurrency": e.max_concurrency, "requests": e.requests, "failures": e.failures,
+                 "ejected_for_s": max(0.0, e.ejected_until - now)}
+                for e in self.endpoints
+            ],
+        }
+
+
+def endpoint_urls(default_endpoint: str) -> list[str]:
+    """OLLAMA_ENDPOINTS if set, otherwise the single default endpoint."""
+    urls = [u.strip() for u in OLLAMA_ENDPOINTS.split(",") if u.strip()]
+    return urls or [default_endpoint]
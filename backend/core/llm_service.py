@@ -1,53 +1,193 @@
-import requests
+import asyncio
+import copy
+import httpx
+import logging
 import os
 import json # Make sure json is imported
+import time
 from dotenv import load_dotenv
 
+from core.cache import TTLCache
+from core.intent_rules import fast_analyze_query, normalize_query
+from core.llm_pool import LLMOverloaded, LLMPool, endpoint_urls
+from core.observability import (
+    LLM_REQUESTS_TOTAL, QUERY_ANALYSIS_TOTAL, observe_stage, record_ollama_usage, register_stats_source, stage_timer
+)
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables (optional, good practice)
 load_dotenv()
 OLLAMA_ENDPOINT = os.getenv("OLLAMA_ENDPOINT", "http://localhost:11434")
-OLLAMA_CHAT_API_URL = f"{OLLAMA_ENDPOINT}/api/chat" # Using /api/chat which supports messages format
+OLLAMA_CHAT_PATH = "/api/chat" # Using /api/chat which supports messages format
+OLLAMA_GENERATE_PATH = "/api/generate" # Only used to preload the model at startup
+
+# --- HTTP client configuration (seconds / connection counts) ---
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20"))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "10"))
+# How long Ollama keeps the model (and its prompt KV cache) loaded after a request, e.g. "30m", "-1" (forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# --- Query analysis fast path / cache configuration ---
+# Rule-based analysis is used as-is when its confidence reaches this value; otherwise the LLM is asked
+INTENT_FAST_PATH_MIN_CONFIDENCE = float(os.getenv("INTENT_FAST_PATH_MIN_CONFIDENCE", "0.8"))
+ANALYSIS_CACHE = TTLCache(
+    max_size=int(os.getenv("ANALYSIS_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("ANALYSIS_CACHE_TTL", "600")),
+)
+register_stats_source("query_analysis", ANALYSIS_CACHE.stats)
+_analysis_store_version = None  # candidate store version the cached analyses were made against
+
+# --- Endpoint pool (OLLAMA_ENDPOINTS, or just OLLAMA_ENDPOINT); see core/llm_pool.py ---
+LLM_POOL = LLMPool(endpoint_urls(OLLAMA_ENDPOINT))
+OLLAMA_ENDPOINTS_DISPLAY = ", ".join(e.url for e in LLM_POOL.endpoints)
+
+# --- Shared async client (one connection pool per process) ---
+_http_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide AsyncClient, creating it on first use.
+    Reusing one client keeps TCP connections to Ollama alive between requests.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                # Enough for every pooled request slot plus the health checks
+                max_connections=max(OLLAMA_MAX_CONNECTIONS, LLM_POOL.capacity + len(LLM_POOL.endpoints)),
+                max_keepalive_connections=OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            headers={'Content-Type': 'application/json'},
+        )
+    return _http_client
+
+
+def start_llm_pool():
+    """
+    Starts the endpoint pool's background health checks. Called from the FastAPI lifespan on startup.
+    """
+    LLM_POOL.start_health_checks(get_http_client)
+
+
+def get_llm_pool_stats() -> dict:
+    """Per-endpoint routing state (outstanding requests, health, ejection) and queue depth."""
+    return LLM_POOL.stats()
+
+
+async def close_http_client():
+    """
+    Stops the health checks and closes the shared AsyncClient. Called from the FastAPI lifespan on shutdown.
+    """
+    global _http_client
+    await LLM_POOL.stop_health_checks()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def preload_model(model: str = "llama3.2:3b") -> dict:
+    """
+    Asks every Ollama endpoint to load `model` (an empty-prompt /api/generate), so the first
+    user request doesn't wait for the model to be read into (GPU) memory. Called once during
+    startup warmup. Returns {endpoint url: "loaded" or "Error: ..."}; never raises.
+    """
+    client = get_http_client()
+    payload = {"model": model, "keep_alive": _keep_alive_value()}
+
+    async def load(url: str):
+        start_time = time.perf_counter()
+        try:
+            response = await client.post(f"{url}{OLLAMA_GENERATE_PATH}", json=payload)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not preload {model} on {url}: {e}")
+            return url, f"Error: {e}"
+        logger.info(f"Preloaded {model} on {url} in {time.perf_counter() - start_time:.2f} seconds")
+        return url, "loaded"
+
+    return dict(await asyncio.gather(*(load(e.url) for e in LLM_POOL.endpoints)))
+
+
+def chat_payload(prompt: str, model: str, stream: bool, system: str | None = None,
+                 history: list[dict] | None = None) -> dict:
+    """
+    /api/chat request body. A system prompt goes first as its own message, so a fixed one
+    forms a byte-stable prefix that Ollama can serve from its KV cache.
+    `history` (earlier user/assistant messages of the conversation) goes between it and the prompt.
+    """
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.extend(history or ())
+    messages.append({"role": "user", "content": prompt})
+    return {"model": model, "messages": messages, "stream": stream, "keep_alive": _keep_alive_value()}
+
+
+def _keep_alive_value():
+    # Ollama takes a duration string ("30m") or a number of seconds (-1 keeps the model loaded)
+    try:
+        return int(OLLAMA_KEEP_ALIVE)
+    except ValueError:
+        return OLLAMA_KEEP_ALIVE
+
+
+def record_usage(usage: dict | None, data: dict):
+    """Copies Ollama's token counts from a final response/chunk into a caller-supplied dict."""
+    if usage is not None:
+        usage["prompt_tokens"] = data.get("prompt_eval_count")
+        usage["completion_tokens"] = data.get("eval_count")
+
 
 # ======================================================
 # == FUNCTION TO GET OLLAMA RESPONSE (Corrected) ==
 # ======================================================
-def get_ollama_response(prompt: str, model: str = "llama3.2:3b") -> str:
+async def get_ollama_response(prompt: str, model: str = "llama3.2:3b", system: str | None = None,
+                              usage: dict | None = None, history: list[dict] | None = None) -> str:
     """
     Sends a prompt to the Ollama API /api/chat endpoint and returns the LLM's response string.
     Handles potential connection errors and extracts the message content.
     Returns an error message string if something goes wrong.
     Dynamically adjusts payload based on prompt type (analysis vs RAG).
+    The request runs on the shared async client, so it never blocks the event loop
+    and is cancelled cleanly if the awaiting task is cancelled.
+    It is routed through LLM_POOL; raises LLMOverloaded (instead of returning an error string)
+    when no endpoint can take it, so the API can answer 429/503 with Retry-After.
+    `system` is sent as a separate leading system message, followed by the `history` messages;
+    if `usage` is given it receives Ollama's prompt_tokens / completion_tokens for the call.
     """
-    print(f"--- Sending request to Ollama API (Model: {model}) ---")
-    # print(f"--- Prompt Start ---\n{prompt}\n--- Prompt End ---") # Uncomment for verbose debugging
+    logger.debug("Sending request to Ollama API (Model: %s)", model)
+    logger.debug("Prompt:\n%s", prompt)
+    start_time = time.perf_counter()
+    purpose = "answer"
+    status = "error"
 
     try:
         # Base payload structure
-        payload = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": False
-        }
+        payload = chat_payload(prompt, model, stream=False, system=system, history=history)
 
         # --- ** FIX: Adjust payload based on prompt type ** ---
         # Check if it's the analysis prompt
-        is_analysis_prompt = ("Possible Intents:" in prompt and "JSON Response:" in prompt)
+        is_analysis_prompt = ("Possible Intents" in prompt and "Respond ONLY with the JSON object:" in prompt)
 
         if is_analysis_prompt:
              payload["format"] = "json" # Explicitly request JSON for analysis
-             print("--- Requesting JSON format from Ollama for analysis prompt ---")
+             purpose = "analysis"
+             logger.debug("Requesting JSON format from Ollama for analysis prompt")
         else:
              # For regular RAG prompts, ensure 'format' is not present or default
              payload.pop("format", None) # Remove format key if it exists
-             print("--- Requesting default format from Ollama for RAG prompt ---")
+             logger.debug("Requesting default format from Ollama for RAG prompt")
         # --- ** END FIX ** ---
 
-
-        headers = {'Content-Type': 'application/json'}
-        print(f"--- Sending payload: {json.dumps(payload, indent=2)} ---") # Log the payload being sent
-        response = requests.post(OLLAMA_CHAT_API_URL, headers=headers, json=payload)
+        response = await LLM_POOL.post(get_http_client(), OLLAMA_CHAT_PATH, payload)
         response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
         data = response.json()
+        status = "ok"
+        record_ollama_usage(purpose, data)
+        record_usage(usage, data)
 
         # Handle response based on whether JSON format was requested
         if is_analysis_prompt:
@@ -56,60 +196,200 @@ def get_ollama_response(prompt: str, model: str = "llama3.2:3b") -> str:
                  message_content_str = data.get('message', {}).get('content')
                  if message_content_str:
                      # Return the raw string - parsing happens in analyze_query_intent
-                     print("--- Received JSON formatted response string from Ollama ---")
+                     logger.debug("Received JSON formatted response string from Ollama")
                      return message_content_str.strip()
                  else:
                      # Log the actual response if content is missing
-                     print(f"--- Ollama response missing content field (JSON format requested). Full response: {data} ---")
+                     logger.warning(f"Ollama response missing content field (JSON format requested). Full response: {data}")
                      raise ValueError("Content field missing in Ollama JSON response")
              except Exception as e:
-                  print(f"--- Error processing JSON formatted response: {e}. Full response: {data} ---")
+                  logger.error(f"Error processing JSON formatted response: {e}. Full response: {data}")
                   return f"Error: Could not process JSON response from LLM. Details: {e}"
         else:
             # Standard extraction for non-JSON format (natural language) responses
             message_content = data.get('message', {}).get('content')
             if message_content:
-                print("--- Received valid text response from Ollama ---")
+                logger.debug("Received valid text response from Ollama")
                 return message_content.strip()
             else:
-                print(f"--- Ollama response missing content field. Full response: {data} ---")
+                logger.warning(f"Ollama response missing content field. Full response: {data}")
                 return "Error: Received an empty response from the language model."
 
 
-    except requests.exceptions.ConnectionError as e:
-        print(f"--- Ollama Connection Error: {e} ---")
-        return f"Error: Could not connect to Ollama service at {OLLAMA_CHAT_API_URL}. Is Ollama running?"
-    except requests.exceptions.RequestException as e:
-        print(f"--- Ollama Request Error: {e} ---")
+    except httpx.ConnectError as e:
+        status = "connect_error"
+        logger.error(f"Ollama Connection Error: {e}")
+        return f"Error: Could not connect to Ollama service at {OLLAMA_ENDPOINTS_DISPLAY}. Is Ollama running?"
+    except httpx.TimeoutException as e:
+        status = "timeout"
+        logger.error(f"Ollama Timeout: {e!r}")
+        return "Error: The language model took too long to respond. Please try again."
+    except LLMOverloaded:
+        status = "rejected"
+        raise
+    except httpx.HTTPError as e:
+        logger.error(f"Ollama Request Error: {e}")
         error_detail = str(e)
-        if e.response is not None:
+        if isinstance(e, httpx.HTTPStatusError):
             try:
                 # Log the error response text from Ollama if available
-                print(f"--- Ollama Error Response Body: {e.response.text} ---")
+                logger.error(f"Ollama Error Response Body: {e.response.text}")
                 error_detail += f" | Response: {e.response.text}"
             except Exception:
                 pass # Ignore if response text isn't readable
         return f"Error: Failed to get response from Ollama. {error_detail}"
     except json.JSONDecodeError as e:
-        print(f"--- Ollama JSON Decode Error: {e} ---")
-        print(f"--- Raw response text from Ollama: {response.text if 'response' in locals() else 'N/A'} ---")
+        status = "error"
+        logger.error(f"Ollama JSON Decode Error: {e}")
+        logger.error(f"Raw response text from Ollama: {response.text if 'response' in locals() else 'N/A'}")
         return "Error: Could not understand the response format from Ollama."
     except Exception as e:
-        print(f"--- An unexpected error occurred in get_ollama_response: {e} ---")
-        # import traceback
-        # traceback.print_exc()
+        logger.exception(f"An unexpected error occurred in get_ollama_response: {e}")
         return "Error: An unexpected error occurred while processing the LLM request."
+    finally:
+        LLM_REQUESTS_TOTAL.labels(purpose=purpose, status=status).inc()
+        if status != "rejected":
+            observe_stage(f"llm_{purpose}", time.perf_counter() - start_time)
+
+
+# ======================================================
+# == FUNCTION TO STREAM OLLAMA RESPONSE ==
+# ======================================================
+async def stream_ollama_response(prompt: str, model: str = "llama3.2:3b", system: str | None = None,
+                                 usage: dict | None = None, history: list[dict] | None = None):
+    """
+    Async generator version of get_ollama_response for RAG prompts.
+    Sends the prompt with "stream": True and yields each content chunk as Ollama produces it,
+    so the first tokens reach the caller long before generation finishes.
+    Errors are yielded as a single "Error: ..." chunk, matching get_ollama_response;
+    LLMOverloaded is raised (before anything is yielded) when no endpoint can take the request.
+    `system`, `history` and `usage` work as in get_ollama_response (usage is filled when the stream completes).
+    """
+    logger.debug("Streaming request to Ollama API (Model: %s)", model)
+    logger.debug("Prompt:\n%s", prompt)
+    start_time = time.perf_counter()
+    first_token = True
+    status = "error"
+    payload = chat_payload(prompt, model, stream=True, system=system, history=history)
+
+    try:
+        async with LLM_POOL.stream(get_http_client(), OLLAMA_CHAT_PATH, payload) as response:
+            if response.is_error:
+                body = (await response.aread()).decode(errors="replace")
+                logger.error(f"Ollama Error Response Body: {body}")
+                yield f"Error: Failed to get response from Ollama. Status {response.status_code} | Response: {body}"
+                return
+
+            # Ollama streams one JSON object per line
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    logger.error(f"Ollama stream error: {chunk['error']}")
+                    yield f"Error: {chunk['error']}"
+                    return
+                content = chunk.get('message', {}).get('content')
+                if content:
+                    if first_token:
+                        observe_stage("llm_ttft", time.perf_counter() - start_time)
+                        first_token = False
+                    yield content
+                if chunk.get("done"):
+                    status = "ok"
+                    record_ollama_usage("answer", chunk)
+                    record_usage(usage, chunk)
+                    logger.debug("Ollama stream finished")
+                    return
+
+    except httpx.ConnectError as e:
+        status = "connect_error"
+        logger.error(f"Ollama Connection Error: {e}")
+        yield f"Error: Could not connect to Ollama service at {OLLAMA_ENDPOINTS_DISPLAY}. Is Ollama running?"
+    except httpx.TimeoutException as e:
+        status = "timeout"
+        logger.error(f"Ollama Timeout: {e!r}")
+        yield "Error: The language model took too long to respond. Please try again."
+    except httpx.HTTPError as e:
+        logger.error(f"Ollama Request Error: {e}")
+        yield f"Error: Failed to get response from Ollama. {e}"
+    except json.JSONDecodeError as e:
+        logger.error(f"Ollama JSON Decode Error in stream: {e}")
+        yield "Error: Could not understand the response format from Ollama."
+    except LLMOverloaded:
+        status = "rejected"
+        raise
+    except (GeneratorExit, asyncio.CancelledError):
+        # The client disconnected and the generator was closed mid-stream
+        status = "cancelled"
+        raise
+    finally:
+        LLM_REQUESTS_TOTAL.labels(purpose="answer", status=status).inc()
+        if status != "rejected":
+            observe_stage("llm_answer", time.perf_counter() - start_time)
 
 
 # ======================================================
 # == QUERY ANALYSIS FUNCTION (FROM STEP 14.2) ==
 # ======================================================
-def analyze_query_intent(user_query: str) -> dict:
+async def analyze_query_intent(user_query: str, known_skills=(), known_names=(), store_version=None) -> dict:
+    """
+    Identifies the query's intent and extracts criteria.
+    Order: cached result for the normalized query -> rule-based fast path
+    (when confident) -> LLM analysis. `known_skills` / `known_names` are the
+    lower-cased vocabularies of the loaded candidates, used by the fast path;
+    pass the candidate `store_version` they came from so cached analyses are
+    dropped when the vocabulary changes.
+    Returns a dictionary with the structured analysis.
+    """
+    with stage_timer("intent_analysis"):
+        _check_store_version(store_version)
+        return await _resolve_query_intent(user_query, known_skills, known_names)
+
+
+def _check_store_version(store_version):
+    """Clears the analysis cache when the candidate store (and so the skill/name vocabulary) changed."""
+    global _analysis_store_version
+    if store_version is None or store_version == _analysis_store_version:
+        return
+    if _analysis_store_version is not None:
+        logger.info(f"Candidate store changed ({_analysis_store_version} -> {store_version}). Clearing query analysis cache.")
+        ANALYSIS_CACHE.clear()
+    _analysis_store_version = store_version
+
+
+async def _resolve_query_intent(user_query: str, known_skills, known_names) -> dict:
+    cache_key = normalize_query(user_query)
+    cached = ANALYSIS_CACHE.get(cache_key)
+    if cached is not None:
+        logger.debug("Query analysis cache hit for '%s'", cache_key)
+        QUERY_ANALYSIS_TOTAL.labels(source="cache").inc()
+        result = copy.deepcopy(cached)
+        result["original_query"] = user_query
+        return result
+
+    analysis, confidence = fast_analyze_query(user_query, known_skills, known_names)
+    if confidence >= INTENT_FAST_PATH_MIN_CONFIDENCE:
+        logger.debug("Rule-based query analysis (confidence %.2f): %s", confidence, analysis)
+        QUERY_ANALYSIS_TOTAL.labels(source="rules").inc()
+        ANALYSIS_CACHE.set(cache_key, copy.deepcopy(analysis))
+        return analysis
+
+    logger.debug("Rule-based analysis not confident (%.2f). Falling back to LLM.", confidence)
+    QUERY_ANALYSIS_TOTAL.labels(source="llm").inc()
+    analysis = await analyze_query_intent_with_llm(user_query)
+    # Only successfully parsed LLM analyses are cached, so transient failures are retried
+    if analysis["criteria"]:
+        ANALYSIS_CACHE.set(cache_key, copy.deepcopy(analysis))
+    return analysis
+
+
+async def analyze_query_intent_with_llm(user_query: str) -> dict:
     """
     Uses the LLM to analyze the user's query, identify intent, and extract criteria.
     Returns a dictionary with the structured analysis.
     """
-    print(f"\n--- Analyzing Query Intent for: '{user_query}' ---")
+    logger.debug("Analyzing Query Intent for: '%s'", user_query)
 
     analysis_prompt = f"""Analyze the following user query to understand the primary intent and extract relevant criteria mentioned for searching candidate data.
 
@@ -151,9 +431,9 @@ Respond ONLY with the JSON object:
 """
 
     # Use the modified get_ollama_response function, which now requests JSON format for this prompt
-    raw_analysis_response = get_ollama_response(prompt=analysis_prompt, model="llama3.2:3b") # Explicitly passing model again
+    raw_analysis_response = await get_ollama_response(prompt=analysis_prompt, model="llama3.2:3b") # Explicitly passing model again
 
-    print(f"--- Raw Analysis Response from LLM: {raw_analysis_response} ---")
+    logger.debug("Raw Analysis Response from LLM: %s", raw_analysis_response)
 
     # --- Attempt to parse the LLM's response string as JSON ---
     structured_analysis = {
@@ -185,17 +465,17 @@ Respond ONLY with the JSON object:
 
                     structured_analysis["criteria"]["candidate_names"] = criteria.get("candidate_names", [])
                 else:
-                     print("--- Warning: 'criteria' field in LLM JSON response was not an object. ---")
+                     logger.warning("'criteria' field in LLM JSON response was not an object.")
             else:
-                 print("--- Warning: LLM JSON response was not an object. ---")
+                 logger.warning("LLM JSON response was not an object.")
 
-            print(f"--- Parsed Query Analysis: {structured_analysis} ---")
+            logger.debug("Parsed Query Analysis: %s", structured_analysis)
 
         except json.JSONDecodeError:
-            print(f"--- Error: LLM analysis response was not valid JSON. Raw: '{raw_analysis_response}'. Using default analysis. ---")
+            logger.error(f"LLM analysis response was not valid JSON. Raw: '{raw_analysis_response}'. Using default analysis.")
         except Exception as e:
-            print(f"--- Error processing LLM analysis response: {e}. Raw: '{raw_analysis_response}'. Using default analysis. ---")
+            logger.error(f"Error processing LLM analysis response: {e}. Raw: '{raw_analysis_response}'. Using default analysis.")
     else:
-         print(f"--- LLM call for analysis failed or returned unexpected type: {type(raw_analysis_response)}. Using default analysis. ---")
+         logger.error(f"LLM call for analysis failed or returned unexpected type: {type(raw_analysis_response)}. Using default analysis.")
 
     return structured_analysis
\ No newline at end of file
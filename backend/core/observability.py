@@ -0,0 +1,212 @@
+# --- Imports ---
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# --- Logging configuration ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for human-readable lines, "json" for one JSON object per line (log shippers)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON, including any `extra={...}` fields."""
+    _RESERVED = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in record.__dict__.items() if k not in self._RESERVED})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """
+    Sets up the root logger once, from LOG_LEVEL and LOG_FORMAT.
+    Safe to call more than once (later calls only adjust the level).
+    """
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    if getattr(configure_logging, "_configured", False):
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    # httpx logs every Ollama request at INFO; the request counters cover that
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    configure_logging._configured = True
+
+
+# --- Metrics ---
+# Set by run_server.py with --workers > 1: every process (API workers and the embedding service) writes its
+# metrics to files in this directory and /metrics aggregates them, whichever worker answers the scrape.
+# Gauges declare how their per-process values are combined (multiprocess_mode; ignored in a single process).
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# Buckets span fast in-process stages (ms) up to full 3B-model generations (tens of seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+STAGE_SECONDS = Histogram(
+    "hr_chat_stage_seconds", "Latency of each chat pipeline stage",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "hr_chat_request_seconds", "End-to-end /api/chat handling time until the response starts",
+    ["mode"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_TOTAL = Counter(
+    "hr_chat_requests_total", "Chat requests by outcome",
+    ["outcome"],
+)
+LLM_REQUESTS_TOTAL = Counter(
+    "hr_llm_requests_total", "Calls to the Ollama /api/chat endpoint",
+    ["purpose", "status"],
+)
+LLM_TOKENS_TOTAL = Counter(
+    "hr_llm_tokens_total", "Tokens reported by Ollama (prompt_eval_count / eval_count)",
+    ["purpose", "kind"],
+)
+LLM_TOKENS_PER_REQUEST = Histogram(
+    "hr_llm_tokens_per_request", "Tokens per Ollama call",
+    ["purpose", "kind"], buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192),
+)
+QUERY_ANALYSIS_TOTAL = Counter(
+    "hr_query_analysis_total", "Query analyses by source",
+    ["source"],
+)
+QUERY_BATCH_SIZE = Histogram(
+    "hr_embedding_batch_size", "Queries encoded per batched forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+LLM_ENDPOINT_OUTSTANDING = Gauge(
+    "hr_llm_endpoint_outstanding", "Requests in flight per Ollama endpoint",
+    ["endpoint"], multiprocess_mode="livesum",
+)
+LLM_ENDPOINT_AVAILABLE = Gauge(
+    "hr_llm_endpoint_available", "1 if the Ollama endpoint is healthy and not ejected",
+    ["endpoint"], multiprocess_mode="livemin",
+)
+LLM_QUEUE_DEPTH = Gauge("hr_llm_queue_depth", "Requests waiting for a free Ollama endpoint slot",
+                        multiprocess_mode="livesum")
+LLM_REJECTIONS_TOTAL = Counter(
+    "hr_llm_rejections_total", "LLM requests rejected by admission control",
+    ["reason"],
+)
+LLM_RETRIES_TOTAL = Counter(
+    "hr_llm_retries_total", "LLM requests retried after a failure, by failing endpoint",
+    ["endpoint"],
+)
+CANDIDATE_STORE_VERSION = Gauge("hr_candidate_store_version", "Version of the served candidate set (bumped on every update)",
+                                multiprocess_mode="livemax")
+CANDIDATES_LOADED = Gauge("hr_candidates", "Candidates in the served candidate set",
+                          multiprocess_mode="livemostrecent")
+PROMPT_TOKENS = Histogram(
+    "hr_prompt_tokens", "Estimated tokens per answer prompt, by part (system/context/question/total)",
+    ["part"], buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+)
+PROMPT_CONTEXT_TRIMMED_TOTAL = Counter(
+    "hr_prompt_context_trimmed_total", "Candidate summaries truncated/dropped and candidates dropped to fit the context budget",
+    ["kind"],
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Times the wrapped block into hr_chat_stage_seconds{stage=...}; works around awaits too."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def observe_stage(stage: str, seconds: float):
+    """Records a stage duration measured elsewhere (e.g. reported by Ollama)."""
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def record_ollama_usage(purpose: str, data: dict):
+    """Records token counts and server-side timings from an Ollama final response/chunk."""
+    for kind, field in (("prompt", "prompt_eval_count"), ("completion", "eval_count")):
+        count = data.get(field)
+        if isinstance(count, int):
+            LLM_TOKENS_TOTAL.labels(purpose=purpose, kind=kind).inc(count)
+            LLM_TOKENS_PER_REQUEST.labels(purpose=purpose, kind=kind).observe(count)
+    # Ollama reports durations in nanoseconds
+    for stage, field in (("llm_prompt_eval", "prompt_eval_duration"), ("llm_eval", "eval_duration"),
+                         ("llm_load", "load_duration")):
+        value = data.get(field)
+        if isinstance(value, int):
+            observe_stage(stage, value / 1e9)
+
+
+# --- Cache statistics (read at scrape time) ---
+_STATS_SOURCES = {}
+
+
+def register_stats_source(name: str, stats_fn):
+    """
+    Exposes a cache's stats() dict (hits, misses, evictions, size) on /metrics
+    as hr_cache_*{cache=name}.
+    """
+    _STATS_SOURCES[name] = stats_fn
+
+
+class _CacheStatsCollector:
+    """
+    Reads the registered stats() at scrape time. These live in process memory, so with several
+    API workers they are the answering worker's (the shared "sessions" store excepted).
+    """
+
+    def collect(self):
+        counters = {field: CounterMetricFamily(f"hr_cache_{field}", f"Cache {field}", labels=["cache"])
+                    for field in ("hits", "misses", "evictions")}
+        size = GaugeMetricFamily("hr_cache_size", "Entries currently cached", labels=["cache"])
+        for name, stats_fn in _STATS_SOURCES.items():
+            stats = stats_fn()
+            for field, family in counters.items():
+                if field in stats:
+                    family.add_metric([name], stats[field])
+            if "size" in stats:
+                size.add_metric([name], stats["size"])
+        yield from counters.values()
+        yield size
+
+
+_CACHE_STATS_COLLECTOR = _CacheStatsCollector()
+REGISTRY.register(_CACHE_STATS_COLLECTOR)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Prometheus text exposition of every registered metric, plus its content type.
+    In multi-process mode the counters, histograms and gauges are aggregated over all processes.
+    """
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_CACHE_STATS_COLLECTOR)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_exited():
+    """Drops this process's live gauges from the multi-process metrics (on shutdown)."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
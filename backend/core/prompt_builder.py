@@ -0,0 +1,188 @@
+# --- Imports ---
+import os
+
+from core.observability import PROMPT_CONTEXT_TRIMMED_TOTAL, PROMPT_TOKENS
+
+# --- Configuration ---
+# Approximate token budget for the candidate context block of the answer prompt
+PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "600"))
+# Skills listed per candidate; the rest are summarized as "+N more" (skills matching the query come first)
+PROMPT_MAX_SKILLS = int(os.getenv("PROMPT_MAX_SKILLS", "12"))
+# Summaries shorter than this (tokens) after truncation are dropped rather than cut to a stub
+PROMPT_MIN_SUMMARY_TOKENS = int(os.getenv("PROMPT_MIN_SUMMARY_TOKENS", "8"))
+# Approximate token budget for earlier conversation turns sent with a follow-up question
+PROMPT_HISTORY_TOKEN_BUDGET = int(os.getenv("PROMPT_HISTORY_TOKEN_BUDGET", "400"))
+# Per-message overhead of the chat template (role header and separators), in tokens
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+# --- System prompt ---
+# Byte-identical on every request: it is the first message, so Ollama can reuse its KV cache
+# for this whole prefix and only evaluate the per-request context and question.
+# Do not interpolate anything into it.
+SYSTEM_PROMPT = """You are an HR assistant chatbot. Answer the user's question strictly and only from the candidate context given with it.
+
+Rules:
+1. Use only information stated in the context. List all relevant candidates or details found.
+2. Do not add information that is not in the context. Do not make assumptions or use outside knowledge.
+3. If the context does not contain the information needed, reply "I cannot answer the question based on the provided candidate information." and nothing else.
+4. Earlier turns of the conversation may come before the question. Use them only to understand what the question refers to (e.g. "them"); the facts must come from the context.
+
+The context lists one candidate per line, most relevant first:
+- Name | experience | skills | summary
+
+Example:
+Context:
+- Frank | 4 years | Skills: Java, Spring
+- Grace | 6 years | Skills: Java, Kubernetes
+Question: Which candidates know Java?
+Answer: Based on the provided context, the candidates who know Java are Frank and Grace."""
+
+NO_CONTEXT_TEXT = "No relevant candidate information was found for the query."
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate Llama token count (~4 characters per token for English text).
+    Used for budgeting before the request; Ollama's prompt_eval_count is the exact figure.
+    """
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts `text` at a word boundary so it fits in about `max_tokens`, marking the cut with '...'."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max(0, max_tokens * 4 - 3)]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(" ,.;:") + "..."
+
+
+def _skills_text(skills, priority_skills: set) -> str:
+    """Skills with the ones the query asked for first, capped at PROMPT_MAX_SKILLS."""
+    skills = [str(s) for s in skills or [] if str(s).strip()]
+    if not skills:
+        return ""
+    ordered = sorted(skills, key=lambda s: str(s).strip().lower() not in priority_skills)
+    shown = ordered[:PROMPT_MAX_SKILLS]
+    text = "Skills: " + ", ".join(shown)
+    if len(ordered) > len(shown):
+        text += f" (+{len(ordered) - len(shown)} more)"
+    return text
+
+
+def _candidate_head(candidate: dict, priority_skills: set) -> str:
+    """Name, experience and skills: the part of a candidate line that is never truncated."""
+    parts = [str(candidate.get('candidate_name', 'N/A'))]
+    experience = candidate.get('experience_years')
+    parts.append(f"{experience} years" if experience is not None else "experience N/A")
+    skills = _skills_text(candidate.get('skills', []), priority_skills)
+    if skills:
+        parts.append(skills)
+    return "- " + " | ".join(parts)
+
+
+def build_context(candidates: list[dict], token_budget: int = PROMPT_CONTEXT_TOKEN_BUDGET,
+                  priority_skills=()) -> tuple[str, dict]:
+    """
+    Compact context block for the answer prompt, within about `token_budget` tokens.
+    Candidates are ranked by similarity_score (when present). Every included candidate gets its
+    name / experience / skills line; the remaining budget goes to summaries in relevance order,
+    so lower-ranked summaries are shortened or dropped first. Candidates whose head line no
+    longer fits are left out (the best match is always kept).
+    Returns (text, stats) where stats counts what was trimmed.
+    """
+    stats = {"candidates": len(candidates or []), "included": 0, "summaries_truncated": 0, "summaries_dropped": 0}
+    if not candidates:
+        return NO_CONTEXT_TEXT, stats
+
+    ranked = sorted(candidates, key=lambda c: c.get('similarity_score', 0), reverse=True)
+    priority = {str(s).strip().lower() for s in priority_skills or ()}
+
+    heads, used = [], 0
+    for candidate in ranked:
+        head = _candidate_head(candidate, priority)
+        cost = estimate_tokens(head) + 1  # + newline
+        if heads and used + cost > token_budget:
+            break
+        heads.append((candidate, head))
+        used += cost
+    stats["included"] = len(heads)
+
+    lines = []
+    for candidate, head in heads:
+        summary = str(candidate.get('summary') or "").strip()
+        if summary:
+            remaining = token_budget - used
+            cost = estimate_tokens(" | " + summary)
+            if cost <= remaining:
+                head += " | " + summary
+                used += cost
+            elif remaining - 1 >= PROMPT_MIN_SUMMARY_TOKENS:
+                short = truncate_to_tokens(summary, remaining - 1)
+                head += " | " + short
+                used += estimate_tokens(" | " + short)
+                stats["summaries_truncated"] += 1
+            else:
+                stats["summaries_dropped"] += 1
+        lines.append(head)
+
+    for kind in ("summaries_truncated", "summaries_dropped"):
+        if stats[kind]:
+            PROMPT_CONTEXT_TRIMMED_TOTAL.labels(kind=kind).inc(stats[kind])
+    dropped = stats["candidates"] - stats["included"]
+    if dropped:
+        PROMPT_CONTEXT_TRIMMED_TOTAL.labels(kind="candidates_dropped").inc(dropped)
+    return "\n".join(lines), stats
+
+
+def history_window(turns, token_budget: int = PROMPT_HISTORY_TOKEN_BUDGET) -> list[dict]:
+    """
+    Chat messages for the most recent (question, reply) turns that fit in about `token_budget`
+    tokens, oldest first. Whole turns are dropped from the oldest end, so a reply never loses
+    the question it answers.
+    """
+    turns = list(turns)
+    messages, used = [], 0
+    for question, reply in reversed(turns):
+        cost = estimate_tokens(question) + estimate_tokens(reply) + 2 * _MESSAGE_OVERHEAD_TOKENS
+        if used + cost > token_budget:
+            break
+        messages[:0] = [{"role": "user", "content": question}, {"role": "assistant", "content": reply}]
+        used += cost
+    dropped = len(turns) - len(messages) // 2
+    if dropped:
+        PROMPT_CONTEXT_TRIMMED_TOTAL.labels(kind="history_turns_dropped").inc(dropped)
+    return messages
+
+
+class RagPrompt:
+    """
+    The chat messages sent for an answer: the fixed SYSTEM_PROMPT, the conversation history
+    window (follow-up questions only) and a per-request user message (context + question),
+    with estimated token counts for each part.
+    """
+
+    def __init__(self, context: str, question: str, history: list[dict] = ()):
+        self.system = SYSTEM_PROMPT
+        self.history = list(history)
+        self.user = f"Context:\n{context}\n\nQuestion: {question}"
+        self.tokens = {
+            "system": estimate_tokens(self.system),
+            "history": sum(estimate_tokens(m["content"]) + _MESSAGE_OVERHEAD_TOKENS for m in self.history),
+            "context": estimate_tokens(context),
+            "question": estimate_tokens(question),
+        }
+        self.tokens["total"] = self.tokens["system"] + self.tokens["history"] + estimate_tokens(self.user)
+
+    def observe(self):
+        """Records the per-part token estimates on /metrics."""
+        for part, count in self.tokens.items():
+            PROMPT_TOKENS.labels(part=part).observe(count)
+
+
+def build_rag_prompt(question: str, context: str, history: list[dict] = ()) -> RagPrompt:
+    """Builds the answer prompt for a formatted context block (see build_context) and history window."""
+    prompt = RagPrompt(context, question, history)
+    prompt.observe()
+    return prompt
@@ -1,164 +1,666 @@
 # --- Imports ---
-from sentence_transformers import SentenceTransformer, util
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import logging
 import numpy as np
+import os
+import queue
+import threading
 import time
-import torch
+
+from core.candidate_table import CandidateTable, CandidateView
+from core.candidates import build_candidate_text, load_candidate_data, save_candidate_data
+from core.embedding_service import EmbeddingServiceClient, EmbeddingServiceError
+from core.embedding_store import EmbeddingStore
+from core.filter_index import CandidateFilterIndex
+from core.observability import CANDIDATE_STORE_VERSION, CANDIDATES_LOADED, QUERY_BATCH_SIZE, observe_stage, stage_timer
+from core.prompt_builder import PROMPT_CONTEXT_TOKEN_BUDGET, build_context
+from core.vector_index import create_index, filtered_search
+
+logger = logging.getLogger(__name__)
+
+
+
+class CandidateSnapshot:
+    """
+    One immutable generation of the candidate set and everything derived from it:
+    - candidates: CandidateTable (columnar), row-aligned with embeddings (see core/candidate_table.py)
+    - embeddings: (n, dim) normalized matrix, memory-mapped from the embedding store
+    - index: search structure over embeddings (see core/vector_index.py)
+    - filter_index: skill/name/experience indexes over candidates (see core/filter_index.py)
+    - version: store version of the embedding store generation, bumped on every change
+      (used for cache invalidation; the same in every worker that maps that generation)
+
+    Updates build a complete new snapshot and then swap the SNAPSHOT reference, so a request
+    that read SNAPSHOT once keeps a consistent view even if an update lands mid-request.
+    Never mutate a published snapshot.
+    """
+
+    def __init__(self, candidates: CandidateTable, embeddings=None, index=None, filter_index=None, version: int = 0):
+        self.candidates = candidates
+        self.embeddings = embeddings
+        self.index = index
+        self.filter_index = filter_index
+        self.version = version
+
+    @property
+    def rows_by_id(self) -> dict:
+        return self.candidates.rows_by_id
+
+
+class CandidateStoreError(RuntimeError):
+    """Raised when the candidate set can't be updated (e.g. the embedding model isn't loaded)."""
+
 
 # --- Global variables ---
-SAMPLE_CANDIDATES_WITH_EMBEDDINGS = []
-embedding_model = None
+SNAPSHOT = CandidateSnapshot(CandidateTable([]))  # Current candidate generation; replaced wholesale, never modified
+EMBEDDING_STORE = None            # Persistent embedding store backing SNAPSHOT.embeddings
+embedding_model = None            # SentenceTransformer, or EmbeddingServiceClient in API-worker mode
+# Startup progress: stage is not_started -> loading_model/waiting_for_embedding_service -> syncing_store/mapping_store
+# -> warming_up -> ready (or failed, with error)
+LOAD_PROGRESS = {"stage": "not_started", "encoded": 0, "to_encode": 0, "error": None}
+# Serializes candidate updates (readers never take it)
+_UPDATE_LOCK = threading.Lock()
 
 # --- Constants for Retrieval ---
 TOP_N = 3
 SIMILARITY_THRESHOLD = 0.35 # Keeping the value you found worked better
+# How many best semantic matches the criteria-independent search stage keeps for later filtering
+SEMANTIC_POOL_SIZE = int(os.getenv("SEMANTIC_POOL_SIZE", "50"))
+
+# --- Worker pool for CPU-bound retrieval work (encoding, scoring) ---
+# torch and numpy release the GIL, so threads keep this work off the event loop without extra processes
+RAG_WORKER_THREADS = int(os.getenv("RAG_WORKER_THREADS", str(min(4, os.cpu_count() or 1))))
+RAG_EXECUTOR = ThreadPoolExecutor(max_workers=RAG_WORKER_THREADS, thread_name_prefix="rag")
+
+# --- Query embedding micro-batching ---
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+
+# --- Embedding configuration ---
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+# --- Multi-worker mode (see core/embedding_service.py) ---
+# When set, this process doesn't load the model: it maps the store read-only and uses the embedding service
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET", "")
+# How often API workers check whether the embedding service published a new store generation
+EMBEDDING_STORE_POLL_SECONDS = float(os.getenv("EMBEDDING_STORE_POLL_SECONDS", "2"))
+
+
+def encode_texts(texts: list[str]) -> np.ndarray:
+    """Batch-encodes texts into L2-normalized float32 vectors."""
+    return embedding_model.encode(
+        texts,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        show_progress_bar=len(texts) > EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True
+    )
+
+
+# ======================================================
+# == QUERY EMBEDDING SERVICE (dynamic micro-batching) ==
+# ======================================================
+class QueryEmbeddingBatcher:
+    """
+    Collects concurrent query-encoding requests and runs them as one batched
+    forward pass on a dedicated thread.
+
+    The thread waits for a first request, then keeps collecting for up to
+    `max_wait_ms` or until `max_batch` requests are pending, encodes them together
+    and resolves each caller's Future. Under load this replaces many batch-size-1
+    MiniLM passes with a few larger ones; when idle a lone query waits at most `max_wait_ms`.
+    """
+
+    def __init__(self, encode_fn, max_batch: int = EMBEDDING_MAX_BATCH, max_wait_ms: float = EMBEDDING_MAX_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batch_size_counts = {}  # batch size -> number of batches (histogram)
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+                    self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Queues one text; the returned Future resolves to its normalized embedding."""
+        self._ensure_started()
+        future = Future()
+        self._pending.put((text, future))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(text).result()
+
+    def _collect(self) -> list:
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Skip callers that gave up (cancelled) while queued
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            QUERY_BATCH_SIZE.observe(len(batch))
+            start_time = time.perf_counter()
+            try:
+                vectors = self.encode_fn([text for text, _ in batch])
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                logger.error(f"Error encoding query batch of {len(batch)}: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+            observe_stage("embedding_batch", time.perf_counter() - start_time)
+            with self._stats_lock:
+                self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+                self.batches += 1
+                self.items += len(batch)
+
+    def stats(self) -> dict:
+        """Batch-size histogram and totals since startup."""
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": (self.items / self.batches) if self.batches else 0.0,
+                "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
 
-# --- Initialization Function (Loads model, generates embeddings) ---
-def initialize_embeddings():
-    global embedding_model, SAMPLE_CANDIDATES_WITH_EMBEDDINGS
-    SAMPLE_CANDIDATES_DATA = [
-        {"candidate_id": "c1", "candidate_name": "Alice", "skills": ["Python", "SQL", "AWS"], "experience_years": 5, "summary": "Dev focused on backend systems."},
-        {"candidate_id": "c2", "candidate_name": "Bob", "skills": ["Java", "Spring", "Docker"], "experience_years": 7, "summary": "Java dev with cloud experience."},
-        {"candidate_id": "c3", "candidate_name": "Charlie", "skills": ["Python", "Flask", "React"], "experience_years": 3, "summary": "Full-stack dev, strong in Python."},
-        {"candidate_id": "c4", "candidate_name": "Diana", "skills": ["Python", "AWS", "Terraform"], "experience_years": 6, "summary": "Cloud engineer with Python scripting."},
-    ]
-    print("Loading sentence transformer model (all-MiniLM-L6-v2)...")
+EMBEDDING_BATCHER = QueryEmbeddingBatcher(lambda texts: encode_texts(texts))
+
+
+def _publish(snapshot: CandidateSnapshot):
+    """Makes `snapshot` the one new requests read (a single reference assignment)."""
+    global SNAPSHOT
+    SNAPSHOT = snapshot
+    CANDIDATE_STORE_VERSION.set(snapshot.version)
+    CANDIDATES_LOADED.set(len(snapshot.candidates))
+
+
+def _snapshot_from_store(candidates: list[dict], previous_index=None) -> CandidateSnapshot:
+    """
+    Builds the candidate table and the indexes over the loaded store generation, whose rows are
+    aligned with `candidates`. The record dicts are not kept: the snapshot holds columns only.
+    """
+    matrix = EMBEDDING_STORE.matrix
+    index = None
+    if matrix is not None:
+        index = create_index(matrix, cache_dir=EMBEDDING_STORE.generation_dir, previous=previous_index)
+    table = CandidateTable(candidates)
+    logger.info(f"Candidate table: {len(table)} rows, {table.nbytes / 1e6:.1f} MB, "
+                f"{len(table.skill_vocabulary)} distinct skills")
+    return CandidateSnapshot(table, matrix, index, CandidateFilterIndex(table), EMBEDDING_STORE.version)
+
+
+def _build_snapshot(candidates: list[dict], previous_index=None, encode_fn=None) -> CandidateSnapshot:
+    """
+    Syncs the embedding store to `candidates` (only new or changed texts are encoded, in batches;
+    the records are stored with the generation for API workers) and builds the indexes for a new
+    snapshot. Must be called with _UPDATE_LOCK held (or at startup).
+    """
+    EMBEDDING_STORE.sync(
+        [c['candidate_id'] for c in candidates],
+        [build_candidate_text(c) for c in candidates],
+        encode_fn or encode_texts,
+        records=candidates
+    )
+    return _snapshot_from_store(candidates, previous_index)
+
+
+# --- API-worker mode: follow the generations the embedding service writes ---
+def _reload_published_store() -> bool:
+    """
+    Maps the generation CURRENT points at (with its stored records) and publishes it if it is newer
+    than the loaded one. Returns True if a new snapshot was published. Called with _UPDATE_LOCK held.
+    """
+    previous = EMBEDDING_STORE.generation
+    if previous is not None and EMBEDDING_STORE.current_generation() == previous:
+        return False
+    if not EMBEDDING_STORE.load():
+        return False
+    candidates = EMBEDDING_STORE.load_records()
+    if candidates is None:
+        # Generations written without records (older stores) line up with the candidates file
+        candidates = load_candidate_data()
+    if [c['candidate_id'] for c in candidates] != EMBEDDING_STORE.ids.tolist():
+        # Most likely the generation was replaced while we read it; the next poll picks up the new one
+        logger.warning(f"Records of store generation {EMBEDDING_STORE.generation} don't match its rows. Not loading it.")
+        EMBEDDING_STORE.generation = previous  # so the next poll tries again
+        return False
+    _publish(_snapshot_from_store(candidates, previous_index=SNAPSHOT.index))
+    logger.info(f"Mapped store generation {EMBEDDING_STORE.generation} (version {SNAPSHOT.version}, "
+                f"{len(SNAPSHOT.candidates)} candidates)")
+    return True
+
+
+def _watch_published_store():
+    while True:
+        time.sleep(EMBEDDING_STORE_POLL_SECONDS)
+        try:
+            if EMBEDDING_STORE.current_generation() != EMBEDDING_STORE.generation:
+                with _UPDATE_LOCK:
+                    _reload_published_store()
+        except Exception as e:
+            logger.error(f"Failed to reload the embedding store: {e}")
+
+
+def _initialize_from_service() -> bool:
+    """API-worker startup: no model in this process; waits for the embedding service and maps its store."""
+    global embedding_model, EMBEDDING_STORE
+    logger.info(f"Using the embedding service at {EMBEDDING_SERVICE_SOCKET}...")
+    start_time = time.time()
+    try:
+        LOAD_PROGRESS["stage"] = "waiting_for_embedding_service"
+        client = EmbeddingServiceClient(EMBEDDING_SERVICE_SOCKET)
+        client.wait_ready()
+        LOAD_PROGRESS["stage"] = "mapping_store"
+        EMBEDDING_STORE = EmbeddingStore(model_name=EMBEDDING_MODEL_NAME)
+        with _UPDATE_LOCK:
+            _reload_published_store()
+        embedding_model = client
+        logger.info(f"Embeddings ready for {len(SNAPSHOT.candidates)} candidates in {time.time() - start_time:.2f} seconds.")
+    except Exception as e:
+        logger.critical(f"Could not attach to the embedding service: {e}")
+        return _fail_initialization(f"Embedding service unavailable: {e}")
+    threading.Thread(target=_watch_published_store, name="store-watcher", daemon=True).start()
+    return True
+
+
+def _fail_initialization(error: str) -> bool:
+    global embedding_model
+    embedding_model = None
+    _publish(CandidateSnapshot(CandidateTable([])))
+    LOAD_PROGRESS.update(stage="failed", error=error)
+    return False
+
+
+def _encode_with_progress(texts: list[str]) -> np.ndarray:
+    """encode_texts in slices, so LOAD_PROGRESS shows how far the startup encode has got."""
+    LOAD_PROGRESS.update(encoded=0, to_encode=len(texts))
+    step = EMBEDDING_BATCH_SIZE * 16
+    parts = []
+    for start in range(0, len(texts), step):
+        parts.append(encode_texts(texts[start:start + step]))
+        LOAD_PROGRESS["encoded"] = start + len(parts[-1])
+    return np.concatenate(parts)
+
+
+# --- Initialization Function (Loads model, maps/updates the embedding store) ---
+def initialize_embeddings() -> bool:
+    """
+    Loads the model and brings the embedding store up to date with the candidate data (or, in
+    API-worker mode, attaches to the embedding service). Blocking and slow on a cold start;
+    the app runs it in the background from its lifespan (see core/startup.py).
+    Returns False, with the reason in LOAD_PROGRESS["error"], if embeddings can't be served.
+    """
+    global embedding_model, EMBEDDING_STORE
+    if EMBEDDING_SERVICE_SOCKET:
+        return _initialize_from_service()
+    logger.info(f"Loading sentence transformer model ({EMBEDDING_MODEL_NAME})...")
+    LOAD_PROGRESS["stage"] = "loading_model"
     start_time = time.time()
     try:
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Imported here, off the import path of the app: torch alone takes seconds to load
+        from sentence_transformers import SentenceTransformer
+        embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
         load_time = time.time() - start_time
-        print(f"Sentence transformer model loaded successfully in {load_time:.2f} seconds.")
+        logger.info(f"Sentence transformer model loaded successfully in {load_time:.2f} seconds.")
     except Exception as e:
-        print(f"FATAL ERROR: Could not load sentence transformer model: {e}")
-        embedding_model = None
-        SAMPLE_CANDIDATES_WITH_EMBEDDINGS = []
-        return
-
-    if embedding_model:
-        print("Preparing candidate texts for embedding...")
-        candidate_texts_to_embed = []
-        for candidate in SAMPLE_CANDIDATES_DATA:
-            text = f"Name: {candidate.get('candidate_name', '')}. "
-            skills_text = ', '.join(candidate.get('skills', []))
-            if skills_text: text += f"Skills: {skills_text}. "
-            text += f"Experience: {candidate.get('experience_years', 'N/A')} years. "
-            text += f"Summary: {candidate.get('summary', '')}"
-            candidate_texts_to_embed.append(text.strip())
-
-        print(f"Generating embeddings for {len(candidate_texts_to_embed)} candidate texts...")
+        logger.critical(f"Could not load sentence transformer model: {e}")
+        return _fail_initialization(f"Could not load the embedding model: {e}")
+
+    try:
+        LOAD_PROGRESS["stage"] = "syncing_store"
+        candidates = load_candidate_data()
+        # Only candidates whose text changed since the last run get encoded
+        EMBEDDING_STORE = EmbeddingStore(model_name=EMBEDDING_MODEL_NAME)
+        EMBEDDING_STORE.load()
         start_time = time.time()
-        try:
-            candidate_embeddings_tensor = embedding_model.encode(
-                candidate_texts_to_embed,
-                show_progress_bar=True,
-                convert_to_tensor=True
-            )
-            embed_time = time.time() - start_time
-            print(f"Embeddings generated successfully in {embed_time:.2f} seconds.")
-
-            temp_list = []
-            for i, candidate in enumerate(SAMPLE_CANDIDATES_DATA):
-                enhanced_candidate = candidate.copy()
-                enhanced_candidate['embedding_tensor'] = candidate_embeddings_tensor[i]
-                temp_list.append(enhanced_candidate)
-            SAMPLE_CANDIDATES_WITH_EMBEDDINGS = temp_list
-            print(f"Embeddings stored with candidate data ({len(SAMPLE_CANDIDATES_WITH_EMBEDDINGS)} candidates).")
+        with _UPDATE_LOCK:
+            _publish(_build_snapshot(candidates, encode_fn=_encode_with_progress))
+        logger.info(f"Embeddings ready for {len(SNAPSHOT.candidates)} candidates in {time.time() - start_time:.2f} seconds.")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to prepare candidate embeddings: {e}")
+        return _fail_initialization(f"Could not prepare candidate embeddings: {e}")
+
+
+def warm_up_retrieval() -> bool:
+    """
+    Runs one dummy query through the embedding batcher and the vector index, so the first real
+    request doesn't pay one-time costs (first forward pass, batcher thread start, cold index pages).
+    """
+    LOAD_PROGRESS["stage"] = "warming_up"
+    start_time = time.time()
+    try:
+        search_semantic_pool(encode_query("warm up the candidate search"))
+    except Exception as e:
+        logger.critical(f"Warmup query failed: {e}")
+        LOAD_PROGRESS.update(stage="failed", error=f"Warmup query failed: {e}")
+        return False
+    LOAD_PROGRESS["stage"] = "ready"
+    logger.info(f"Retrieval warmed up in {(time.time() - start_time) * 1000:.0f} ms")
+    return True
 
-        except Exception as e:
-            print(f"ERROR: Failed during embedding generation: {e}")
-            SAMPLE_CANDIDATES_WITH_EMBEDDINGS = []
-    else:
-        print("Embedding model not available. Skipping embedding generation.")
-        SAMPLE_CANDIDATES_WITH_EMBEDDINGS = []
 
-# --- Run initialization on module import ---
-initialize_embeddings()
+def is_ready() -> bool:
+    """True once initialize_embeddings() and warm_up_retrieval() have completed."""
+    return LOAD_PROGRESS["stage"] == "ready"
+
+
+def get_load_progress() -> dict:
+    """Startup stage of the embeddings (with encode progress and the error, if any) for /readyz."""
+    progress = dict(LOAD_PROGRESS)
+    progress["candidates"] = len(SNAPSHOT.candidates)
+    return progress
 
 
 # --- Core Functions ---
 
-# --- MODIFIED FUNCTION DEFINITION AND ADDED PRINT STATEMENT FOR STEP 14.4 ---
-def retrieve_context(query: str, analyzed_query: dict = None) -> list[dict]:
+def get_query_vocabulary() -> tuple:
+    """
+    (known skills, known names) of the loaded candidates, lower-cased,
+    for the rule-based query analyzer. Empty until candidates are loaded.
+    """
+    filter_index = SNAPSHOT.filter_index
+    if filter_index is None:
+        return (), ()
+    return filter_index.known_skills(), filter_index.known_names()
+
+
+def get_store_version() -> int:
+    """Current candidate store version; changes whenever the candidate set is reloaded or updated."""
+    return SNAPSHOT.version
+
+
+def get_candidate_count() -> int:
+    return len(SNAPSHOT.candidates)
+
+
+def get_embedding_batch_stats() -> dict:
+    """Batch-size histogram of the query embedding service."""
+    return EMBEDDING_BATCHER.stats()
+
+
+def encode_query(query: str) -> np.ndarray | None:
+    """
+    Normalized embedding of a user query, or None if the model isn't loaded.
+    Goes through the micro-batching service, so concurrent callers share forward passes.
+    """
+    if not embedding_model:
+        return None
+    query = str(query) if query is not None else ""
+    with stage_timer("query_encode"):
+        return EMBEDDING_BATCHER.encode(query)
+
+
+async def encode_query_async(query: str) -> np.ndarray | None:
+    """Async encode_query: awaits the batcher's Future without holding a worker thread."""
+    if not embedding_model:
+        return None
+    query = str(query) if query is not None else ""
+    with stage_timer("query_encode"):
+        return await asyncio.wrap_future(EMBEDDING_BATCHER.submit(query))
+
+
+@stage_timer("scoring")
+def search_semantic_pool(query_embedding: np.ndarray):
+    """
+    (indices, scores, store version) of the SEMANTIC_POOL_SIZE best candidates, ignoring criteria.
+    The version ties the row indices to the snapshot they came from (see retrieve_context).
+    """
+    snapshot = SNAPSHOT
+    if query_embedding is None or snapshot.index is None:
+        return None
+    indices, scores = snapshot.index.search(query_embedding, SEMANTIC_POOL_SIZE)
+    return indices, scores, snapshot.version
+
+
+async def semantic_search_async(query: str) -> tuple:
+    """
+    Criteria-independent retrieval stage: encodes the query and returns
+    (query_embedding, (indices, scores, version)) for the SEMANTIC_POOL_SIZE best candidates.
+    Runs in parallel with query analysis; retrieve_context applies the criteria afterwards.
+    The encode is batched with other in-flight queries on the embedding thread,
+    then scoring runs on RAG_EXECUTOR.
+    """
+    query_embedding = await encode_query_async(query)
+    hits = await asyncio.get_running_loop().run_in_executor(RAG_EXECUTOR, search_semantic_pool, query_embedding)
+    return query_embedding, hits
+
+
+def _rows_in_snapshot(snapshot: CandidateSnapshot, candidate_ids: list[str], rows, store_version: int) -> np.ndarray:
+    """Sorted rows of earlier retrieved candidates in `snapshot` (by id if the store changed since)."""
+    if store_version == snapshot.version and rows is not None:
+        return np.asarray(rows, dtype=np.int64)
+    rows_by_id = snapshot.rows_by_id
+    return np.array(sorted(rows_by_id[c] for c in candidate_ids if c in rows_by_id), dtype=np.int64)
+
+
+@stage_timer("retrieval")
+def retrieve_context(query: str, analyzed_query: dict = None, query_embedding: np.ndarray = None,
+                     semantic_hits: tuple = None, within: tuple = None) -> list[CandidateView]:
     """
     Retrieves the top N most semantically similar candidates based on the user query,
     using cosine similarity of sentence embeddings, above a certain threshold.
-    (Will be enhanced in Step 16 to use analyzed_query criteria for filtering).
+    If analyzed_query carries criteria (skills, experience_years_min, candidate_names),
+    the filter index first narrows the pool to candidates that satisfy them exactly;
+    only those are scored, and the similarity threshold is not applied to them.
+    Pass `query_embedding` (from encode_query) to reuse an embedding the caller already has,
+    and `semantic_hits` (from semantic_search_async) to filter/re-rank an existing semantic result
+    instead of searching again; the subset is only re-scored if too few hits satisfy the criteria.
+    Reads SNAPSHOT once, so a concurrent candidate update never mixes two generations;
+    semantic hits from an older generation are ignored and the search is redone.
+    Matches are returned as read-only CandidateViews (row + similarity_score) that decode the
+    candidate's fields from the snapshot's table only when they are read.
+    `within` = (candidate_ids, rows, store_version) from a chat session restricts the search to the
+    previous answer's candidates (a follow-up question); they are ranked like criteria matches.
     """
-    global embedding_model, SAMPLE_CANDIDATES_WITH_EMBEDDINGS
-    # --- ADDED PRINT STATEMENT ---
-    print(f"\n--- retrieve_context called (Step 14 - Param Added). Query: '{query}'. Analyzed: {analyzed_query} ---")
+    logger.debug("retrieve_context called. Query: '%s'. Analyzed: %s", query, analyzed_query)
+    snapshot = SNAPSHOT
+    candidates, vector_index = snapshot.candidates, snapshot.index
 
     # Check if embeddings are available
-    if not embedding_model or not SAMPLE_CANDIDATES_WITH_EMBEDDINGS:
-        print("--- Embeddings or candidate data not available. Returning empty context. ---")
+    if not embedding_model or not candidates or vector_index is None:
+        logger.warning("Embeddings or candidate data not available. Returning empty context.")
         return []
 
-    try:
-        # 1. Generate embedding for the user query
-        print("--- Generating query embedding ---")
-        query = str(query) if query is not None else ""
-        query_embedding = embedding_model.encode(query, convert_to_tensor=True)
+    if semantic_hits is not None and len(semantic_hits) > 2 and semantic_hits[2] != snapshot.version:
+        logger.debug("Candidate store changed since the semantic search. Searching again.")
+        semantic_hits = None
 
-        # 2. Prepare candidate embeddings
-        candidate_embeddings = torch.stack([c['embedding_tensor'] for c in SAMPLE_CANDIDATES_WITH_EMBEDDINGS])
+    try:
+        # 1. Generate embedding for the user query (unless the caller already did)
+        if query_embedding is None:
+            logger.debug("Generating query embedding")
+            query_embedding = encode_query(query)
 
-        # 3. Compute cosine similarity
-        print(f"--- Computing cosine similarity against {len(candidate_embeddings)} candidates ---")
-        cosine_scores = util.cos_sim(query_embedding, candidate_embeddings)[0]
+        # 2. Narrow the pool with the structured criteria from query analysis
+        criteria = (analyzed_query or {}).get('criteria') or {}
+        rows, applied = snapshot.filter_index.match(criteria)
+        if within is not None:
+            within_rows = _rows_in_snapshot(snapshot, *within)
+            rows = within_rows if rows is None else np.intersect1d(rows, within_rows, assume_unique=True)
+            applied['within_previous'] = len(within_rows)
+        if rows is not None:
+            logger.debug("Pre-filter %s kept %d of %d candidates", applied, len(rows), len(candidates))
+            if not len(rows):
+                logger.debug("No candidates satisfy the query criteria")
+                return []
 
-        # 4. Find the top N matches above the threshold
-        print(f"--- Finding top {TOP_N} candidates with similarity > {SIMILARITY_THRESHOLD} ---")
-        scores_list = list(enumerate(cosine_scores.tolist()))
-        scores_list.sort(key=lambda x: x[1], reverse=True)
+        # 3. Search the vector index for the top N (cosine similarity on normalized vectors)
+        if rows is None:
+            threshold = SIMILARITY_THRESHOLD
+            if semantic_hits is not None:
+                indices, scores = semantic_hits[0][:TOP_N], semantic_hits[1][:TOP_N]
+            else:
+                logger.debug("Searching '%s' index over %d candidates for top %d with similarity > %s",
+                             vector_index.name, len(vector_index), TOP_N, SIMILARITY_THRESHOLD)
+                indices, scores = vector_index.search(query_embedding, TOP_N)
+        else:
+            # Exact constraint matches are relevant by definition; similarity only ranks them
+            threshold = float("-inf")
+            indices = None
+            if semantic_hits is not None:
+                # Hits from the global top-K that satisfy the criteria are also the subset's top hits
+                keep = np.isin(semantic_hits[0], rows)
+                if keep.sum() >= min(TOP_N, len(rows)):
+                    logger.debug("Re-ranked %d semantic hits that satisfy the criteria", int(keep.sum()))
+                    indices, scores = semantic_hits[0][keep][:TOP_N], semantic_hits[1][keep][:TOP_N]
+            if indices is None:
+                indices, scores = filtered_search(vector_index, snapshot.embeddings, query_embedding, rows, TOP_N)
 
+        # 4. Keep the matches above the threshold (results are already best-first)
         top_matches = []
-        for index, score in scores_list:
-            if score >= SIMILARITY_THRESHOLD and len(top_matches) < TOP_N:
-                print(f"--- Match found: Index {index}, Candidate '{SAMPLE_CANDIDATES_WITH_EMBEDDINGS[index]['candidate_name']}', Score {score:.4f} ---")
-                match_info = SAMPLE_CANDIDATES_WITH_EMBEDDINGS[index].copy()
-                match_info['similarity_score'] = score
-                top_matches.append(match_info)
-            elif len(top_matches) >= TOP_N:
-                 break
+        for index, score in zip(indices.tolist(), scores.tolist()):
+            if score < threshold:
+                break
+            logger.debug("Match found: Index %d, Score %.4f", index, score)
+            top_matches.append(candidates.view(index, score))
 
         if not top_matches:
-            print("--- No candidates met the similarity threshold ---")
+            logger.debug("No candidates met the similarity threshold")
 
-        print(f"--- Retrieved {len(top_matches)} relevant candidates ---")
+        logger.debug("Retrieved %d relevant candidates", len(top_matches))
         return top_matches
 
     except Exception as e:
-        print(f"--- Error during semantic retrieval: {e} ---")
-        # import traceback
-        # traceback.print_exc()
+        logger.exception(f"Error during semantic retrieval: {e}")
         return []
 
 
-def format_context_for_llm(candidates: list[dict]) -> str:
-    """
-    Formats the retrieved candidate data into a string for the LLM prompt.
-    Avoids including 'embedding_tensor' and 'similarity_score'.
-    Sorts by score if available.
-    """
-    if not candidates:
-        return "No relevant candidate information was found for the query."
-
-    if candidates and 'similarity_score' in candidates[0]:
-         try:
-             candidates.sort(key=lambda x: x.get('similarity_score', 0), reverse=True)
-             context_str = "Relevant Candidate Information Found (Ranked by relevance):\n"
-         except Exception as e:
-             print(f"Warning: Could not sort candidates by score: {e}")
-             context_str = "Relevant Candidate Information Found:\n"
-    else:
-        context_str = "Relevant Candidate Information Found:\n"
-
-    for candidate in candidates:
-        context_str += f"- Name: {candidate.get('candidate_name', 'N/A')} \n" # Removed score display
-        skills = candidate.get('skills', [])
-        if skills:
-            context_str += f"  Skills: {', '.join(skills)}\n"
-        exp = candidate.get('experience_years', 'N/A')
-        context_str += f"  Experience: {exp} years\n"
-        summary = candidate.get('summary', 'N/A')
-        context_str += f"  Summary: {summary}\n\n"
-    return context_str.strip()
\ No newline at end of file
+# ======================================================
+# == CANDIDATE UPDATES (bulk upsert / delete) ==
+# ======================================================
+def _apply_update(candidates: list[dict], result: dict) -> dict:
+    """
+    Builds and publishes the next snapshot for `candidates`, persists the records and
+    fills in the totals of `result`. Called with _UPDATE_LOCK held.
+    """
+    start_time = time.time()
+    snapshot = _build_snapshot(candidates, previous_index=SNAPSHOT.index)
+    save_candidate_data(candidates)
+    _publish(snapshot)
+    result.update(encoded=EMBEDDING_STORE.last_encoded, total=len(snapshot.candidates), store_version=snapshot.version)
+    logger.info(f"Candidate store updated to version {snapshot.version} in {time.time() - start_time:.2f} seconds: {result}")
+    return result
+
+
+def _require_ready():
+    # Before the startup sync has published a snapshot, an update would be built on an empty candidate set
+    if not is_ready():
+        if LOAD_PROGRESS["stage"] == "failed":
+            raise CandidateStoreError(f"Candidates can't be updated: {LOAD_PROGRESS['error']}")
+        raise CandidateStoreError("Candidates are still loading; try again shortly.")
+
+
+def _update_through_service(op: str, payload: list) -> dict:
+    """API-worker mode: the embedding service applies the update; this worker then maps the new generation."""
+    try:
+        # Large updates re-encode many candidates: no reply timeout
+        result = embedding_model.call(op, payload, timeout=None)
+    except EmbeddingServiceError as e:
+        raise CandidateStoreError(str(e)) from e
+    with _UPDATE_LOCK:
+        _reload_published_store()
+    return result
+
+
+def upsert_candidates(records: list[dict]) -> dict:
+    """
+    Inserts new candidates and replaces existing ones (matched by candidate_id; within one call the
+    last record for an id wins). Only new or changed candidate texts are encoded. The new generation
+    is published atomically and bumps the store version, unless nothing changed.
+    Blocking (encodes and writes the store); run it off the event loop.
+    Cost is O(total candidates) per call, not per changed record: the new generation rewrites the whole
+    matrix and all records, and the vector index is rebuilt (HNSW from scratch; IVF reassigns every row)
+    while _UPDATE_LOCK is held. Batch changes into as few calls as possible.
+    """
+    _require_ready()
+    if EMBEDDING_SERVICE_SOCKET:
+        return _update_through_service("upsert", records)
+    with _UPDATE_LOCK:
+        snapshot = SNAPSHOT
+        candidates = snapshot.candidates.records()
+        rows_by_id = dict(snapshot.rows_by_id)
+        result = {"inserted": 0, "updated": 0, "unchanged": 0}
+        for record in records:
+            row = rows_by_id.get(record['candidate_id'])
+            if row is None:
+                rows_by_id[record['candidate_id']] = len(candidates)
+                candidates.append(record)
+                result["inserted"] += 1
+            elif candidates[row] != record:
+                candidates[row] = record
+                result["updated"] += 1
+            else:
+                result["unchanged"] += 1
+
+        if not result["inserted"] and not result["updated"]:
+            result.update(encoded=0, total=len(candidates), store_version=snapshot.version)
+            return result
+        return _apply_update(candidates, result)
+
+
+def delete_candidates(candidate_ids: list[str]) -> dict:
+    """
+    Removes candidates by id (unknown ids are counted as "missing"). The remaining rows keep their
+    embeddings; the new generation is published atomically and bumps the store version.
+    Blocking; run it off the event loop. Costs O(total candidates) like upsert_candidates.
+    """
+    _require_ready()
+    if EMBEDDING_SERVICE_SOCKET:
+        return _update_through_service("delete", list(candidate_ids))
+    with _UPDATE_LOCK:
+        snapshot = SNAPSHOT
+        remove = {cid for cid in candidate_ids if cid in snapshot.rows_by_id}
+        result = {"deleted": len(remove), "missing": len(set(candidate_ids) - remove)}
+        if not remove:
+            result.update(encoded=0, total=len(snapshot.candidates), store_version=snapshot.version)
+            return result
+        candidates = [c for c in snapshot.candidates.records() if c['candidate_id'] not in remove]
+        return _apply_update(candidates, result)
+
+
+@stage_timer("context_formatting")
+def format_context_for_llm(candidates: list, token_budget: int = PROMPT_CONTEXT_TOKEN_BUDGET,
+                           priority_skills=()) -> str:
+    """
+    Formats the retrieved candidate data into a compact context block for the LLM prompt
+    (one line per candidate, best match first, within about `token_budget` tokens;
+    see core/prompt_builder.build_context). Avoids including 'similarity_score'.
+    Skills in `priority_skills` (the query's criteria) are listed first.
+    `candidates` are the CandidateViews from retrieve_context (candidate dicts work too);
+    this is where the matched candidates' fields are actually decoded.
+    """
+    context_str, stats = build_context(candidates, token_budget, priority_skills)
+    if stats["included"] < stats["candidates"] or stats["summaries_truncated"] or stats["summaries_dropped"]:
+        logger.debug("Context trimmed to fit %d tokens: %s", token_budget, stats)
+    return context_str
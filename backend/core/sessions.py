@@ -0,0 +1,157 @@
+# --- Imports ---
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+
+from core.cache import TTLCache
+from core.embedding_service import EMBEDDING_SERVICE_SOCKET, EmbeddingServiceClient, EmbeddingServiceError
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Sessions expire after this long without a message; the least recently used are evicted beyond the limit
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+# Turns kept per session; the prompt only gets the recent ones that fit PROMPT_HISTORY_TOKEN_BUDGET
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))
+# Multi-worker mode: how long a worker waits for the embedding service to return or save a session
+SESSION_SERVICE_TIMEOUT_SECONDS = float(os.getenv("SESSION_SERVICE_TIMEOUT_SECONDS", "2"))
+
+
+class ChatSession:
+    """
+    Server-side state of one conversation (ChatRequest.session_id):
+    - criteria: effective criteria of the last turn that found candidates
+    - candidate_ids / rows / store_version: the candidates that turn's answer was based on
+      (rows are only valid for that store version; ids are used after a candidate update)
+    - turns: (question, reply) pairs, newest last, without the context blocks that were sent
+
+    Changes are kept once the session is saved back to its store (SessionStore.save).
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.criteria = {}
+        self.candidate_ids = []
+        self.rows = None
+        self.store_version = None
+        self.turns = deque(maxlen=SESSION_MAX_TURNS)
+        self._lock = threading.Lock()
+
+    def previous_candidates(self) -> tuple | None:
+        """(candidate_ids, rows, store_version) of the last answer, or None before the first one."""
+        with self._lock:
+            if not self.candidate_ids:
+                return None
+            return list(self.candidate_ids), self.rows, self.store_version
+
+    def remember_candidates(self, criteria: dict, candidates: list, store_version: int):
+        """Records the criteria and retrieved candidates (CandidateViews) a follow-up can refine."""
+        with self._lock:
+            self.criteria = dict(criteria or {})
+            self.candidate_ids = [c['candidate_id'] for c in candidates]
+            self.rows = sorted(c.row for c in candidates)
+            self.store_version = store_version
+
+    def add_turn(self, question: str, reply: str):
+        with self._lock:
+            self.turns.append((question, reply))
+
+    def history(self) -> list[tuple]:
+        with self._lock:
+            return list(self.turns)
+
+    def state(self) -> dict:
+        """Plain-data copy of the session (sent to / from the embedding service in multi-worker mode)."""
+        with self._lock:
+            return {"criteria": dict(self.criteria), "candidate_ids": list(self.candidate_ids), "rows": self.rows,
+                    "store_version": self.store_version, "turns": list(self.turns)}
+
+    @classmethod
+    def from_state(cls, session_id: str, state: dict) -> "ChatSession":
+        session = cls(session_id)
+        session.criteria = state["criteria"]
+        session.candidate_ids = state["candidate_ids"]
+        session.rows = state["rows"]
+        session.store_version = state["store_version"]
+        session.turns.extend(state["turns"])
+        return session
+
+
+class SessionStore:
+    """Bounded, TTL-evicted sessions by id (an LRU TTLCache; every message renews the TTL)."""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self._cache = TTLCache(max_size=max_sessions, ttl_seconds=ttl_seconds)
+
+    def get_or_create(self, session_id: str | None) -> ChatSession:
+        """
+        The session for `session_id`. Unknown or expired ids are not adopted: a new session with a
+        server-generated id is started instead, and callers return its id to the client.
+        """
+        session = self._cache.get(session_id) if session_id else None
+        if session is None:
+            if session_id:
+                logger.debug("Unknown or expired chat session %r. Starting a new one.", session_id)
+            session = ChatSession(uuid.uuid4().hex)
+        self._cache.set(session.session_id, session)
+        return session
+
+    def save(self, session: ChatSession):
+        """Keeps the session's changes and restarts its TTL (called after each answered message)."""
+        self._cache.set(session.session_id, session)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    # --- Embedding service side of SharedSessionStore ---
+    def get_or_create_state(self, session_id: str | None) -> tuple[str, dict]:
+        session = self.get_or_create(session_id)
+        return session.session_id, session.state()
+
+    def save_state(self, session_id: str, state: dict):
+        self.save(ChatSession.from_state(session_id, state))
+
+
+class SharedSessionStore:
+    """
+    SessionStore for API workers (EMBEDDING_SERVICE_SOCKET set): the sessions are kept in the
+    embedding service process, so a follow-up finds its session whichever worker receives it.
+    Workers get a copy per message and send it back on save(); two messages of the same session
+    answered at once by different workers keep the last one saved.
+
+    If the service doesn't answer within `timeout` seconds the message is answered anyway: with a
+    new session (so without follow-up context) on get_or_create(), without keeping the turn on save().
+    """
+
+    def __init__(self, client: EmbeddingServiceClient = None, timeout: float = SESSION_SERVICE_TIMEOUT_SECONDS):
+        self._client = client or EmbeddingServiceClient()
+        self._timeout = timeout
+
+    def get_or_create(self, session_id: str | None) -> ChatSession:
+        try:
+            session_id, state = self._client.call("session_get", session_id, timeout=self._timeout)
+        except EmbeddingServiceError as e:
+            logger.warning(f"Could not load chat session from the embedding service, starting a new one: {e}")
+            return ChatSession(uuid.uuid4().hex)
+        return ChatSession.from_state(session_id, state)
+
+    def save(self, session: ChatSession):
+        try:
+            self._client.call("session_save", session.session_id, session.state(), timeout=self._timeout)
+        except EmbeddingServiceError as e:
+            logger.warning(f"Could not save chat session {session.session_id} to the embedding service: {e}")
+
+    def stats(self) -> dict:
+        try:
+            return self._client.call("session_stats", timeout=self._timeout)
+        except EmbeddingServiceError as e:
+            logger.warning(f"Could not read session stats from the embedding service: {e}")
+            return {}
+
+
+def create_session_store():
+    """SharedSessionStore in API-worker mode, otherwise an in-process SessionStore."""
+    return SharedSessionStore() if EMBEDDING_SERVICE_SOCKET else SessionStore()
@@ -0,0 +1,92 @@
+# --- Imports ---
+import asyncio
+import logging
+import os
+import time
+
+from core import rag_service
+from core.llm_service import preload_model
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Load the chat model on every Ollama endpoint during warmup (the first answer otherwise waits for it)
+WARMUP_PRELOAD_LLM = os.getenv("WARMUP_PRELOAD_LLM", "true").lower() in ("1", "true", "yes")
+# Retry-After (seconds) sent with 503s while the service is still warming up
+STARTUP_RETRY_AFTER = int(os.getenv("STARTUP_RETRY_AFTER", "5"))
+
+
+# ======================================================
+# == BACKGROUND WARMUP ==
+# ======================================================
+class StartupState:
+    """
+    Progress of the background warmup started from the app lifespan:
+    embeddings (model load + store sync, then a dummy query) and, optionally, the Ollama model preload.
+    The process is ready once the embeddings are warmed up and the preload attempt has finished.
+    A failed preload is reported but does not block readiness: Ollama is shared by every replica and the
+    endpoint pool already answers 503 while it is down, so holding this replica back would not help.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.ready_at = None
+        self.llm_preload = "skipped" if not WARMUP_PRELOAD_LLM else "pending"
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return rag_service.is_ready() and self.llm_preload != "pending"
+
+    @property
+    def failed(self) -> bool:
+        return rag_service.get_load_progress()["stage"] == "failed"
+
+    def start(self):
+        """Starts the warmup task (from the lifespan, after which the server starts accepting connections)."""
+        if self._task is None:
+            self.started_at = time.time()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        steps = [self._warm_embeddings()]
+        if WARMUP_PRELOAD_LLM:
+            steps.append(self._preload_llm())
+        await asyncio.gather(*steps)
+        if self.ready:
+            self.ready_at = time.time()
+            logger.info(f"Service ready in {self.ready_at - self.started_at:.2f} seconds")
+        else:
+            logger.critical(f"Startup failed: {rag_service.get_load_progress()['error']}")
+
+    async def _warm_embeddings(self):
+        loop = asyncio.get_running_loop()
+        # Both block (model load, store sync, first forward pass); the event loop keeps serving the probes
+        if await loop.run_in_executor(None, rag_service.initialize_embeddings):
+            await loop.run_in_executor(rag_service.RAG_EXECUTOR, rag_service.warm_up_retrieval)
+
+    async def _preload_llm(self):
+        results = await preload_model()
+        self.llm_preload = "loaded" if all(r == "loaded" for r in results.values()) else results
+
+    def status(self) -> dict:
+        """Load progress for /healthz and /readyz."""
+        now = time.time()
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(now - self.started_at, 1),
+            "ready_after_seconds": round(self.ready_at - self.started_at, 1) if self.ready_at else None,
+            "embeddings": rag_service.get_load_progress(),
+            "llm_preload": self.llm_preload,
+        }
+
+
+STARTUP = StartupState()
@@ -0,0 +1,329 @@
+# --- Imports ---
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# exact (brute force), ivf (inverted file, numpy only) or hnsw (needs the optional hnswlib package)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "exact").lower()
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))           # 0 = pick from the collection size
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", "50000"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# Pre-filtered searches score the surviving rows exactly up to this many rows;
+# beyond that an ANN index is over-fetched by PREFILTER_OVERFETCH x k and post-filtered
+PREFILTER_EXACT_MAX = int(os.getenv("PREFILTER_EXACT_MAX", "50000"))
+PREFILTER_OVERFETCH = int(os.getenv("PREFILTER_OVERFETCH", "20"))
+
+# Rows scored per matmul when assigning vectors to IVF lists (bounds temporary memory)
+_ASSIGN_CHUNK = 65536
+# Rows of a float16 matrix converted to float32 per matmul when scoring (numpy has no fast float16 matmul)
+_SCORE_CHUNK = 16384
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k highest scores, highest first.
+    Uses argpartition (O(n)) and only sorts the k winners.
+    """
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= len(scores):
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+def ivf_target_nlist(rows: int) -> int:
+    """Number of IVF lists for a collection of `rows` (IVF_NLIST, or about 4 * sqrt(rows))."""
+    return IVF_NLIST or max(1, min(int(4 * np.sqrt(rows)), 65536))
+
+
+def _as_float32(matrix) -> np.ndarray:
+    """Returns the matrix as float32 without copying when it already is (e.g. a read-only mmap)."""
+    return np.asarray(matrix, dtype=np.float32)
+
+
+def score_all(matrix, query: np.ndarray) -> np.ndarray:
+    """
+    Cosine scores of every row (matrix @ query) as float32. A float16 matrix (EMBEDDING_STORE_DTYPE)
+    is scored _SCORE_CHUNK rows at a time straight from the mmap, never copied to float32 as a whole.
+    """
+    query = query.astype(np.float32)
+    if matrix.dtype == np.float32:
+        return matrix @ query
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), _SCORE_CHUNK):
+        chunk = matrix[start:start + _SCORE_CHUNK]
+        scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+    return scores
+
+
+# ======================================================
+# == EXACT (BRUTE FORCE) INDEX ==
+# ======================================================
+class ExactIndex:
+    """
+    Scores every row with one matrix-vector product over the prebuilt normalized matrix.
+    Always returns the true top-k; cost is linear in the number of candidates.
+    The matrix is used as stored (float32 or float16 mmap); see score_all.
+    """
+    name = "exact"
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (row indices, cosine scores) of the k best rows, best first."""
+        scores = score_all(self.matrix, query)
+        best = top_k(scores, k)
+        return best, scores[best]
+
+
+# ======================================================
+# == IVF (INVERTED FILE) INDEX ==
+# ======================================================
+class IVFIndex:
+    """
+    Approximate index: rows are clustered around `nlist` k-means centroids, and a query
+    only scores the rows in its `nprobe` closest clusters (roughly nprobe/nlist of the pool).
+    Pure numpy, so it needs no extra dependency. A float16 matrix stays float16 (only the probed rows
+    are converted per query).
+    `trained_rows` is the collection size the centroids were trained at; reused centroids
+    (incremental updates) are retrained once the collection has outgrown them (see needs_retrain).
+    """
+    name = "ivf"
+
+    def __init__(self, matrix, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE,
+                 train_sample: int = IVF_TRAIN_SAMPLE, iterations: int = 10, seed: int = 0, state: dict = None,
+                 centroids: np.ndarray = None, trained_rows: int = None):
+        self.matrix = matrix
+        n = len(self.matrix)
+        self.nlist = nlist or ivf_target_nlist(n)
+        self.nprobe = max(1, nprobe)
+
+        if state is not None:
+            self.centroids, self.offsets, self.list_rows = state["centroids"], state["offsets"], state["list_rows"]
+            # Caches written before trained_rows was recorded: assume they were trained on this matrix
+            self.trained_rows = int(state.get("trained_rows", n))
+            return
+
+        if centroids is not None and len(centroids):
+            # Reuse already trained centroids (incremental updates): only the list assignment is redone
+            self.centroids = centroids
+            self.trained_rows = trained_rows if trained_rows is not None else n
+            self.nlist = len(self.centroids)
+        else:
+            rng = np.random.default_rng(seed)
+            self.centroids = self._train(rng, min(train_sample, n), iterations)
+            self.trained_rows = n
+        assignments = self._assign(self.matrix)
+        # CSR layout: rows of list i are list_rows[offsets[i]:offsets[i + 1]]
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=len(self.centroids))
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.list_rows = order.astype(np.int64)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def _train(self, rng, sample_size: int, iterations: int) -> np.ndarray:
+        """Spherical k-means on a random sample of rows."""
+        if sample_size == 0:
+            return np.zeros((0, self.matrix.shape[1]), dtype=np.float32)
+        sample = _as_float32(self.matrix[np.sort(rng.choice(len(self.matrix), sample_size, replace=False))])
+        nlist = min(self.nlist, sample_size)
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms == 0, 1, norms)
+        self.nlist = nlist
+        return centroids
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), _ASSIGN_CHUNK):
+            chunk = _as_float32(vectors[start:start + _ASSIGN_CHUNK])
+            labels[start:start + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return labels
+
+    def state(self) -> dict:
+        """Arrays needed to rebuild this index without retraining."""
+        return {"centroids": self.centroids, "offsets": self.offsets, "list_rows": self.list_rows,
+                "trained_rows": np.int64(self.trained_rows)}
+
+    def needs_retrain(self, rows: int) -> bool:
+        """
+        True if the centroids no longer fit a collection of `rows`: the list count they give is
+        more than 2x away from ivf_target_nlist(rows). Reusing them past that point makes each probed
+        list scan far more (or fewer) rows than planned, up to scanning everything.
+        """
+        target = ivf_target_nlist(rows)
+        return not (target / 2 <= self.nlist <= target * 2)
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (row indices, cosine scores) of the best rows found in the probed lists."""
+        if len(self.centroids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = query.astype(np.float32)
+        probes = top_k(self.centroids @ query, min(self.nprobe, len(self.centroids)))
+        rows = np.concatenate([self.list_rows[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+        scores = _as_float32(self.matrix[rows]) @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+
+# ======================================================
+# == HNSW INDEX (optional hnswlib) ==
+# ======================================================
+class HNSWIndex:
+    """
+    Approximate index backed by hnswlib's graph search (inner-product space).
+    Query cost grows roughly logarithmically with the number of candidates.
+    """
+    name = "hnsw"
+
+    def __init__(self, matrix, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION,
+                 ef_search: int = HNSW_EF_SEARCH, path: str = None):
+        import hnswlib  # Optional dependency, only needed for this backend
+
+        matrix = _as_float32(matrix)
+        self.count = len(matrix)
+        self.ef_search = ef_search
+        self.index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        if path and os.path.exists(path):
+            self.index.load_index(path, max_elements=self.count)
+        else:
+            self.index.init_index(max_elements=max(1, self.count), ef_construction=ef_construction, M=m)
+            if self.count:
+                self.index.add_items(matrix, np.arange(self.count))
+        self.index.set_ef(ef_search)
+
+    def __len__(self):
+        return self.count
+
+    def save(self, path: str):
+        self.index.save_index(path)
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (row indices, cosine scores) of the approximate k best rows."""
+        k = min(k, self.count)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        self.index.set_ef(max(self.ef_search, k))
+        labels, distances = self.index.knn_query(query.astype(np.float32), k=k)
+        # hnswlib's "ip" distance is 1 - inner product
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+
+# ======================================================
+# == FILTERED SEARCH ==
+# ======================================================
+def search_rows(matrix, query: np.ndarray, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Exact top-k restricted to `rows`; only those rows are scored."""
+    if not len(rows):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    scores = _as_float32(matrix[rows]) @ query.astype(np.float32)
+    best = top_k(scores, k)
+    return rows[best], scores[best]
+
+
+def filtered_search(index, matrix, query: np.ndarray, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k among the pre-filtered `rows`.
+    Small candidate sets are scored exactly; large ones go through the ANN index with
+    over-fetching and fall back to exact scoring if too few results survive the filter.
+    """
+    if index.name == "exact" or len(rows) <= PREFILTER_EXACT_MAX:
+        return search_rows(matrix, query, rows, k)
+    found, scores = index.search(query, k * PREFILTER_OVERFETCH)
+    keep = np.isin(found, rows, assume_unique=True)
+    if keep.sum() >= k:
+        return found[keep][:k], scores[keep][:k]
+    return search_rows(matrix, query, rows, k)
+
+
+# ======================================================
+# == FACTORY ==
+# ======================================================
+def _write_cache(path: str, write_fn):
+    """
+    Writes an index cache file atomically (temp file, then rename): with several API workers
+    mapping the same store generation, two processes may build and cache the same index at once.
+    A failed write only costs a rebuild next time.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not cache vector index at {path}: {e}")
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def create_index(matrix, backend: str = VECTOR_INDEX_BACKEND, cache_dir: str = None, previous=None):
+    """
+    Builds the configured index over a normalized embedding matrix.
+    `cache_dir` (normally the embedding store's generation directory, whose contents never change)
+    lets ANN backends reuse a previously built index instead of rebuilding on every start.
+    `previous` is the index being replaced after a candidate update; an IVF index keeps its
+    trained centroids and only reassigns rows, unless the collection size has moved too far from
+    the one they were trained at (IVFIndex.needs_retrain). Other backends (HNSW) are rebuilt
+    from scratch, which is O(N) per update whatever the number of changed rows.
+    Falls back to the exact index if the requested backend can't be built.
+    """
+    start_time = time.time()
+    index = None
+    try:
+        if backend == "ivf":
+            cache_path = os.path.join(cache_dir, f"ivf-{IVF_NLIST}.npz") if cache_dir else None
+            if cache_path and os.path.exists(cache_path):
+                with np.load(cache_path) as cached:
+                    index = IVFIndex(matrix, nlist=len(cached["centroids"]), state=dict(cached))
+            else:
+                centroids, trained_rows = None, None
+                if isinstance(previous, IVFIndex):
+                    if previous.needs_retrain(len(matrix)):
+                        logger.info(f"Retraining IVF centroids: {previous.nlist} lists were trained at "
+                                    f"{previous.trained_rows} rows, {len(matrix)} rows now need ~{ivf_target_nlist(len(matrix))}")
+                    else:
+                        centroids, trained_rows = previous.centroids, previous.trained_rows
+                index = IVFIndex(matrix, centroids=centroids, trained_rows=trained_rows)
+                if cache_path:
+                    # File object, so np.savez doesn't append ".npz" to the temp name
+                    def write_ivf(tmp_path):
+                        with open(tmp_path, "wb") as f:
+                            np.savez(f, **index.state())
+                    _write_cache(cache_path, write_ivf)
+        elif backend == "hnsw":
+            cache_path = os.path.join(cache_dir, f"hnsw-{HNSW_M}-{HNSW_EF_CONSTRUCTION}.bin") if cache_dir else None
+            index = HNSWIndex(matrix, path=cache_path)
+            if cache_path and not os.path.exists(cache_path):
+                _write_cache(cache_path, index.save)
+        elif backend != "exact":
+            logger.warning(f"Unknown VECTOR_INDEX_BACKEND '{backend}'. Using exact search.")
+    except ImportError as e:
+        logger.warning(f"Vector index backend '{backend}' unavailable ({e}). Using exact search.")
+        index = None
+
+    if index is None:
+        index = ExactIndex(matrix)
+    logger.info(f"Built '{index.name}' vector index over {len(index)} candidates in {time.time() - start_time:.2f} seconds")
+    return index
@@ -0,0 +1,278 @@
+"""
+Offline bulk ingestion of resume files into the candidate store.
+
+Streams every .txt/.md/.json resume under --input through a process pool (parsing, skill and
+experience extraction, chunking; see ingestion/resume_parser.py), batch-encodes the chunks with
+the sentence transformer in this process, and aggregates them into one vector per candidate:
+the re-normalized mean of the profile chunk and the resume body chunks. Long resumes are
+therefore embedded in full instead of being truncated at the model's maximum sequence length.
+Chunk vectors only feed that mean; retrieval scores one vector per candidate, so they are not kept.
+
+Progress is saved as one shard per batch under <out>/shards, so an interrupted run resumes where
+it stopped: files whose size and mtime are unchanged are not parsed or encoded again.
+Once every file is done, the shards are merged into:
+    <out>/candidates.json       candidate records                   -> CANDIDATES_FILE
+    <out>/embedding_store/      candidate-level vectors             -> EMBEDDING_STORE_DIR
+Files that were deleted or changed since they were ingested are left out of the merge.
+
+Usage (from the backend/ directory):
+    python -m ingestion.ingest_resumes --input /data/resumes --out data/ingest
+    python -m ingestion.ingest_resumes --input /data/resumes --out data/ingest --workers 8 --device cuda
+Then start the backend with CANDIDATES_FILE=<out>/candidates.json EMBEDDING_STORE_DIR=<out>/embedding_store.
+"""
+# --- Imports ---
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from core.candidates import build_candidate_text
+from core.embedding_store import EMBEDDING_STORE_DTYPE, EmbeddingStore
+from ingestion.resume_parser import RESUME_EXTENSIONS, file_fingerprint, parse_resume_file
+
+# Must match core/rag_service.EMBEDDING_MODEL_NAME (not imported: the ingestion CLI doesn't need the serving modules)
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+SHARD_PREFIX = "shard-"
+
+
+# ======================================================
+# == SCANNING / SHARDS ==
+# ======================================================
+def scan_resumes(root: str):
+    """Relative paths of the resume files under `root`, in a stable (sorted) order."""
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(RESUME_EXTENSIONS) and not filename.startswith("."):
+                yield os.path.relpath(os.path.join(directory, filename), root)
+
+
+def shard_paths(shards_dir: str) -> list[str]:
+    """Completed shard files in write order (unfinished *.tmp.npz files are ignored)."""
+    if not os.path.isdir(shards_dir):
+        return []
+    names = [n for n in os.listdir(shards_dir) if n.startswith(SHARD_PREFIX) and n.endswith(".npz") and ".tmp" not in n]
+    return [os.path.join(shards_dir, n) for n in sorted(names)]
+
+
+def read_shard_files(path: str) -> list[dict]:
+    """The [{"path", "fingerprint", "error"}] entries of a shard, without loading its vectors."""
+    with np.load(path) as shard:
+        return json.loads(str(shard["files"]))
+
+
+def write_shard(path: str, files: list[dict], records: list[dict], record_files: list[int],
+                candidate_vectors: np.ndarray):
+    """Writes one batch atomically (temp file, then rename), so a crash never leaves half a shard."""
+    tmp_path = path[:-len(".npz")] + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        files=np.array(json.dumps(files)),
+        records=np.array(json.dumps(records)),
+        record_files=np.asarray(record_files, dtype=np.int32),
+        candidate_vectors=candidate_vectors.astype(np.float32),
+    )
+    os.replace(tmp_path, path)
+
+
+# ======================================================
+# == ENCODING ==
+# ======================================================
+def aggregate_chunks(chunk_vectors: np.ndarray, chunk_offsets: np.ndarray) -> np.ndarray:
+    """
+    One normalized vector per candidate: the mean of its chunk vectors.
+    Candidate i owns chunk_vectors[chunk_offsets[i]:chunk_offsets[i + 1]] (every candidate has >= 1 chunk).
+    """
+    sums = np.add.reduceat(chunk_vectors.astype(np.float32), chunk_offsets[:-1], axis=0)
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    return sums / np.where(norms == 0, 1, norms)
+
+
+def encode_batch(model, records: list[dict], batch_size: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(chunk_offsets, chunk_vectors, candidate_vectors) for a batch of parsed records."""
+    texts = [chunk for record in records for chunk in record["chunks"]]
+    chunk_offsets = np.concatenate(([0], np.cumsum([len(r["chunks"]) for r in records]))).astype(np.int64)
+    # encode() sorts by length internally, so long and short chunks still batch efficiently
+    chunk_vectors = model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                 normalize_embeddings=True, show_progress_bar=False)
+    return chunk_offsets, chunk_vectors, aggregate_chunks(chunk_vectors, chunk_offsets)
+
+
+# ======================================================
+# == INGESTION RUN ==
+# ======================================================
+def ingest(root: str, out_dir: str, workers: int, batch_docs: int, batch_size: int, device: str | None,
+           retry_errors: bool = False) -> dict:
+    """Parses, encodes and shards every new or changed resume under `root`. Returns run statistics."""
+    shards_dir = os.path.join(out_dir, "shards")
+    os.makedirs(shards_dir, exist_ok=True)
+
+    # --- Resume: skip files already in a shard with the same fingerprint ---
+    done = {}
+    existing = shard_paths(shards_dir)
+    for path in existing:
+        for entry in read_shard_files(path):
+            if entry["error"] and retry_errors:
+                continue
+            done[entry["path"]] = entry["fingerprint"]
+
+    scan_start = time.perf_counter()
+    todo = []
+    for relpath in scan_resumes(root):
+        if done.get(relpath) != file_fingerprint(os.path.join(root, relpath)):
+            todo.append(relpath)
+    print(f"Found {len(todo)} new or changed resume files ({len(done)} already ingested) "
+          f"in {time.perf_counter() - scan_start:.1f}s")
+    stats = {"files": 0, "candidates": 0, "chunks": 0, "errors": 0, "seconds": 0.0, "encode_seconds": 0.0}
+    if not todo:
+        return stats
+
+    # Workers are forked before torch is imported, so they stay small
+    pool = multiprocessing.Pool(workers)
+    try:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+
+        next_shard = len(existing)
+        start = time.perf_counter()
+        files, records, record_files = [], [], []
+
+        def flush():
+            nonlocal next_shard, files, records, record_files
+            encode_start = time.perf_counter()
+            if records:
+                chunk_offsets, chunk_vectors, candidate_vectors = encode_batch(model, records, batch_size)
+            else:
+                chunk_offsets, chunk_vectors, candidate_vectors = np.zeros(1, np.int64), np.zeros((0, 1)), np.zeros((0, 1))
+            stats["encode_seconds"] += time.perf_counter() - encode_start
+            write_shard(os.path.join(shards_dir, f"{SHARD_PREFIX}{next_shard:06d}.npz"), files,
+                        [r["candidate"] for r in records], record_files, candidate_vectors)
+            next_shard += 1
+            stats["files"] += len(files)
+            stats["candidates"] += len(records)
+            stats["chunks"] += int(chunk_offsets[-1])
+            elapsed = time.perf_counter() - start
+            print(f"[{stats['files']}/{len(todo)} files] {stats['candidates']} candidates, {stats['chunks']} chunks | "
+                  f"{stats['candidates'] / elapsed:.1f} docs/s, {stats['chunks'] / elapsed:.0f} chunks/s")
+            files, records, record_files = [], [], []
+
+        # imap streams results in order while the workers parse ahead of the encoder
+        parse = functools.partial(parse_resume_file, root)
+        for result in pool.imap(parse, todo, chunksize=16):
+            if result["error"]:
+                stats["errors"] += 1
+                print(f"Skipping {result['path']}: {result['error']}", file=sys.stderr)
+            files.append({"path": result["path"], "fingerprint": result["fingerprint"], "error": result["error"]})
+            for record in result["records"]:
+                records.append(record)
+                record_files.append(len(files) - 1)
+            if len(records) >= batch_docs:
+                flush()
+        if files:
+            flush()
+        stats["seconds"] = time.perf_counter() - start
+    finally:
+        pool.terminate()
+    return stats
+
+
+# ======================================================
+# == MERGE INTO THE RETRIEVAL STORE ==
+# ======================================================
+def finalize(root: str, out_dir: str) -> dict:
+    """
+    Merges the shards into candidates.json and the candidate embedding store.
+    Only records from files that still exist with the ingested fingerprint are kept;
+    when several records share a candidate_id the most recently ingested one wins.
+    """
+    start = time.perf_counter()
+    shards = shard_paths(os.path.join(out_dir, "shards"))
+    current = {relpath: file_fingerprint(os.path.join(root, relpath)) for relpath in scan_resumes(root)}
+
+    # Pass 1: choose the records to keep (metadata only)
+    chosen = {}  # candidate_id -> (shard number, record index)
+    shard_meta = []
+    for number, path in enumerate(shards):
+        with np.load(path) as shard:
+            files = json.loads(str(shard["files"]))
+            records = json.loads(str(shard["records"]))
+            record_files = shard["record_files"]
+        shard_meta.append(records)
+        for i, record in enumerate(records):
+            entry = files[record_files[i]]
+            if current.get(entry["path"]) == entry["fingerprint"]:
+                chosen.pop(record["candidate_id"], None)  # re-insert so the latest version keeps the latest position
+                chosen[record["candidate_id"]] = (number, i)
+
+    by_shard = {}
+    for order, (number, i) in enumerate(chosen.values()):
+        by_shard.setdefault(number, []).append((order, i))
+
+    # Pass 2: copy vectors, one shard in memory at a time
+    candidates = [None] * len(chosen)
+    candidate_matrix = None
+    for number, rows in by_shard.items():
+        records = shard_meta[number]
+        with np.load(shards[number]) as shard:
+            candidate_vectors = shard["candidate_vectors"]
+        if candidate_matrix is None:
+            candidate_matrix = np.empty((len(chosen), candidate_vectors.shape[1]), dtype=np.float32)
+        for order, i in rows:
+            candidates[order] = records[i]
+            candidate_matrix[order] = candidate_vectors[i]
+
+    if candidate_matrix is None:
+        print("Nothing to merge: no ingested resumes are current.")
+        return {"candidates": 0}
+
+    # Candidate-level vectors go where the backend reads them; the hashes match build_candidate_text,
+    # so the backend's startup sync keeps these vectors instead of re-encoding the short profile text
+    store = EmbeddingStore(directory=os.path.join(out_dir, "embedding_store"), model_name=EMBEDDING_MODEL_NAME,
+                           dtype=EMBEDDING_STORE_DTYPE)
+    store.load()
+    store.replace([c["candidate_id"] for c in candidates], [build_candidate_text(c) for c in candidates],
+                  candidate_matrix, records=candidates)
+
+    candidates_path = os.path.join(out_dir, "candidates.json")
+    with open(candidates_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(candidates, f)
+    os.replace(candidates_path + ".tmp", candidates_path)
+    print(f"Merged {len(candidates)} candidates from {len(shards)} shards in {time.perf_counter() - start:.1f}s")
+    return {"candidates": len(candidates)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="directory of .txt/.md/.json resumes (searched recursively)")
+    parser.add_argument("--out", required=True, help="output directory (shards, candidates.json, embedding_store)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="parser processes")
+    parser.add_argument("--batch-docs", type=int, default=2000, help="resumes per encode batch / shard")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+                        help="chunks per forward pass")
+    parser.add_argument("--device", help="torch device for the encoder, e.g. cuda (default: auto)")
+    parser.add_argument("--retry-errors", action="store_true", help="re-parse files that failed in an earlier run")
+    parser.add_argument("--no-merge", action="store_true", help="only ingest new files into shards")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input):
+        sys.exit(f"{args.input} is not a directory")
+    stats = ingest(args.input, args.out, args.workers, args.batch_docs, args.batch_size, args.device, args.retry_errors)
+    if stats["files"]:
+        print(f"Ingested {stats['files']} files ({stats['candidates']} candidates, {stats['chunks']} chunks, "
+              f"{stats['errors']} errors) in {stats['seconds']:.1f}s: "
+              f"{stats['candidates'] / stats['seconds']:.1f} docs/s, encoding {stats['encode_seconds']:.1f}s")
+    if not args.no_merge:
+        finalize(args.input, args.out)
+        print("Serve it with:")
+        print(f"  export CANDIDATES_FILE={os.path.abspath(os.path.join(args.out, 'candidates.json'))}")
+        print(f"  export EMBEDDING_STORE_DIR={os.path.abspath(os.path.join(args.out, 'embedding_store'))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Resume parsing for the bulk ingestion CLI: reads one text/JSON resume file, extracts the
+candidate fields the backend serves (name, skills, experience, summary) and splits the
+resume body into chunks short enough for the sentence transformer.
+
+Everything here is plain Python (no torch), so it runs in the ingestion process pool.
+"""
+# --- Imports ---
+import json
+import os
+import re
+import time
+
+from core.candidates import build_candidate_text
+from core.intent_rules import COMMON_SKILLS
+
+# --- Configuration ---
+RESUME_EXTENSIONS = (".txt", ".md", ".json")
+# all-MiniLM-L6-v2 truncates input at 256 word pieces; ~160 words stays under that for English text
+CHUNK_WORDS = int(os.getenv("INGEST_CHUNK_WORDS", "160"))
+CHUNK_OVERLAP_WORDS = int(os.getenv("INGEST_CHUNK_OVERLAP_WORDS", "32"))
+SUMMARY_MAX_CHARS = 300
+
+# JSON keys accepted for each field (first one present wins)
+_ID_KEYS = ("candidate_id", "id")
+_NAME_KEYS = ("candidate_name", "name", "full_name")
+_TEXT_KEYS = ("text", "resume", "resume_text", "content", "body")
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#./]*")
+_YEARS_RE = re.compile(r"(\d{1,2})\s*\+?\s*(?:years?|yrs?)\b", re.IGNORECASE)
+_YEAR_RANGE_RE = re.compile(r"\b((?:19|20)\d{2})\s*(?:-|–|—|to)\s*((?:19|20)\d{2}|present|current|now)\b", re.IGNORECASE)
+_SUMMARY_HEADING_RE = re.compile(r"^\s*(?:summary|profile|about(?: me)?|objective)\s*:?\s*$", re.IGNORECASE)
+_CONTACT_RE = re.compile(r"@|https?://|\+?\d[\d\s().-]{7,}")
+_MAX_NGRAM = 3
+_MAX_EXPERIENCE_YEARS = 50
+
+
+def file_fingerprint(path: str) -> list:
+    """(size, mtime_ns) of a file; a resume is re-ingested when either changes."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# --- Field extraction ---
+def extract_skills(text: str, vocabulary=COMMON_SKILLS) -> list[str]:
+    """
+    Skills from `vocabulary` mentioned in the text, in order of first mention,
+    spelled as in the resume ("PostgreSQL", not "postgresql"). Longest match wins ("machine learning").
+    """
+    lowered = text.lower()
+    tokens = [t.rstrip(".") or t for t in _TOKEN_RE.findall(lowered)]
+    found, used = {}, set()
+    for size in range(_MAX_NGRAM, 0, -1):
+        for i in range(len(tokens) - size + 1):
+            gram = " ".join(tokens[i:i + size])
+            if gram in vocabulary and gram not in found and not (set(range(i, i + size)) & used):
+                found[gram] = i
+                used.update(range(i, i + size))
+    skills = []
+    for gram in sorted(found, key=found.get):
+        match = re.search(re.escape(gram), text, re.IGNORECASE)
+        skills.append(match.group(0) if match else gram)
+    return skills
+
+
+def extract_experience_years(text: str, current_year: int | None = None) -> int | None:
+    """
+    Years of experience: the largest "N years" statement, or else the span of the
+    employment date ranges ("2016 - present"). None when the resume states neither.
+    """
+    stated = [int(m.group(1)) for m in _YEARS_RE.finditer(text) if int(m.group(1)) <= _MAX_EXPERIENCE_YEARS]
+    if stated:
+        return max(stated)
+    current_year = current_year or time.localtime().tm_year
+    starts, ends = [], []
+    for m in _YEAR_RANGE_RE.finditer(text):
+        start = int(m.group(1))
+        end = current_year if not m.group(2)[0].isdigit() else int(m.group(2))
+        if start <= end <= current_year:
+            starts.append(start)
+            ends.append(end)
+    if not starts:
+        return None
+    return min(max(ends) - min(starts), _MAX_EXPERIENCE_YEARS)
+
+
+def _shorten(text: str, max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0].rstrip(" ,.;:") + "..."
+
+
+def extract_name_and_summary(text: str, fallback_name: str) -> tuple[str, str]:
+    """
+    Name: the first line when it looks like one (short, no digits, no contact details).
+    Summary: the paragraph under a Summary/Profile heading, or else the first prose paragraph.
+    """
+    lines = [line.strip() for line in text.splitlines()]
+    first = next((line for line in lines if line), "")
+    first = re.sub(r"^name\s*:\s*", "", first, flags=re.IGNORECASE)
+    looks_like_name = 0 < len(first.split()) <= 5 and not re.search(r"\d", first) and not _CONTACT_RE.search(first)
+    name = first if looks_like_name else fallback_name
+
+    paragraphs, current, after_heading = [], [], None
+    for line in lines:
+        if _SUMMARY_HEADING_RE.match(line):
+            if current:
+                paragraphs.append(" ".join(current))
+                current = []
+            after_heading = len(paragraphs)
+            continue
+        if line:
+            current.append(line)
+        elif current:
+            paragraphs.append(" ".join(current))
+            current = []
+    if current:
+        paragraphs.append(" ".join(current))
+
+    if after_heading is not None and after_heading < len(paragraphs):
+        return name, _shorten(paragraphs[after_heading])
+    for paragraph in paragraphs:
+        if paragraph != first and len(paragraph.split()) >= 8 and not _CONTACT_RE.search(paragraph):
+            return name, _shorten(paragraph)
+    return name, ""
+
+
+# --- Chunking ---
+def chunk_text(text: str, max_words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP_WORDS) -> list[str]:
+    """Overlapping word windows of at most `max_words` words covering the whole text."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, max_words - max(0, overlap))
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + max_words]))
+        if start + max_words >= len(words):
+            break
+    return chunks
+
+
+# --- Records ---
+def _first(data: dict, keys, default=None):
+    for key in keys:
+        if data.get(key) not in (None, ""):
+            return data[key]
+    return default
+
+
+def build_record(candidate_id: str, text: str, fields: dict | None = None, fallback_name: str = "") -> dict:
+    """
+    Candidate record in the backend's shape, plus "chunks": the texts to embed for it.
+    Fields given explicitly (JSON resumes) win over the ones extracted from the text.
+    The first chunk is the candidate profile text (build_candidate_text), so the aggregated
+    vector stays close to skill/name queries however long the resume is.
+    """
+    fields = fields or {}
+    name, summary = extract_name_and_summary(text, fallback_name)
+    candidate = {
+        "candidate_id": candidate_id,
+        "candidate_name": _first(fields, _NAME_KEYS, name),
+        "skills": fields.get("skills") or extract_skills(text),
+        "experience_years": fields.get("experience_years", extract_experience_years(text)),
+        "summary": fields.get("summary") or summary,
+    }
+    if candidate["experience_years"] is None:
+        del candidate["experience_years"]
+    return {"candidate": candidate, "chunks": [build_candidate_text(candidate)] + chunk_text(text)}
+
+
+def parse_resume_file(root: str, relpath: str) -> dict:
+    """
+    Parses one resume file into {"path", "fingerprint", "records", "error"}.
+    .txt/.md files hold one resume; .json files hold one resume object or a list of them
+    (candidate-shaped, with the full text under "text"/"resume"/"content" if available).
+    Candidate ids default to the path relative to the input directory (plus "#n" inside JSON lists).
+    Never raises: a bad file is reported through "error" so one resume can't stop the run.
+    """
+    path = os.path.join(root, relpath)
+    result = {"path": relpath, "fingerprint": None, "records": [], "error": None}
+    try:
+        result["fingerprint"] = file_fingerprint(path)
+        base_id = os.path.splitext(relpath)[0].replace(os.sep, "/")
+        fallback_name = os.path.splitext(os.path.basename(relpath))[0].replace("_", " ").replace("-", " ").title()
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            content = f.read()
+
+        if relpath.lower().endswith(".json"):
+            data = json.loads(content)
+            items = data if isinstance(data, list) else [data]
+            for n, item in enumerate(items):
+                if not isinstance(item, dict):
+                    continue
+                candidate_id = str(_first(item, _ID_KEYS, base_id if len(items) == 1 else f"{base_id}#{n}"))
+                text = _first(item, _TEXT_KEYS) or item.get("summary") or ""
+                result["records"].append(build_record(candidate_id, str(text), item, fallback_name))
+        elif content.strip():
+            result["records"].append(build_record(base_id, content, fallback_name=fallback_name))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
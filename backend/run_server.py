@@ -0,0 +1,74 @@
+"""
+Multi-worker launcher: one API worker per core without one model copy per worker.
+
+Starts the shared embedding service (core/embedding_service.py) as a child process, waits until
+it has synced the embedding store, then runs uvicorn with --workers N. The API workers map the
+candidate matrix read-only and send query encodes to the service, so they never load torch.
+All processes write their Prometheus metrics to PROMETHEUS_MULTIPROC_DIR (emptied at startup),
+so /metrics reports the totals of every worker whichever one answers the scrape.
+
+Usage (from the backend/ directory):
+    python run_server.py --workers 4 --host 0.0.0.0 --port 8000
+With --workers 1 (the default) it runs the single-process server unchanged.
+"""
+# --- Imports ---
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+
+import uvicorn
+
+
+def clear_metrics_dir(path: str):
+    """Removes the metrics files of earlier runs (they would be added to this run's counters)."""
+    os.makedirs(path, exist_ok=True)
+    for db_file in glob.glob(os.path.join(path, "*.db")):
+        os.unlink(db_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the HR chatbot API, optionally with a shared embedding service.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")),
+                        help="uvicorn worker processes (e.g. one per core)")
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SERVICE_SOCKET") or
+                        os.path.join(tempfile.gettempdir(), f"hr-embeddings-{os.getpid()}.sock"),
+                        help="Unix socket of the embedding service")
+    parser.add_argument("--metrics-dir", default=os.getenv("PROMETHEUS_MULTIPROC_DIR") or
+                        os.path.join(tempfile.gettempdir(), f"hr-metrics-{os.getpid()}"),
+                        help="directory for the workers' shared Prometheus metrics files")
+    parser.add_argument("--log-level", default="info", help="uvicorn log level")
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        os.environ.pop("EMBEDDING_SERVICE_SOCKET", None)
+        os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        uvicorn.run("app:app", host=args.host, port=args.port, log_level=args.log_level)
+        return
+
+    clear_metrics_dir(args.metrics_dir)
+    # Set before any process imports prometheus_client (the service and the workers inherit it)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = args.metrics_dir
+
+    service_env = {k: v for k, v in os.environ.items() if k != "EMBEDDING_SERVICE_SOCKET"}
+    service = subprocess.Popen([sys.executable, "-m", "core.embedding_service", "--socket", args.socket],
+                               env=service_env)
+    try:
+        # Workers inherit this and wait for the service themselves (it may still be encoding the store)
+        os.environ["EMBEDDING_SERVICE_SOCKET"] = args.socket
+        uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+    finally:
+        service.terminate()
+        try:
+            service.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            service.kill()
+        clear_metrics_dir(args.metrics_dir)
+
+
+if __name__ == "__main__":
+    main()
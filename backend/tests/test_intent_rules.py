@@ -0,0 +1,83 @@
+import pytest
+
+from core.intent_rules import fast_analyze_query, is_follow_up
+from core.llm_service import INTENT_FAST_PATH_MIN_CONFIDENCE
+
+
+def criteria_of(query):
+    analysis, confidence = fast_analyze_query(query)
+    return analysis["criteria"], confidence
+
+
+@pytest.mark.parametrize("query, skills, years_min", [
+    ("Who knows Python?", ["python"], None),
+    ("Python developers with 5+ years", ["python"], 5),
+    ("candidates with at least 3 years of experience in AWS", ["aws"], 3),
+    ("Java engineers with 5 or more years", ["java"], 5),
+    ("more than 4 years of Docker", ["docker"], 5),
+    ("Who knows Python and Docker?", ["python", "docker"], None),
+])
+def test_supported_shapes_skip_the_llm(query, skills, years_min):
+    criteria, confidence = criteria_of(query)
+    assert confidence >= INTENT_FAST_PATH_MIN_CONFIDENCE
+    assert sorted(criteria["skills"]) == sorted(skills)
+    assert criteria["experience_years_min"] == years_min
+
+
+@pytest.mark.parametrize("query", [
+    # Upper bounds
+    "less than 3 years of experience",
+    "Python developers under 2 years",
+    "up to 4 years of Java",
+    "at most 2 years of experience with AWS",
+    "no more than 5 years of Python",
+    # Ranges
+    "between 3 and 5 years of experience",
+    "Python with 3-5 years",
+    "Java with 2 to 4 years",
+    # Negation
+    "candidates who do not know Java",
+    "Python developers without AWS",
+    "who doesn't know Docker",
+    "Python but no Java",
+    # Disjunction
+    "Python or Java",
+    "either React or Angular",
+])
+def test_inverting_shapes_fall_back_to_the_llm(query):
+    _, confidence = criteria_of(query)
+    assert confidence < INTENT_FAST_PATH_MIN_CONFIDENCE
+
+
+def test_or_more_is_still_a_minimum():
+    criteria, confidence = criteria_of("SQL with 3 or more years")
+    assert confidence >= INTENT_FAST_PATH_MIN_CONFIDENCE
+    assert criteria["experience_years_min"] == 3
+
+
+@pytest.mark.parametrize("query", [
+    "and which of them know AWS?",
+    "Which of those have 5+ years?",
+    "among them, who knows Docker",
+    "only those with Kubernetes",
+    "Who from the above knows SQL?",
+    "Do the same candidates know React?",
+])
+def test_follow_up_questions(query):
+    assert is_follow_up(query)
+
+
+@pytest.mark.parametrize("query", [
+    "Which candidates know AWS, and how long have they worked?",
+    "Who knows Python and what are their years of experience?",
+    "Find people who list Docker on their resume",
+    "Do these skills matter: Python, SQL?",
+    "Who knows Java?",
+    "Candidates with 3+ years",
+    # Pivots to other candidates, not refinements of the previous answer
+    "What about Java?",
+    "How about someone with Kubernetes?",
+    "Just show me the Go developers",
+])
+def test_standalone_questions(query):
+    assert not is_follow_up(query)
@@ -0,0 +1,208 @@
+import asyncio
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+
+from benchmarks.stub_ollama import create_stub_app
+from core import llm_pool
+from core.llm_pool import LLMOverloaded, LLMPool
+
+PAYLOAD = {"model": "llama3.2:3b", "messages": [{"role": "user", "content": "hi"}], "stream": False}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubServer:
+    """One stub Ollama instance served by uvicorn on a background thread."""
+
+    def __init__(self, **profile):
+        self.app = create_stub_app(**profile)
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("stub server did not start")
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+@pytest.fixture(scope="module")
+def stubs():
+    # Answers take ~0.3s, long enough to observe requests in flight
+    servers = [StubServer(ttft=0.3, token_rate=0, tokens=1) for _ in range(3)]
+    for server in servers:
+        server.start()
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture(autouse=True)
+def healthy_stubs(stubs, monkeypatch):
+    for server in stubs:
+        server.app.state.fail_status = 0
+    monkeypatch.setattr(llm_pool, "LLM_RETRY_BASE_DELAY", 0.01)
+    yield
+
+
+def make_pool(urls, **options) -> LLMPool:
+    options.setdefault("health_check_interval", 0)
+    return LLMPool(urls, **options)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_routes_to_least_outstanding_endpoint(stubs):
+    pool = make_pool([s.url for s in stubs], max_concurrency=4)
+
+    async def scenario():
+        async with httpx.AsyncClient() as client:
+            requests = [asyncio.create_task(pool.post(client, "/api/chat", PAYLOAD)) for _ in range(6)]
+            await asyncio.sleep(0.1)
+            in_flight = [e.outstanding for e in pool.endpoints]
+            responses = await asyncio.gather(*requests)
+        return in_flight, responses
+
+    in_flight, responses = run(scenario())
+    assert in_flight == [2, 2, 2]
+    assert all(r.status_code == 200 for r in responses)
+    assert [e.requests for e in pool.endpoints] == [2, 2, 2]
+
+
+def test_full_queue_is_rejected_with_429(stubs):
+    pool = make_pool([stubs[0].url], max_concurrency=1, queue_size=1)
+
+    async def scenario():
+        async with httpx.AsyncClient() as client:
+            in_flight = asyncio.create_task(pool.post(client, "/api/chat", PAYLOAD))
+            await asyncio.sleep(0.05)
+            queued = asyncio.create_task(pool.post(client, "/api/chat", PAYLOAD))
+            await asyncio.sleep(0.05)
+            with pytest.raises(LLMOverloaded) as rejected:
+                await pool.post(client, "/api/chat", PAYLOAD)
+            await asyncio.gather(in_flight, queued)
+        return rejected.value
+
+    error = run(scenario())
+    assert error.status_code == 429
+    assert error.reason == "queue_full"
+    assert error.retry_after >= 1
+
+
+def test_queue_timeout_is_rejected_with_503(stubs):
+    pool = make_pool([stubs[0].url], max_concurrency=1, queue_timeout=0.1)
+
+    async def scenario():
+        async with httpx.AsyncClient() as client:
+            in_flight = asyncio.create_task(pool.post(client, "/api/chat", PAYLOAD))
+            await asyncio.sleep(0.05)
+            with pytest.raises(LLMOverloaded) as rejected:
+                await pool.post(client, "/api/chat", PAYLOAD)
+            await in_flight
+        return rejected.value
+
+    error = run(scenario())
+    assert error.status_code == 503
+    assert error.reason == "queue_timeout"
+    assert error.retry_after >= 1
+
+
+def test_no_healthy_endpoint_is_rejected_with_503(stubs):
+    pool = make_pool([s.url for s in stubs[:2]])
+    for server in stubs[:2]:
+        server.app.state.fail_status = 503
+
+    async def scenario():
+        async with httpx.AsyncClient() as client:
+            await pool.check_health(client)
+            with pytest.raises(LLMOverloaded) as rejected:
+                await pool.post(client, "/api/chat", PAYLOAD)
+        return rejected.value
+
+    error = run(scenario())
+    assert error.status_code == 503
+    assert error.reason == "unavailable"
+    assert error.retry_after >= 1
+
+
+@pytest.mark.parametrize("failure", ["http_503", "connect_error"])
+def test_retries_on_another_endpoint(stubs, monkeypatch, failure):
+    if failure == "http_503":
+        stubs[0].app.state.fail_status = 503
+        bad_url = stubs[0].url
+    else:
+        bad_url = f"http://127.0.0.1:{free_port()}"  # nothing listens there
+    pool = make_pool([bad_url, stubs[1].url], max_retries=2)
+    # Ties are broken at random; make the first pick the failing endpoint
+    monkeypatch.setattr(llm_pool.random, "choice", lambda options: options[0])
+
+    async def scenario():
+        async with httpx.AsyncClient() as client:
+            return await pool.post(client, "/api/chat", PAYLOAD)
+
+    response = run(scenario())
+    assert response.status_code == 200
+    bad, good = pool.endpoints
+    assert (bad.requests, bad.failures) == (1, 1)
+    assert (good.requests, good.failures) == (1, 0)
+
+
+def test_failing_endpoint_is_ejected_and_recovers(stubs, monkeypatch):
+    pool = make_pool([stubs[0].url, stubs[1].url], eject_after=2, eject_seconds=0.5)
+    stubs[0].app.state.fail_status = 503
+    monkeypatch.setattr(llm_pool.random, "choice", lambda options: options[0])
+
+    async def scenario():
+        async with httpx.AsyncClient() as client:
+            # Each request fails over from the broken endpoint to the healthy one
+            for _ in range(2):
+                assert (await pool.post(client, "/api/chat", PAYLOAD)).status_code == 200
+            bad = pool.endpoints[0]
+            ejected = not bad.available(time.monotonic())
+            requests_while_ejected = bad.requests
+            assert (await pool.post(client, "/api/chat", PAYLOAD)).status_code == 200
+            skipped = bad.requests == requests_while_ejected
+
+            stubs[0].app.state.fail_status = 0
+            await asyncio.sleep(0.6)
+            recovered = bad.available(time.monotonic())
+            assert (await pool.post(client, "/api/chat", PAYLOAD)).status_code == 200
+            return ejected, skipped, recovered, bad.consecutive_failures
+
+    ejected, skipped, recovered, failures_after = run(scenario())
+    assert ejected and skipped and recovered
+    assert failures_after == 0
+
+
+def test_health_check_marks_endpoints_down_and_up(stubs):
+    pool = make_pool([stubs[2].url])
+
+    async def scenario():
+        async with httpx.AsyncClient() as client:
+            stubs[2].app.state.fail_status = 503
+            await pool.check_health(client)
+            down = pool.endpoints[0].healthy
+            stubs[2].app.state.fail_status = 0
+            await pool.check_health(client)
+            return down, pool.endpoints[0].healthy
+
+    assert run(scenario()) == (False, True)
@@ -0,0 +1,104 @@
+import threading
+from multiprocessing.connection import Listener
+
+from core.candidate_table import CandidateTable
+from core.embedding_service import EmbeddingServiceClient
+from core.sessions import ChatSession, SessionStore, SharedSessionStore
+
+TABLE = CandidateTable([{"candidate_id": f"c{i}", "candidate_name": f"Name {i}"} for i in range(4)])
+
+
+class InProcessService:
+    """Dispatches SharedSessionStore calls to a SessionStore, like the embedding service does."""
+
+    def __init__(self):
+        self.sessions = SessionStore()
+        self.handlers = {"session_get": self.sessions.get_or_create_state,
+                         "session_save": self.sessions.save_state,
+                         "session_stats": self.sessions.stats}
+
+    def call(self, op, *args, timeout=None):
+        return self.handlers[op](*args)
+
+
+def test_new_session_gets_a_server_generated_id():
+    store = SessionStore()
+    session = store.get_or_create(None)
+    assert session.session_id
+    assert store.get_or_create(session.session_id) is session
+
+
+def test_unknown_session_id_is_not_adopted():
+    store = SessionStore()
+    session = store.get_or_create("chosen-by-the-client")
+    assert session.session_id != "chosen-by-the-client"
+    assert session.previous_candidates() is None
+
+
+def test_expired_session_starts_over():
+    store = SessionStore(ttl_seconds=0)
+    session = store.get_or_create(None)
+    assert store.get_or_create(session.session_id).session_id != session.session_id
+
+
+def test_session_keeps_candidates_and_turns():
+    store = SessionStore()
+    session = store.get_or_create(None)
+    session.remember_candidates({"skills": ["python"]}, [TABLE.view(3), TABLE.view(1)], store_version=7)
+    session.add_turn("Who knows Python?", "Name 1 and Name 3.")
+    store.save(session)
+
+    again = store.get_or_create(session.session_id)
+    assert again.previous_candidates() == (["c3", "c1"], [1, 3], 7)
+    assert again.criteria == {"skills": ["python"]}
+    assert again.history() == [("Who knows Python?", "Name 1 and Name 3.")]
+
+
+def test_shared_store_round_trips_through_the_service():
+    service = InProcessService()
+    worker_a, worker_b = SharedSessionStore(service), SharedSessionStore(service)
+
+    session = worker_a.get_or_create(None)
+    session.remember_candidates({}, [TABLE.view(2)], store_version=1)
+    session.add_turn("q", "a")
+    worker_a.save(session)
+
+    # The next message reaches another worker
+    other = worker_b.get_or_create(session.session_id)
+    assert other.session_id == session.session_id
+    assert other.previous_candidates() == (["c2"], [2], 1)
+    assert other.history() == [("q", "a")]
+    assert worker_b.get_or_create("unknown").session_id != "unknown"
+    assert worker_b.stats()["size"] == 2
+
+
+def test_state_round_trip():
+    session = ChatSession("s1")
+    session.add_turn("q", "a")
+    copy = ChatSession.from_state("s1", session.state())
+    assert copy.history() == session.history()
+
+
+def test_unresponsive_service_falls_back_to_a_new_session(tmp_path):
+    address = str(tmp_path / "service.sock")
+    listener = Listener(address, family="AF_UNIX", authkey=b"test")
+    accepted = []
+
+    def accept_but_never_answer():
+        while True:
+            try:
+                accepted.append(listener.accept())
+            except OSError:
+                return
+
+    threading.Thread(target=accept_but_never_answer, daemon=True).start()
+    store = SharedSessionStore(EmbeddingServiceClient(address, authkey=b"test"), timeout=0.2)
+    try:
+        session = store.get_or_create("known-to-the-service")
+        assert session.session_id != "known-to-the-service"
+        assert session.previous_candidates() is None
+        store.save(session)  # logged, not raised
+    finally:
+        for conn in accepted:
+            conn.close()
+        listener.close()
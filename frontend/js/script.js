@@ -7,6 +7,10 @@ const sendButton = document.getElementById('sendButton');
 // --- Configuration ---
 // URL of your backend API endpoint
 const API_URL = 'http://192.168.99.152:8000/api/chat'; // Make sure this matches where your backend is running
+// Ask the backend to stream tokens as they are generated (set to false for a single JSON reply)
+const USE_STREAMING = true;
+// Conversation id returned by the backend; sent with each message so follow-ups ("which of them...") work
+let sessionId = null;
 
 // --- Helper Functions ---
 
@@ -86,6 +90,54 @@ function displayMessage(messageText, sender, isThinking = false, isError = false
     setTimeout(() => {
         messageWrapper.classList.remove('message-enter');
     }, 300);
+
+    return messageWrapper;
+}
+
+// Function to replace the text of an existing bot message (used while streaming)
+function updateMessageText(messageWrapper, messageText) {
+    const messageContent = messageWrapper.querySelector('.message-content');
+    messageContent.innerHTML = renderSimpleMarkdown(messageText);
+    chatbox.scrollTo({ top: chatbox.scrollHeight });
+}
+
+// Function to read an NDJSON stream ({"token": "..."} lines, then {"done": true})
+// and render the reply incrementally as tokens arrive
+async function renderStreamedReply(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let botText = '';
+    let messageWrapper = null;
+
+    const handleLine = (line) => {
+        if (!line.trim()) return;
+        const event = JSON.parse(line);
+        if (event.session_id) sessionId = event.session_id;
+        if (event.token === undefined) return;
+        botText += event.token;
+        if (!messageWrapper) {
+            removeThinkingIndicator(); // First token: swap the thinking dots for the reply bubble
+            messageWrapper = displayMessage(botText, 'bot');
+        } else {
+            updateMessageText(messageWrapper, botText);
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop(); // Keep any partial line for the next chunk
+        lines.forEach(handleLine);
+    }
+    handleLine(buffer + decoder.decode());
+
+    if (!messageWrapper) {
+        removeThinkingIndicator();
+        displayMessage("Sorry, I received an empty response from the server.", 'bot', false, true);
+    }
 }
 
 // Function to remove the "Thinking..." indicator
@@ -115,16 +167,15 @@ async function getBotResponse(userMessage) {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
-                'Accept': 'application/json' // Indicate we expect JSON back
+                'Accept': 'application/x-ndjson, application/json' // Streamed reply, JSON for errors
             },
-            body: JSON.stringify({ message: userMessage }) // Send message in correct format
+            body: JSON.stringify({ message: userMessage, stream: USE_STREAMING, session_id: sessionId }) // Send message in correct format
         });
         // --- End API call ---
 
-        removeThinkingIndicator(); // Remove thinking indicator once response headers are received
-
         // Check if the request was successful (status code 2xx)
         if (!response.ok) {
+            removeThinkingIndicator();
             // Try to get error details from the response body if possible
             let errorDetails = `HTTP error! Status: ${response.status}`;
             try {
@@ -137,8 +188,18 @@ async function getBotResponse(userMessage) {
             throw new Error(errorDetails); // Throw an error to be caught below
         }
 
+        // Streaming replies keep the thinking indicator until the first token arrives
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.includes('application/x-ndjson')) {
+            await renderStreamedReply(response);
+            return;
+        }
+
+        removeThinkingIndicator(); // Remove thinking indicator once the full reply is received
+
         // Parse the JSON response from the backend
         const data = await response.json();
+        if (data.session_id) sessionId = data.session_id;
 
         // Extract the reply text (assuming backend sends {"reply": "..."})
         const botText = data.reply;